@@ -0,0 +1,3 @@
+"""
+Benchmarks for the scraper, run them from the repository root with `python -m benchmarks.<name>`.
+"""
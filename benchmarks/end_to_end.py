@@ -0,0 +1,115 @@
+"""
+End-to-end throughput of the scraper against the local fake Yummly server.
+
+    python -m benchmarks.end_to_end --pages 500 --latency 0.05 --backends sequential threads asyncio processes
+
+Each execution backend (see yummly_scraper/backends.py) crawls the same sitemap in a fresh output directory
+in its own process, with clearance from the fake server instead of a browser. Reports pages/s, recipes/s,
+CPU time and peak RSS of the scraper process, to pick the fastest backend for the hardware;
+--results appends them as JSON lines, so runs can be compared over time.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_yummly import FakeYummly, fake_clearance, write_sitemaps
+from yummly_scraper.backends import BACKENDS, crawl
+
+
+def run_child(backend: str, output_dir: str, options: dict):
+    """Entry point of the scraper process"""
+    crawl(output_dir, backend=backend, clearance=fake_clearance,
+          metrics_file=os.path.join(output_dir, 'metrics.jsonl'), **options)
+
+
+def run(backend: str, base_url: str, recipes: int, pages: int, options: dict) -> dict:
+    with tempfile.TemporaryDirectory() as output_dir:
+        write_sitemaps(os.path.join(output_dir, 'sitemaps'), base_url, recipes, pages)
+        command = [sys.executable, '-m', 'benchmarks.end_to_end', '--child', backend, output_dir,
+                   json.dumps(options)]
+        with open(os.path.join(output_dir, 'scraper.log'), 'w') as log:
+            start = time.perf_counter()
+            process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+            # wait4 reports the resource usage of exactly this child
+            _, status, usage = os.wait4(process.pid, 0)
+            wall = time.perf_counter() - start
+            process.returncode = os.waitstatus_to_exitcode(status)
+        if process.returncode != 0:
+            with open(os.path.join(output_dir, 'scraper.log')) as log:
+                print(log.read()[-2000:])
+            raise RuntimeError(f"{backend} backend exited with {process.returncode}")
+        with open(os.path.join(output_dir, 'metrics.jsonl')) as f:
+            metrics = json.loads(f.readlines()[-1])
+
+    scraped = metrics.get('pages_total{outcome="scraped"}', 0)
+    failed = metrics.get('pages_total{outcome="failed"}', 0)
+    recipes_saved = metrics.get('recipes_total{outcome="new"}', 0)
+    cpu = usage.ru_utime + usage.ru_stime
+    return {
+        'backend': backend,
+        'options': options,
+        'pages': scraped,
+        'failed': failed,
+        'recipes': recipes_saved,
+        'seconds': wall,
+        'pages_per_second': scraped / wall,
+        'recipes_per_second': recipes_saved / wall,
+        'cpu_seconds': cpu,
+        'cpu_percent': 100 * cpu / wall,
+        # ru_maxrss is in KB on Linux
+        'peak_rss_mb': usage.ru_maxrss / 1024,
+    }
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        run_child(sys.argv[2], sys.argv[3], json.loads(sys.argv[4]))
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('--pages', type=int, default=500, help='sitemap entries to crawl')
+    parser.add_argument('--recipes', type=int, default=10000, help='size of the fake catalog')
+    parser.add_argument('--related', type=int, default=20, help='related recipes per page')
+    parser.add_argument('--latency', type=float, default=0.05, help='mean response time of the fake server')
+    parser.add_argument('--not-found', type=float, default=0.0)
+    parser.add_argument('--too-many', type=float, default=0.0)
+    parser.add_argument('--unavailable', type=float, default=0.0)
+    parser.add_argument('--challenge', type=float, default=0.0)
+    parser.add_argument('--concurrency', type=int, help='threads or async fetch workers (default: per backend)')
+    parser.add_argument('--parse-workers', type=int, help="processes backend parse processes (default: one per core)")
+    parser.add_argument('--archive', action='store_true', help='keep the raw pages, to measure what that costs')
+    parser.add_argument('--projection', default='full', help='parts of the recipes to store')
+    parser.add_argument('--retry-wait', type=float, default=0.0,
+                        help='seconds to wait at the end for retries of transient errors that are due')
+    parser.add_argument('--results', help='append the results to this file as JSON lines')
+    args = parser.parse_args()
+
+    fake = FakeYummly(recipes=args.recipes, related=args.related, latency=args.latency, not_found=args.not_found,
+                      too_many=args.too_many, unavailable=args.unavailable, challenge=args.challenge).start()
+    options = {'concurrency': args.concurrency, 'parse_workers': args.parse_workers, 'archive': args.archive,
+               'projection': args.projection, 'retry_wait': args.retry_wait}
+    print(f"{args.pages} pages of {args.recipes} recipes, {args.latency * 1000:.0f} ms latency")
+    print(f"{'backend':10} {'pages':>6} {'failed':>6} {'recipes':>8} {'seconds':>8} {'pages/s':>8} "
+          f"{'recipes/s':>10} {'CPU %':>6} {'peak RSS':>9}")
+    try:
+        for backend in args.backends:
+            result = run(backend, fake.base_url, args.recipes, args.pages, options)
+            print(f"{backend:10} {result['pages']:6.0f} {result['failed']:6.0f} {result['recipes']:8.0f} "
+                  f"{result['seconds']:8.1f} {result['pages_per_second']:8.1f} {result['recipes_per_second']:10.1f} "
+                  f"{result['cpu_percent']:6.0f} {result['peak_rss_mb']:7.0f}MB")
+            if args.results:
+                result.update(time=time.time(), latency=args.latency, total_pages=args.pages, catalog=args.recipes)
+                with open(args.results, 'a') as f:
+                    f.write(json.dumps(result) + '\n')
+    finally:
+        fake.close()
+    print(f"Fake server: {fake.requests} requests, {fake.statuses}")
+
+
+if __name__ == '__main__':
+    main()
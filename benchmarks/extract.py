@@ -0,0 +1,111 @@
+"""
+Micro-benchmark of the fast __INITIAL_STATE__ extractor against the BeautifulSoup path,
+and of the streaming decode of the parts the recipes come from against decoding the whole state.
+Reports time per page and the peak memory allocated while extracting a page.
+
+Save a few recipe pages (e.g. `curl https://www.yummly.com/recipe/... > pages/1.html`) and run
+    python -m benchmarks.extract pages/
+"""
+import argparse
+import json
+import os
+import time
+import tracemalloc
+import urllib.parse
+from functools import partial
+
+from yummly_scraper.initial_state import STATE_KEYS, parse_initial_state, parse_initial_state_soup
+
+
+def synthetic_page(related: int = 20) -> bytes:
+    """
+    Build a page shaped like a Yummly recipe page, for when no saved pages are at hand
+    """
+    def recipe(i):
+        return {
+            'id': f'Synthetic-Recipe-{i}',
+            'share': {'url': f'https://www.yummly.com/recipe/Synthetic-Recipe-{i}'},
+            'content': {'ingredientLines': [{'wholeLine': f'{n} cups of flour'} for n in range(15)],
+                        'preparationSteps': [f'Step {n} ' * 20 for n in range(10)]},
+        }
+    main = recipe(0)
+    main['relatedRecipes'] = [{'id': f'Synthetic-Recipe-{i}', 'recipeInfo': {'recipe': recipe(i)}}
+                              for i in range(1, related + 1)]
+    main['relatedRecipesLoaded'] = True
+    main['relatedRecipesLoading'] = False
+    # The rest of the application state, which the scraper does not use
+    app = {'navigation': [{'title': f'Category {i}', 'url': f'/recipes/category-{i}'} for i in range(300)],
+           'ads': [{'slot': i, 'targeting': {'keywords': ['dinner', 'easy'] * 10}} for i in range(100)]}
+    state = urllib.parse.quote(json.dumps({'app': app, 'recipe': main, 'yums': {'count': 10}}))
+    filler = ''.join(f'<div class="c{i}"><span>{i}</span></div>' for i in range(2000))
+    return (f'<!DOCTYPE html><html><head><title>Synthetic Recipe | Yummly</title>'
+            f'<script src="/app.js"></script></head><body>{filler}'
+            f'<script>window.__INITIAL_STATE__ = "{state}";</script></body></html>').encode()
+
+
+def load_pages(directory: str | None) -> list[tuple[str, bytes]]:
+    if not directory:
+        return [('synthetic', synthetic_page())]
+    pages = []
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), 'rb') as f:
+            pages.append((name, f.read()))
+    return pages
+
+
+def bench(extractor, pages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for _, content in pages:
+            extractor(content)
+    return (time.perf_counter() - start) / (repeat * len(pages))
+
+
+def peak_memory(extractor, pages) -> float:
+    """Largest peak of memory allocated while extracting one of the pages, in bytes"""
+    peak = 0
+    tracemalloc.start()
+    try:
+        for _, content in pages:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            state = extractor(content)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+            del state
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pages', nargs='?', help='directory with saved recipe pages')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages)
+    whole_state = partial(parse_initial_state, keys=None)
+    for name, content in pages:
+        state = parse_initial_state_soup(content)
+        if whole_state(content) != state:
+            print(f"Extractors disagree on {name}")
+        if state is not None and parse_initial_state(content) != {k: state[k] for k in STATE_KEYS if k in state}:
+            print(f"Streaming decode disagrees on {name}")
+
+    extractors = [
+        ('BeautifulSoup', parse_initial_state_soup),
+        ('Fast scan', whole_state),
+        ('Streaming', parse_initial_state),
+    ]
+    size = sum(len(content) for _, content in pages) / len(pages)
+    print(f"{len(pages)} pages, {size / 1024:.0f} KB on average")
+    baseline = None
+    for name, extractor in extractors:
+        seconds = bench(extractor, pages, args.repeat)
+        baseline = baseline or seconds
+        print(f"{name + ':':14} {seconds * 1000:8.2f} ms/page  ({baseline / seconds:4.1f}x)  "
+              f"peak {peak_memory(extractor, pages) / 1024:7.0f} KB")
+
+
+if __name__ == '__main__':
+    main()
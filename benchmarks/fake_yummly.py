@@ -0,0 +1,330 @@
+"""
+Local stand-in for yummly.com that serves synthetic recipe pages, for benchmarks that must not hit the real site.
+
+    python -m benchmarks.fake_yummly --port 8765 --recipes 10000 --sitemap-dir /tmp/yummly/sitemaps
+
+Recipes live at /recipe/Synthetic-Recipe-<n>. Every page embeds a window.__INITIAL_STATE__ like Yummly's,
+with the recipe and its related recipes in relatedRecipes, moreFromSource and spotlightCarousels.
+Related recipes are picked deterministically from the recipe's neighbourhood in the catalog, so they overlap
+between pages the way they do on the real site. The sitemap is served at /sitemap.xml and can be written to disk.
+Knobs simulate the origin: latency, 404/429/503 rates and cloudflare challenge pages, which are served to
+requests without the cf_clearance cookie that fake_clearance() hands out, and at random with --challenge.
+Recipe pages carry an ETag and Last-Modified and answer conditional requests with 304 Not Modified.
+Raising `revision` changes the catalog for refresh benchmarks: with every revision a fraction `updated` of the
+recipes gets new yums and a fraction `edited` new content, which shows on their own pages.
+"""
+import argparse
+import functools
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+RECIPE_PREFIX = 'Synthetic-Recipe-'
+SITEMAP_SIZE = 50000
+CLEARANCE_COOKIE = 'cf_clearance'
+CLEARANCE_VALUE = 'fake-clearance'
+
+# Last-Modified of revision 0, every revision is a day later
+EPOCH = 1_700_000_000
+
+CHALLENGE_PAGE = (b'<!DOCTYPE html><html><head><title>Just a moment...</title></head>'
+                  b'<body>Checking your browser before accessing yummly.com.</body></html>')
+
+
+def fake_clearance(url: str) -> List[Dict[str, Any]]:
+    """Clearance provider for the scrapers that passes the fake server's challenges without a browser"""
+    return [{'name': CLEARANCE_COOKIE, 'value': CLEARANCE_VALUE}]
+
+
+def recipe_id(n: int) -> str:
+    return f'{RECIPE_PREFIX}{n}'
+
+
+def recipe(n: int, edits: int = 0) -> Dict[str, Any]:
+    """A recipe roughly the size and shape of Yummly's recipe objects, as it looks after `edits` edits"""
+    rng = random.Random(n)
+    name = f'Synthetic Recipe {n}'
+    data = {
+        'id': recipe_id(n),
+        'type': 'recipe',
+        'display': {'displayName': name, 'source': {'sourceDisplayName': f'Source {n % 97}'},
+                    'images': [f'https://lh3.googleusercontent.com/synthetic-{n}-{i}=s{360 * (i + 1)}'
+                               for i in range(3)]},
+        'share': {'url': f'https://www.yummly.com/recipe/{recipe_id(n)}'},
+        'content': {
+            'details': {'totalTime': f'{rng.randint(10, 120)} min', 'numberOfServings': rng.randint(1, 8),
+                        'rating': round(rng.uniform(3, 5), 1), 'keywords': [f'keyword-{rng.randint(0, 500)}'
+                                                                            for _ in range(8)]},
+            'ingredientLines': [{'wholeLine': f'{rng.randint(1, 4)} cups ingredient {rng.randint(0, 2000)}',
+                                 'ingredient': f'ingredient {i}', 'quantity': rng.randint(1, 4), 'unit': 'cup',
+                                 'category': 'Baking'} for i in range(rng.randint(5, 20))],
+            'preparationSteps': [f'Step {i}: ' + 'stir the mixture well and let it rest. ' * rng.randint(1, 5)
+                                 for i in range(rng.randint(3, 12))],
+            'nutrition': {'nutritionEstimates': [{'attribute': f'NUTRIENT_{i}', 'value': rng.random() * 100,
+                                                  'unit': {'name': 'gram', 'abbreviation': 'g'}}
+                                                 for i in range(20)]},
+            'tags': {'cuisine': [{'display-name': 'American'}], 'course': [{'display-name': 'Main Dishes'}]},
+        },
+    }
+    if edits:
+        data['content']['preparationSteps'].append(f'Step added by edit {edits}.')
+    return data
+
+
+def related(n: int, count: int, catalog: int, spread: int = 500) -> List[int]:
+    """Recipes shown next to recipe n, drawn from its neighbourhood in the catalog"""
+    rng = random.Random(-n - 1)
+    picks = set()
+    while len(picks) < min(count, catalog - 1):
+        m = (n + rng.randint(-spread, spread)) % catalog
+        if m != n:
+            picks.add(m)
+    return sorted(picks)
+
+
+def card(m: int) -> Dict[str, Any]:
+    """A related recipe as it appears in the lists of another recipe's page"""
+    return {'id': recipe_id(m), 'recipeInfo': {'recipe': recipe(m), 'yums': {'count': m % 1000}}}
+
+
+def split_related(picks: List[int]) -> tuple[List[int], List[int], List[int]]:
+    # Yummly spreads related recipes over three lists, roughly in these proportions
+    a, b = len(picks) * 3 // 5, len(picks) * 4 // 5
+    return picks[:a], picks[a:b], picks[b:]
+
+
+def initial_state(n: int, catalog: int, related_count: int, edits: int = 0, yums: int | None = None
+                  ) -> Dict[str, Any]:
+    """The window.__INITIAL_STATE__ of the page of recipe n"""
+    related_recipes, more_from_source, spotlight = split_related(related(n, related_count, catalog))
+    main = recipe(n, edits)
+    main['relatedRecipes'] = [card(m) for m in related_recipes]
+    main['relatedRecipesLoaded'] = True
+    main['relatedRecipesLoading'] = False
+    main['moreFromSource'] = [card(m) for m in more_from_source]
+    main['moreFromSourceLoaded'] = True
+    main['moreFromSourceLoading'] = False
+    main['spotlightCarousels'] = [{'title': 'Spotlight', 'cards': {'newList': [card(m) for m in spotlight]}}]
+    main['spotlightCarouselsLoaded'] = True
+    main['spotlightCarouselsLoading'] = False
+    return {'recipe': main, 'yums': {'count': n % 1000 if yums is None else yums},
+            'app': {'locale': 'en-US', 'experiments': {}}}
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _quoted(m: int, as_card: bool, edits: int = 0) -> str:
+    return urllib.parse.quote(json.dumps(card(m) if as_card else recipe(m, edits))[:None if as_card else -1])
+
+
+def state_payload(n: int, catalog: int, related_count: int, edits: int = 0, yums: int | None = None) -> str:
+    """
+    json.dumps(initial_state(...)), URL encoded the way Yummly embeds it.
+    URL encoding works per character, so the payload can be joined from cached per-recipe fragments,
+    which keeps the server from becoming the bottleneck of the benchmark.
+    """
+    related_recipes, more_from_source, spotlight = split_related(related(n, related_count, catalog))
+    quote = urllib.parse.quote
+    yums = n % 1000 if yums is None else yums
+
+    def cards(ms):
+        return quote(', ').join(_quoted(m, True) for m in ms)
+
+    return ''.join([
+        quote('{"recipe": '), _quoted(n, False, edits),
+        quote(', "relatedRecipes": ['), cards(related_recipes),
+        quote('], "relatedRecipesLoaded": true, "relatedRecipesLoading": false, "moreFromSource": ['),
+        cards(more_from_source),
+        quote('], "moreFromSourceLoaded": true, "moreFromSourceLoading": false, '
+              '"spotlightCarousels": [{"title": "Spotlight", "cards": {"newList": ['), cards(spotlight),
+        quote(']}}], "spotlightCarouselsLoaded": true, "spotlightCarouselsLoading": false}, '
+              f'"yums": {{"count": {yums}}}, "app": {{"locale": "en-US", "experiments": {{}}}}}}'),
+    ])
+
+
+FILLER = ''.join(f'<div class="card c{i}"><span>{i}</span></div>' for i in range(1500))
+
+
+def recipe_page(n: int, catalog: int, related_count: int, edits: int = 0, yums: int | None = None) -> bytes:
+    return (f'<!DOCTYPE html><html><head><title>Synthetic Recipe {n} | Yummly</title>'
+            f'<script src="/app.js"></script></head><body>{FILLER}'
+            f'<script>window.__INITIAL_STATE__ = "{state_payload(n, catalog, related_count, edits, yums)}";</script>'
+            f'<script>window.__APP_CONFIG__ = {{"env": "fake"}};</script></body></html>').encode()
+
+
+def sitemap_xml(base_url: str, first: int, last: int) -> bytes:
+    locs = ''.join(f'<url><loc>{base_url}/recipe/{recipe_id(n)}</loc></url>' for n in range(first, last))
+    return (f'<?xml version="1.0" encoding="UTF-8"?>'
+            f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{locs}</urlset>').encode()
+
+
+def write_sitemaps(directory: str, base_url: str, recipes: int, pages: int | None = None):
+    """Write sitemaps listing the first `pages` recipes (all by default), split like Yummly's"""
+    os.makedirs(directory, exist_ok=True)
+    pages = recipes if pages is None else min(pages, recipes)
+    for i, first in enumerate(range(0, pages, SITEMAP_SIZE)):
+        with open(os.path.join(directory, f'sitemap-{i}.xml'), 'wb') as f:
+            f.write(sitemap_xml(base_url, first, min(first + SITEMAP_SIZE, pages)))
+
+
+class FakeYummly:
+    """
+    The fake origin, served from a background thread. Rates are the probability per request,
+    updated and edited the fraction of recipes that change with every revision.
+    """
+
+    def __init__(self, port: int = 0, recipes: int = 10000, related: int = 20, latency: float = 0.05,
+                 jitter: float = 0.5, not_found: float = 0.0, too_many: float = 0.0, unavailable: float = 0.0,
+                 challenge: float = 0.0, retry_after: int = 1, revision: int = 0, updated: float = 0.2,
+                 edited: float = 0.02, host: str = '127.0.0.1'):
+        self.recipes = recipes
+        self.related = related
+        self.latency = latency
+        self.jitter = jitter
+        self.not_found = not_found
+        self.too_many = too_many
+        self.unavailable = unavailable
+        self.challenge = challenge
+        self.retry_after = retry_after
+        self.revision = revision
+        self.updated = updated
+        self.edited = edited
+        self.requests = 0
+        self.statuses: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'FakeYummly':
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _count(self, outcome: str):
+        with self.lock:
+            self.requests += 1
+            self.statuses[outcome] = self.statuses.get(outcome, 0) + 1
+
+    def version(self, n: int) -> tuple[int, int, int]:
+        """The edits and yums updates of recipe n up to the current revision, and the revision of the last change"""
+        edits = updates = changed = 0
+        for revision in range(1, self.revision + 1):
+            roll = random.Random(f'{n}/{revision}').random()
+            if roll < self.edited:
+                edits += 1
+            elif roll < self.edited + self.updated:
+                updates += 1
+            else:
+                continue
+            changed = revision
+        return edits, updates, changed
+
+    def respond(self, path: str, cookies: str, if_none_match: str | None = None,
+                if_modified_since: str | None = None) -> tuple[int, Dict[str, str], bytes]:
+        if path == '/sitemap.xml':
+            return 200, {'Content-Type': 'application/xml'}, sitemap_xml(self.base_url, 0, min(self.recipes,
+                                                                                                SITEMAP_SIZE))
+        if not path.startswith('/recipe/' + RECIPE_PREFIX):
+            return 404, {}, b'Not found'
+        try:
+            n = int(path.rsplit('-', 1)[1])
+        except ValueError:
+            return 404, {}, b'Not found'
+        if not 0 <= n < self.recipes:
+            return 404, {}, b'Not found'
+
+        if self.latency:
+            time.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+        roll = random.random()
+        if roll < self.not_found:
+            return 404, {}, b'Not found'
+        roll -= self.not_found
+        if roll < self.too_many:
+            return 429, {'Retry-After': str(self.retry_after)}, b'Too many requests'
+        roll -= self.too_many
+        if roll < self.unavailable:
+            return 503, {'Retry-After': str(self.retry_after)}, b'Service unavailable'
+        roll -= self.unavailable
+        if roll < self.challenge or f'{CLEARANCE_COOKIE}={CLEARANCE_VALUE}' not in cookies:
+            return 200, {'Content-Type': 'text/html'}, CHALLENGE_PAGE
+        edits, updates, changed = self.version(n)
+        validators = {'ETag': f'"{n}-{edits}-{updates}"',
+                      'Last-Modified': formatdate(EPOCH + changed * 86400, usegmt=True)}
+        if if_none_match is not None:
+            not_modified = if_none_match == validators['ETag']
+        else:
+            not_modified = if_modified_since == validators['Last-Modified']
+        if not_modified:
+            return 304, validators, b''
+        return 200, {'Content-Type': 'text/html; charset=utf-8', **validators}, recipe_page(
+            n, self.recipes, self.related, edits, n % 1000 + updates)
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                status, headers, body = fake.respond(urllib.parse.urlsplit(self.path).path,
+                                                     self.headers.get('Cookie') or '',
+                                                     self.headers.get('If-None-Match'),
+                                                     self.headers.get('If-Modified-Since'))
+                fake._count('challenge' if body is CHALLENGE_PAGE else str(status))
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--recipes', type=int, default=10000, help='size of the catalog')
+    parser.add_argument('--related', type=int, default=20, help='related recipes per page')
+    parser.add_argument('--latency', type=float, default=0.05, help='mean response time in seconds')
+    parser.add_argument('--not-found', type=float, default=0.0, help='rate of 404 responses')
+    parser.add_argument('--too-many', type=float, default=0.0, help='rate of 429 responses')
+    parser.add_argument('--unavailable', type=float, default=0.0, help='rate of 503 responses')
+    parser.add_argument('--challenge', type=float, default=0.0, help='rate of challenge pages')
+    parser.add_argument('--revision', type=int, default=0, help='how often the catalog changed')
+    parser.add_argument('--updated', type=float, default=0.2, help='fraction of recipes with new yums per revision')
+    parser.add_argument('--edited', type=float, default=0.02, help='fraction of recipes edited per revision')
+    parser.add_argument('--sitemap-dir', help='write the sitemaps here')
+    args = parser.parse_args()
+
+    fake = FakeYummly(args.port, args.recipes, args.related, args.latency, not_found=args.not_found,
+                      too_many=args.too_many, unavailable=args.unavailable, challenge=args.challenge,
+                      revision=args.revision, updated=args.updated, edited=args.edited)
+    if args.sitemap_dir:
+        write_sitemaps(args.sitemap_dir, fake.base_url, args.recipes)
+    print(f"Serving {args.recipes} recipes on {fake.base_url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"{fake.requests} requests: {fake.statuses}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+What a refresh pass costs compared to the full crawl, against the local fake Yummly server.
+
+    python -m benchmarks.refresh --pages 1000 --updated 0.2 --edited 0.02
+
+Crawls the sitemap and refreshes the same output directory three times: first without changes, which fetches
+every page the crawl skipped as covered by related recipes and collects their validators, then after the fake
+catalog moved on by one revision (a fraction of the recipes gets new yums and a smaller one new content),
+and once more without changes.
+Reports for every pass the requests, 304 responses, bytes downloaded, recipes written and bytes added to the store.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.fake_yummly import FakeYummly, fake_clearance, write_sitemaps
+from yummly_scraper.backends import BACKENDS, crawl
+from yummly_scraper.changes import iter_deltas
+
+
+def directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def run_pass(fake: FakeYummly, output_dir: str, backend: str, refresh: bool) -> dict:
+    metrics_file = os.path.join(output_dir, 'metrics.jsonl')
+    if os.path.exists(metrics_file):
+        os.remove(metrics_file)
+    store = os.path.join(output_dir, 'segments')
+    size = directory_size(store) if os.path.exists(store) else 0
+    fake.statuses = {}
+    start = time.perf_counter()
+    crawl(output_dir, backend=backend, clearance=fake_clearance, retry_wait=0, refresh=refresh,
+          metrics_file=metrics_file)
+    seconds = time.perf_counter() - start
+    with open(metrics_file) as f:
+        metrics = json.loads(f.readlines()[-1])
+    changes = metrics.get('recipe_changes_total{change="new"}', 0) + \
+        metrics.get('recipe_changes_total{change="content"}', 0)
+    return {
+        'requests': sum(fake.statuses.values()),
+        'not_modified': fake.statuses.get('304', 0),
+        'downloaded_mb': metrics.get('downloaded_bytes_total', 0) / 1e6,
+        # Without a refresh every new recipe is written
+        'written': changes if refresh else metrics.get('recipes_total{outcome="new"}', 0),
+        'yums_updates': metrics.get('recipe_changes_total{change="volatile"}', 0),
+        'store_mb': (directory_size(store) - size) / 1e6,
+        'seconds': seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=BACKENDS, default='asyncio')
+    parser.add_argument('--pages', type=int, default=1000, help='sitemap entries to crawl')
+    parser.add_argument('--recipes', type=int, default=10000, help='size of the fake catalog')
+    parser.add_argument('--latency', type=float, default=0.0, help='mean response time of the fake server')
+    parser.add_argument('--updated', type=float, default=0.2, help='fraction of recipes with new yums')
+    parser.add_argument('--edited', type=float, default=0.02, help='fraction of recipes with new content')
+    args = parser.parse_args()
+
+    fake = FakeYummly(recipes=args.recipes, latency=args.latency, updated=args.updated, edited=args.edited).start()
+    print(f"{'pass':13} {'requests':>8} {'304':>6} {'download':>10} {'written':>8} {'yums':>6} {'store':>9} "
+          f"{'seconds':>8}")
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            write_sitemaps(os.path.join(output_dir, 'sitemaps'), fake.base_url, args.recipes, args.pages)
+            for name, revision, refresh in (('crawl', 0, False), ('first refresh', 0, True), ('refresh', 1, True),
+                                             ('no changes', 1, True)):
+                fake.revision = revision
+                result = run_pass(fake, output_dir, args.backend, refresh)
+                print(f"{name:13} {result['requests']:8} {result['not_modified']:6} "
+                      f"{result['downloaded_mb']:8.1f}MB {result['written']:8.0f} {result['yums_updates']:6.0f} "
+                      f"{result['store_mb']:7.2f}MB {result['seconds']:8.1f}")
+            print(f"{sum(1 for _ in iter_deltas(output_dir))} entries in deltas.tsv")
+    finally:
+        fake.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Membership tests per second and resident memory of the seen indexes.
+
+    python -m benchmarks.seen_index --sizes 1000000 5000000 10000000
+
+Every index and size is measured in a fresh process, so the memory numbers do not influence each other.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from yummly_scraper.seen_index import INDEXES, open_index
+
+
+def rss_mb() -> float:
+    """Current resident set size, read from /proc on Linux and falling back to the peak elsewhere"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(kind: str, size: int, lookups: int, queue: multiprocessing.Queue):
+    with tempfile.TemporaryDirectory() as tmp:
+        before = rss_mb()
+        index = open_index(kind, os.path.join(tmp, kind))
+        start = time.perf_counter()
+        for i in range(size):
+            index.add(f'Synthetic-Recipe-{i}')
+        build = time.perf_counter() - start
+        memory = rss_mb() - before
+
+        step = max(size // lookups, 1)
+        start = time.perf_counter()
+        hits = sum(1 for i in range(0, size, step) if f'Synthetic-Recipe-{i}' in index)
+        hit_rate = hits / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        misses = sum(1 for i in range(lookups) if f'Unseen-Recipe-{i}' not in index)
+        miss_rate = misses / (time.perf_counter() - start)
+        index.close()
+    queue.put((build, memory, hit_rate, miss_rate))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000_000, 5_000_000, 10_000_000])
+    parser.add_argument('--indexes', nargs='+', default=list(INDEXES), choices=list(INDEXES))
+    parser.add_argument('--lookups', type=int, default=200_000)
+    args = parser.parse_args()
+
+    print(f"{'index':8} {'entries':>10} {'build s':>9} {'RSS MB':>8} {'hits/s':>10} {'misses/s':>10}")
+    for size in args.sizes:
+        for kind in args.indexes:
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=run, args=(kind, size, args.lookups, queue))
+            process.start()
+            build, memory, hit_rate, miss_rate = queue.get()
+            process.join()
+            print(f"{kind:8} {size:>10} {build:>9.1f} {memory:>8.1f} {hit_rate:>10.0f} {miss_rate:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Compare the streaming sitemap reader with the previous BeautifulSoup parse.
+
+Download the sitemaps listed in sitemaps.txt (plain or gzipped) and run
+    python -m benchmarks.sitemap yummly_recipes/sitemaps
+Without a directory a synthetic sitemap with 50000 URLs is used.
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from yummly_scraper.sitemap import is_sitemap_file, iter_sitemap_urls, open_sitemap
+
+
+def soup_count(path: str) -> int:
+    """
+    The previous implementation: read everything, build the whole tree, collect the <loc> values
+    """
+    with open_sitemap(path) as f:
+        content = f.read()
+    soup = BeautifulSoup(content, 'lxml-xml')
+    return len([url.find('loc').text for url in soup.find_all('url')])
+
+
+def stream_count(path: str) -> int:
+    return sum(1 for _ in iter_sitemap_urls(path))
+
+
+def synthetic_sitemap(directory: str, count: int = 50000) -> str:
+    path = os.path.join(directory, 'synthetic.xml')
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        for i in range(count):
+            f.write(f'<url><loc>https://www.yummly.com/recipe/Synthetic-Recipe-{i}</loc>'
+                    f'<changefreq>weekly</changefreq></url>\n')
+        f.write('</urlset>\n')
+    return path
+
+
+def measure(reader, paths):
+    """
+    Time and peak traced memory of reading all sitemaps
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = 0
+    for path in paths:
+        count += reader(path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sitemaps', nargs='?', help='directory with downloaded sitemaps')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.sitemaps:
+            paths = [os.path.join(args.sitemaps, name)
+                     for name in sorted(os.listdir(args.sitemaps)) if is_sitemap_file(name)]
+        else:
+            paths = [synthetic_sitemap(tmp)]
+
+        for name, reader in (('BeautifulSoup', soup_count), ('Streaming', stream_count)):
+            count, elapsed, peak = measure(reader, paths)
+            print(f"{name:14} {count} URLs in {elapsed:6.2f} s, peak memory {peak / 2**20:7.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
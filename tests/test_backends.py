@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fake_yummly import FakeYummly, fake_clearance, recipe_id, recipe_page
+from yummly_scraper.backends import process_url, process_url_async
+from yummly_scraper.crawler import Crawler
+from yummly_scraper.seen_index import recipe_key
+from yummly_scraper.sessions import SessionPool, ThreadSessions
+from yummly_scraper.throttle import AdaptiveDelay, AdaptiveLimiter
+
+RECIPES = 50
+
+
+@pytest.fixture(scope='module')
+def fake():
+    fake = FakeYummly(recipes=RECIPES, related=5, latency=0.0).start()
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def crawler(tmp_path):
+    crawler = Crawler(str(tmp_path), index='set')
+    crawler.loaded.wait()
+    claim = crawler.claim
+
+    def claim_then_store_everything(url):
+        """Claim the page, then let another page store every recipe of the catalog before it is parsed"""
+        claimed = claim(url)
+        with crawler.lock:
+            crawler.scraped.update(recipe_id(n) for n in range(RECIPES))
+        return claimed
+
+    crawler.claim = claim_then_store_everything
+    yield crawler
+    crawler.close()
+
+
+def outcomes(crawler):
+    return {outcome: crawler.metrics.total('pages_total', outcome=outcome) for outcome in ('scraped', 'failed')}
+
+
+def test_a_page_whose_recipes_were_all_stored_meanwhile_is_scraped(fake, crawler):
+    url = f'{fake.base_url}/recipe/{recipe_id(7)}'
+    sessions = ThreadSessions(crawler.cookie_file, clearance=fake_clearance)
+    sessions.start()
+    process_url(crawler, url, sessions, AdaptiveDelay())
+    sessions.close()
+    assert outcomes(crawler) == {'scraped': 1, 'failed': 0}
+    assert recipe_key(url) not in crawler.failed
+    assert crawler.metrics.total('recipes_total', outcome='new') == 0
+
+
+def test_a_page_whose_recipes_were_all_stored_meanwhile_is_scraped_async(fake, crawler):
+    url = f'{fake.base_url}/recipe/{recipe_id(7)}'
+
+    async def run():
+        sessions = SessionPool(crawler.cookie_file, pool_size=1, clearance=fake_clearance)
+        await sessions.start()
+        recipes = await process_url_async(crawler, url, sessions, AdaptiveLimiter(initial=1, maximum=1))
+        await sessions.close()
+        assert recipes == []
+        await crawler.save_recipes_async(url, recipes)
+
+    asyncio.run(run())
+    assert outcomes(crawler) == {'scraped': 1, 'failed': 0}
+    assert recipe_key(url) not in crawler.failed
+
+
+def test_parse_tells_pages_without_recipes_from_stored_ones(crawler):
+    page = recipe_page(7, RECIPES, 5)
+    stored = {recipe_id(n) for n in range(RECIPES)}.__contains__
+    assert crawler.parse_stage.parse_sync(b'<html><body>Not a recipe page</body></html>') is None
+    assert crawler.parse_stage.parse_sync(page, stored=stored) == []
+    assert [recipe['id'] for recipe in crawler.parse_stage.parse_sync(page)][-1] == recipe_id(7)
@@ -0,0 +1,47 @@
+import threading
+
+from yummly_scraper.crawler import Crawler
+from yummly_scraper.journal import FAILED, SCRAPED
+
+
+def test_recorded_keys_go_into_their_index_behind_the_writer(tmp_path):
+    crawler = Crawler(str(tmp_path), index='set')
+    crawler.loaded.wait()
+    written = threading.Event()
+    crawler.writer.defer(written.wait)
+    crawler.record('a', SCRAPED)
+    crawler.record('b', FAILED)
+    # Seen right away, but only in the index once the writer got to them
+    assert crawler.is_stored('a') and crawler.is_seen('b') and not crawler.is_stored('b')
+    assert 'a' not in crawler.scraped and 'b' not in crawler.failed
+    written.set()
+    crawler.writer.defer(lambda: None).result()
+    assert 'a' in crawler.scraped and 'b' in crawler.failed and not crawler.pending
+    crawler.close()
+
+
+def test_a_compaction_neither_holds_the_lock_while_waiting_nor_saves_pending_keys(tmp_path):
+    crawler = Crawler(str(tmp_path), index='set')
+    crawler.loaded.wait()
+    written = threading.Event()
+    crawler.writer.defer(written.wait)
+    crawler.record('a', SCRAPED)
+    saved = []
+    save = crawler.scraped.save
+    crawler.scraped.save = lambda: saved.append(set(crawler.scraped)) or save()
+    checkpoint = threading.Thread(target=crawler.checkpoint, args=(True,))
+    checkpoint.start()
+    # The crawl goes on while the checkpoint waits for the writer
+    assert crawler.lock.acquire(timeout=5)
+    crawler.record('b', SCRAPED)
+    crawler.lock.release()
+    written.set()
+    checkpoint.join()
+    # 'b' was recorded behind the compaction
+    assert saved == [{'a'}]
+    crawler.close()
+
+    crawler = Crawler(str(tmp_path), index='set')
+    crawler.loaded.wait()
+    assert crawler.is_stored('a') and crawler.is_stored('b')
+    crawler.close()
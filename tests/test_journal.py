@@ -0,0 +1,123 @@
+import os
+import time
+
+import pytest
+
+from yummly_scraper.journal import FAILED, FAILED_FILE, JOURNAL_FILE, SCRAPED, SCRAPED_FILE, ProgressJournal
+from yummly_scraper.seen_index import INDEXES, open_index
+
+
+def open_indexes(output_dir, kind='set'):
+    return open_index(kind, os.path.join(output_dir, 'scraped')), open_index(kind, os.path.join(output_dir, 'failed'))
+
+
+def resume(output_dir, kind='set', **kwargs):
+    """Load the progress of output_dir like a restarted crawl"""
+    scraped, failed = open_indexes(output_dir, kind)
+    journal = ProgressJournal(output_dir, **kwargs)
+    journal.load(scraped, failed)
+    return journal, scraped, failed
+
+
+def journal_lines(output_dir):
+    with open(os.path.join(output_dir, JOURNAL_FILE), encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+@pytest.mark.parametrize('kind', INDEXES)
+def test_replay_restores_the_outcomes(tmp_path, kind):
+    output_dir = str(tmp_path)
+    journal, scraped, failed = resume(output_dir, kind)
+    journal.record('a')
+    journal.record('b', SCRAPED)
+    journal.record('c', FAILED)
+    journal.close()
+
+    journal, scraped, failed = resume(output_dir, kind)
+    assert 'a' in scraped and 'b' in scraped and 'c' not in scraped
+    assert 'c' in failed and 'a' not in failed
+    assert journal.entries == 3
+    # Replaying did not compact, new entries are appended
+    journal.record('d')
+    journal.close()
+    assert journal_lines(output_dir) == ['S\ta', 'S\tb', 'F\tc', 'S\td']
+
+
+def test_replay_keys_full_urls_of_older_journals(tmp_path):
+    output_dir = str(tmp_path)
+    with open(os.path.join(output_dir, JOURNAL_FILE), 'w', encoding='utf-8') as f:
+        f.write('S\thttps://www.yummly.com/recipe/Garlic-Chicken-123\n')
+    _, scraped, _ = resume(output_dir)
+    assert 'Garlic-Chicken-123' in scraped
+
+
+def test_a_partially_written_last_entry_is_cut_off(tmp_path):
+    output_dir = str(tmp_path)
+    with open(os.path.join(output_dir, JOURNAL_FILE), 'w', encoding='utf-8') as f:
+        f.write('S\ta\nF\tb\nS\tpart')
+    journal, scraped, failed = resume(output_dir)
+    assert set(scraped) == {'a'} and set(failed) == {'b'}
+    journal.record('c')
+    journal.close()
+    assert journal_lines(output_dir) == ['S\ta', 'F\tb', 'S\tc']
+
+
+def test_compaction_folds_the_journal_into_the_snapshots(tmp_path):
+    output_dir = str(tmp_path)
+    journal, scraped, failed = resume(output_dir, compact_every=3)
+    for key, status in (('a', SCRAPED), ('b', FAILED), ('c', SCRAPED)):
+        journal.record(key, status)
+        (scraped if status == SCRAPED else failed).add(key)
+    assert journal.needs_compaction()
+    journal.compact(scraped, failed)
+    assert journal.entries == 0 and journal_lines(output_dir) == []
+    journal.record('d')
+    journal.close()
+
+    journal, scraped, failed = resume(output_dir, compact_every=3)
+    assert set(scraped) == {'a', 'c', 'd'} and set(failed) == {'b'}
+
+
+def test_load_compacts_a_long_journal(tmp_path):
+    output_dir = str(tmp_path)
+    journal, _, _ = resume(output_dir)
+    for key in 'abcd':
+        journal.record(key)
+    journal.close()
+
+    journal, scraped, _ = resume(output_dir, compact_every=3)
+    assert set(scraped) == set('abcd')
+    assert journal_lines(output_dir) == []
+    assert os.path.exists(os.path.join(output_dir, 'scraped.txt'))
+
+
+def test_legacy_url_lists_are_migrated(tmp_path):
+    output_dir = str(tmp_path)
+    with open(os.path.join(output_dir, SCRAPED_FILE), 'w', encoding='utf-8') as f:
+        f.write('https://www.yummly.com/recipe/A-1\nhttps://www.yummly.com/recipe/B-2/\n')
+    with open(os.path.join(output_dir, FAILED_FILE), 'w', encoding='utf-8') as f:
+        f.write('https://www.yummly.com/recipe/C-3\n')
+    journal, scraped, failed = resume(output_dir)
+    assert set(scraped) == {'A-1', 'B-2'} and set(failed) == {'C-3'}
+    assert not journal.legacy
+    journal.close()
+
+
+def test_before_flush_runs_ahead_of_every_flush(tmp_path):
+    calls = []
+    journal, _, _ = resume(str(tmp_path), flush_interval=0, before_flush=lambda: calls.append('flush'))
+    journal.record('a')
+    journal.record('b')
+    assert calls == ['flush', 'flush']
+
+
+def test_an_idle_journal_is_due_for_a_flush(tmp_path):
+    journal, _, _ = resume(str(tmp_path), flush_interval=0.05)
+    assert not journal.flush_due
+    journal.record('a')
+    # Nothing recorded after it flushes the entry
+    time.sleep(0.05)
+    assert journal.flush_due
+    journal.flush()
+    assert not journal.flush_due
+    journal.close()
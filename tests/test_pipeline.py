@@ -0,0 +1,104 @@
+import asyncio
+
+from yummly_scraper import backends
+from yummly_scraper.backends import fetch_worker, produce_urls, write_results
+
+
+class Frontier:
+    done = False
+
+
+class Stages:
+    """The steps of a Crawler the pipeline stages call, over a fixed list of URLs"""
+
+    def __init__(self, urls):
+        self.urls = list(urls)
+        self.frontier = Frontier()
+        self.handed_out = 0
+        self.saved = []
+        self.checkpoints = 0
+
+    def next_url(self, max_scan=None):
+        if self.handed_out == len(self.urls):
+            self.frontier.done = True
+            return None
+        self.handed_out += 1
+        return self.urls[self.handed_out - 1]
+
+    def retry_pause(self):
+        return None
+
+    def page_failed(self, url):
+        raise AssertionError(url)
+
+    async def save_recipes_async(self, url, recipes):
+        self.saved.append((url, recipes))
+
+    @property
+    def checkpoint_due(self):
+        return True
+
+    def checkpoint(self):
+        self.checkpoints += 1
+
+
+def test_the_producer_waits_for_room_in_the_url_queue():
+    async def run():
+        stages = Stages(f'url-{i}' for i in range(100))
+        url_queue = asyncio.Queue(maxsize=4)
+        producer = asyncio.create_task(produce_urls(stages, url_queue, workers=2))
+        await asyncio.sleep(0.01)
+        # Blocked on the full queue, with one more URL taken from the frontier
+        assert url_queue.full() and stages.handed_out == 5
+        taken = []
+        while True:
+            url = await url_queue.get()
+            if url is None:
+                break
+            taken.append(url)
+        await producer
+        # Handed out in frontier order, followed by the second worker's sentinel
+        assert taken == stages.urls and url_queue.get_nowait() is None
+
+    asyncio.run(run())
+
+
+def test_workers_wait_for_the_writer_and_pages_are_saved_in_order(monkeypatch):
+    async def process_url_async(crawler, url, sessions, limiter):
+        return [{'id': url}]
+
+    monkeypatch.setattr(backends, 'process_url_async', process_url_async)
+
+    async def run():
+        stages = Stages(f'url-{i}' for i in range(20))
+        url_queue, result_queue = asyncio.Queue(), asyncio.Queue(maxsize=3)
+        for url in stages.urls:
+            url_queue.put_nowait(url)
+        url_queue.put_nowait(None)
+        worker = asyncio.create_task(fetch_worker(stages, None, None, url_queue, result_queue))
+        await asyncio.sleep(0.01)
+        # Three pages wait for the writer, the worker holds the fourth
+        assert result_queue.full() and url_queue.qsize() == 20 - 4 + 1
+        writer = asyncio.create_task(write_results(stages, result_queue))
+        await worker
+        await result_queue.put(None)
+        await writer
+        assert stages.saved == [(url, [{'id': url}]) for url in stages.urls]
+
+    asyncio.run(run())
+
+
+def test_the_writer_checkpoints_while_no_pages_come_in():
+    async def run():
+        stages = Stages([])
+        result_queue = asyncio.Queue()
+        writer = asyncio.create_task(write_results(stages, result_queue))
+        await asyncio.sleep(1.5)
+        assert stages.checkpoints == 1 and not stages.saved
+        # The page arriving after the timeout is not lost
+        await result_queue.put(('url', []))
+        await result_queue.put(None)
+        await writer
+        assert stages.saved == [('url', [])]
+
+    asyncio.run(run())
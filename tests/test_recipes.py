@@ -0,0 +1,60 @@
+from yummly_scraper.recipes import flatten_recipes
+
+
+def info(recipe_id, yums=None, **related):
+    """The recipeInfo of a recipe, with lists of related recipeInfos by name"""
+    recipe = {'id': recipe_id}
+    for name, infos in related.items():
+        if name == 'spotlightCarousels':
+            recipe[name] = [{'cards': {'newList': [{'recipeInfo': i} for i in infos]}}]
+        else:
+            recipe[name] = [{'recipeInfo': i} for i in infos]
+        recipe[f'{name}Loaded'] = True
+        recipe[f'{name}Loading'] = False
+    return {'recipe': recipe, 'yums': yums}
+
+
+def ids(recipes):
+    return [recipe['id'] for recipe in recipes]
+
+
+def test_related_recipes_come_first_in_page_order():
+    page = info('main', 10,
+                moreFromSource=[info('source-1'), info('source-2', relatedRecipes=[info('nested')])],
+                relatedRecipes=[info('related')],
+                spotlightCarousels=[info('carousel')])
+    recipes, duplicates = flatten_recipes(page)
+    assert ids(recipes) == ['source-1', 'nested', 'source-2', 'related', 'carousel', 'main']
+    assert duplicates == 0
+
+
+def test_related_lists_and_flags_are_removed():
+    page = info('main', relatedRecipes=[info('related')], spotlightCarousels=[info('carousel')])
+    main = flatten_recipes(page)[0][-1]
+    assert main == {'id': 'main', 'yums': None}
+
+
+def test_yums_fall_back_to_yums_object():
+    page = {'recipe': {'id': 'main'}, 'yumsObject': {'count': 3}}
+    assert flatten_recipes(page)[0] == [{'id': 'main', 'yums': {'count': 3}}]
+
+
+def test_duplicates_are_counted_and_their_related_recipes_walked():
+    page = info('main', relatedRecipes=[info('a'), info('main', relatedRecipes=[info('b')]), info('a')])
+    recipes, duplicates = flatten_recipes(page)
+    assert ids(recipes) == ['a', 'b', 'main']
+    assert duplicates == 2
+
+
+def test_stored_recipes_are_left_out():
+    page = info('main', relatedRecipes=[info('stored', relatedRecipes=[info('new')]), info('other')])
+    recipes, duplicates = flatten_recipes(page, stored={'stored', 'other'}.__contains__)
+    assert ids(recipes) == ['new', 'main']
+    assert duplicates == 2
+
+
+def test_pages_without_a_recipe():
+    assert flatten_recipes({}) == ([], 0)
+    assert flatten_recipes({'recipe': None}) == ([], 0)
+    page = info('main', relatedRecipes=[None, {'recipe': 'oops'}])
+    assert flatten_recipes(page) == ([{'id': 'main', 'yums': None}], 0)
@@ -0,0 +1,94 @@
+import pytest
+
+from yummly_scraper.retry import PERMANENT, TRANSIENT, FetchFailed, RetryQueue, classify
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return RetryQueue(str(tmp_path), base_delay=10.0, max_delay=100.0, max_attempts=3)
+
+
+def test_classify():
+    assert classify(404) == PERMANENT
+    assert classify(429) == TRANSIENT
+    assert classify(503) == TRANSIENT
+    assert classify(None) == TRANSIENT
+
+
+def test_backoff_doubles_with_jitter_up_to_max_delay(queue):
+    for attempts, delay in ((1, 10.0), (2, 20.0), (3, 40.0), (4, 80.0), (5, 100.0), (10, 100.0)):
+        for _ in range(20):
+            assert delay / 2 <= queue.backoff(attempts) <= delay
+
+
+def test_retries_wait_for_their_backoff(queue):
+    assert queue.schedule(FetchFailed('https://a', 503))
+    assert len(queue) == 1 and 'https://a' in queue
+    assert queue.pop_due() is None
+    assert 5.0 <= queue.next_due() <= 10.0
+
+
+def test_due_retries_are_handed_out_once(tmp_path):
+    queue = RetryQueue(str(tmp_path), base_delay=0.0)
+    queue.schedule(FetchFailed('https://a', 503))
+    assert queue.pop_due() == 'https://a'
+    # Handed out, it stays queued until it is removed or fails again
+    assert queue.pop_due() is None and 'https://a' in queue
+    queue.remove('https://a')
+    assert len(queue) == 0 and queue.next_due() is None
+
+
+def test_retry_after_overrides_a_shorter_backoff(queue):
+    queue.schedule(FetchFailed('https://a', 429, retry_after=60.0))
+    assert queue.next_due() > 50.0
+
+
+def test_permanent_failures_and_exhausted_attempts_are_not_retried(queue):
+    assert not queue.schedule(FetchFailed('https://gone', 404))
+    assert 'https://gone' not in queue
+
+    for _ in range(3):
+        assert queue.schedule(FetchFailed('https://flaky', 503))
+    assert queue.entries['https://flaky'].attempts == 3
+    assert not queue.schedule(FetchFailed('https://flaky', 503))
+    assert 'https://flaky' not in queue
+    assert queue.given_up == 1
+
+
+def test_entries_survive_a_restart(tmp_path, queue):
+    queue.schedule(FetchFailed('https://a', 503))
+    queue.schedule(FetchFailed('https://b', None))
+    queue.schedule(FetchFailed('https://b', None))
+    queue.close()
+
+    restarted = RetryQueue(str(tmp_path), base_delay=10.0, max_delay=100.0, max_attempts=3)
+    restarted.load()
+    assert {url: (e.attempts, e.status) for url, e in restarted.entries.items()} == \
+        {'https://a': (1, 503), 'https://b': (2, None)}
+    assert restarted.pop_due() is None
+
+
+def test_ignore_delay_only_hands_out_loaded_entries(tmp_path, queue):
+    queue.schedule(FetchFailed('https://a', 503))
+    queue.schedule(FetchFailed('https://b', 503))
+    queue.close()
+
+    restarted = RetryQueue(str(tmp_path), base_delay=10.0, max_delay=100.0, max_attempts=3)
+    restarted.load()
+    first = restarted.pop_due(ignore_delay=True)
+    second = restarted.pop_due(ignore_delay=True)
+    assert {first, second} == {'https://a', 'https://b'}
+    # A loaded entry that fails again waits for its backoff like any other
+    restarted.schedule(FetchFailed(first, 503))
+    assert restarted.pop_due(ignore_delay=True) is None
+    assert restarted.entries[first].attempts == 2
+
+
+def test_handed_out_entries_are_due_right_away_after_a_restart(tmp_path, queue):
+    queue.schedule(FetchFailed('https://a', 503))
+    queue.entries['https://a'].due = -1.0
+    queue.close()
+
+    restarted = RetryQueue(str(tmp_path))
+    restarted.load()
+    assert restarted.pop_due() == 'https://a'
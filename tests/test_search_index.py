@@ -0,0 +1,44 @@
+import pytest
+
+from yummly_scraper.search_index import BLOCK_SIZE, SearchIndex, decode_postings, encode_postings
+
+
+@pytest.mark.parametrize('docs, width', [
+    ([7], 1),
+    ([1, 2, 3, 255], 1),
+    ([1, 300, 301], 2),
+    ([5, 5 + 65535], 2),
+    ([5, 5 + 65536, 5 + 65536 + (1 << 32) - 1], 4),
+    (list(range(1000, 1000 + BLOCK_SIZE * 3, 3)), 1),
+])
+def test_postings_round_trip_with_the_narrowest_width(docs, width):
+    data = encode_postings(docs)
+    assert data[0] == width
+    assert len(data) == 1 + width * len(docs)
+    assert decode_postings(data, docs[0]) == docs
+
+
+def test_gaps_are_little_endian():
+    assert encode_postings([10, 11, 11 + 256]) == bytes((2, 0, 0, 1, 0, 0, 1))
+
+
+def recipe(recipe_id, name, yums):
+    return {'id': recipe_id, 'display': {'displayName': name}, 'yums': {'count': yums}}
+
+
+def test_posting_lists_grow_block_by_block(tmp_path):
+    index = SearchIndex(str(tmp_path / 'search.sqlite'), batch_size=100)
+    for i in range(BLOCK_SIZE + 10):
+        index.add(f'soup-{i}', recipe(f'soup-{i}', 'Tomato soup', i))
+    index.flush()
+    blocks = index.db.execute("SELECT first, last, count FROM postings WHERE term = 'soup' ORDER BY first").fetchall()
+    assert blocks == [(1, BLOCK_SIZE, BLOCK_SIZE), (BLOCK_SIZE + 1, BLOCK_SIZE + 10, 10)]
+    assert index.postings('soup') == list(range(1, BLOCK_SIZE + 11))
+    # Only the blocks overlapping the range are decoded
+    assert index.postings('soup', within=(BLOCK_SIZE + 2, BLOCK_SIZE + 3)) == list(range(BLOCK_SIZE + 1,
+                                                                                         BLOCK_SIZE + 11))
+    assert index.search(['soup'], min_yums=BLOCK_SIZE + 8)[0] == \
+        {'id': f'soup-{BLOCK_SIZE + 9}', 'name': 'Tomato soup', 'yums': BLOCK_SIZE + 9, 'total_time': None,
+         'rating': None, 'servings': None}
+    assert index.document_frequency('soup') == BLOCK_SIZE + 10
+    index.close()
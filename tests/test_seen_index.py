@@ -0,0 +1,129 @@
+import os
+import random
+from array import array
+
+import pytest
+
+from yummly_scraper.seen_index import (INDEXES, BloomFilter, HashIndex, _merge_sorted, key_hash, open_index,
+                                       recipe_key)
+
+
+def test_recipe_key():
+    assert recipe_key('https://www.yummly.com/recipe/Garlic-Chicken-123') == 'Garlic-Chicken-123'
+    assert recipe_key('https://www.yummly.com/recipe/Caf%C3%A9-Au-Lait-9/') == 'Café-Au-Lait-9'
+    assert recipe_key('https://www.yummly.com/recipes/chicken') == 'https://www.yummly.com/recipes/chicken'
+
+
+def test_key_hash_is_stable():
+    assert key_hash('Garlic-Chicken-123') == key_hash('Garlic-Chicken-123')
+    assert key_hash('Garlic-Chicken-123') != key_hash('Garlic-Chicken-124')
+    assert 0 <= key_hash('x') < 1 << 64
+
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives(tmp_path):
+    bloom = BloomFilter(10000)
+    added = [key_hash(f'in-{i}') for i in range(10000)]
+    for h in added:
+        bloom.add(h)
+    assert all(h in bloom for h in added)
+    false_positives = sum(key_hash(f'out-{i}') in bloom for i in range(10000))
+    # About 1% at 10 bits per key and 7 probes
+    assert false_positives < 300
+
+    bloom.save(str(tmp_path / 'bloom'))
+    loaded = BloomFilter.from_file(str(tmp_path / 'bloom'))
+    assert (loaded.capacity, loaded.bits_per_key, loaded.probes) == (10000, 10, 7)
+    assert loaded.bits == bloom.bits
+
+
+def test_merge_sorted():
+    a, b = array('Q', [1, 4, 9]), array('Q', [2, 3, 10, 11])
+    assert list(_merge_sorted(a, b)) == [1, 2, 3, 4, 9, 10, 11]
+    assert list(_merge_sorted(array('Q'), b)) == list(b)
+
+
+def test_hash_index_merges_runs_geometrically():
+    index = HashIndex('unused', capacity=64, pending_size=10)
+    keys = [f'recipe-{i}' for i in range(1000)]
+    for key in keys:
+        index.add(key)
+        index.add(key)
+    assert len(index) == 1000
+    sizes = [len(run) for run in index.runs]
+    assert sum(sizes) + len(index.pending) == 1000
+    # Every run is more than twice the size of the next one, so there are O(log n) of them
+    assert all(a > 2 * b for a, b in zip(sizes, sizes[1:]))
+    assert all(list(run) == sorted(run) for run in index.runs)
+    assert all(key in index for key in keys)
+    assert not any(f'other-{i}' in index for i in range(1000))
+    # The Bloom filter grew along
+    assert index.bloom.capacity >= 1000
+
+
+def test_hash_index_snapshot_is_mapped_and_merged_with_new_keys(tmp_path):
+    path = str(tmp_path / 'scraped')
+    index = HashIndex(path, pending_size=16)
+    for i in range(100):
+        index.add(f'old-{i}')
+    index.save()
+    index.close()
+
+    resumed = HashIndex(path, pending_size=16)
+    resumed.load()
+    assert resumed.mapping is not None and len(resumed) == 100
+    for i in range(100):
+        resumed.add(f'new-{i}')
+    assert all(f'old-{i}' in resumed and f'new-{i}' in resumed for i in range(100))
+    resumed.save()
+    resumed.close()
+
+    again = HashIndex(path)
+    again.load()
+    assert len(again) == 200
+    assert os.path.getsize(path + '.idx') == 200 * 8
+    again.close()
+
+
+@pytest.mark.parametrize('kind', INDEXES)
+def test_indexes_survive_a_restart(tmp_path, kind):
+    path = str(tmp_path / 'scraped')
+    keys = [f'recipe-{i}' for i in range(2000)]
+    random.Random(0).shuffle(keys)
+    index = open_index(kind, path)
+    index.update(keys[:1000])
+    assert len(index) == 1000
+    index.save()
+    index.close()
+
+    index = open_index(kind, path)
+    index.load()
+    index.update(keys[1000:])
+    assert len(index) == 2000
+    assert all(key in index for key in keys)
+    assert 'missing' not in index
+    index.close()
+
+
+def test_unknown_index():
+    with pytest.raises(ValueError):
+        open_index('btree', 'unused')
+
+
+def test_sqlite_index_only_keeps_keys_that_were_saved(tmp_path):
+    path = str(tmp_path / 'scraped')
+    index = open_index('sqlite', path)
+    index.batch_size = 10
+    index.update(f'saved-{i}' for i in range(25))
+    index.save()
+    # Written to the table in batches, but not committed until the next save
+    index.update(f'unsaved-{i}' for i in range(25))
+    assert all(f'unsaved-{i}' in index for i in range(25))
+    # Crashed
+    index.close()
+
+    index = open_index('sqlite', path)
+    index.load()
+    assert len(index) == 25
+    assert all(f'saved-{i}' in index for i in range(25))
+    assert not any(f'unsaved-{i}' in index for i in range(25))
+    index.close()
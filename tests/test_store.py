@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from yummly_scraper.store import COMPRESSIONS, SegmentStore
+
+
+def recipe(i, text='x' * 50):
+    return {'id': f'recipe-{i}', 'text': text}
+
+
+def indexed(store):
+    return store.index.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+
+@pytest.mark.parametrize('compression', [c for c in COMPRESSIONS if c != 'zstd'])
+def test_recipes_read_back_before_and_after_a_restart(tmp_path, compression):
+    store = SegmentStore(str(tmp_path), compression, block_size=200, segment_size=1000)
+    for i in range(100):
+        store.put(f'recipe-{i}', recipe(i))
+    store.put('recipe-5', recipe(5, 'changed'))
+    assert store.get('recipe-5') == recipe(5, 'changed')
+    assert store.get('recipe-99') == recipe(99)
+    store.close()
+
+    store = SegmentStore(str(tmp_path), compression)
+    assert len(store) == 100
+    assert store.get('recipe-5') == recipe(5, 'changed')
+    assert sorted(r['id'] for r in store) == sorted(f'recipe-{i}' for i in range(100))
+    assert len([name for name in os.listdir(store.directory) if name.startswith('segment-')]) > 1
+    store.close()
+
+
+def test_blocks_are_indexed_after_the_fsync_of_a_flush(tmp_path, monkeypatch):
+    fsynced = []
+    monkeypatch.setattr(os, 'fsync', lambda fd: fsynced.append((fd, indexed(store))))
+    store = SegmentStore(str(tmp_path), 'none', block_size=200, segment_size=1000)
+    for i in range(100):
+        store.put(f'recipe-{i}', recipe(i))
+    # Blocks were written and segments filled up, but nothing was fsynced or indexed
+    assert fsynced == [] and indexed(store) == 0
+    assert store.get('recipe-0') == recipe(0)
+
+    store.flush(fsync=True)
+    # Every segment written to was fsynced before the index pointed at it
+    assert len(fsynced) > 1 and all(count == 0 for _, count in fsynced)
+    assert indexed(store) == 100
+
+    store.put('recipe-100', recipe(100))
+    store.flush(fsync=False)
+    assert indexed(store) == 101 and len(fsynced) > 1
+    store.close()
@@ -0,0 +1,52 @@
+import json
+import urllib.parse
+
+import pytest
+
+from yummly_scraper.stream_decode import decode_state, iter_percent_decoded
+
+STATE = {
+    'router': {'path': '/recipe/Garlic-Chicken-123', 'query': {}},
+    'recipe': {
+        'id': 'Garlic-Chicken-123',
+        'name': 'Garlic "Chicken" {with} [brackets]',
+        'ingredientLines': [{'wholeLine': '2 cloves garlic\\ minced', 'amount': 2.5}, {'wholeLine': 'salt, to taste'}],
+        'nested': {'a': [[{'b': '}]'}]], 'c': None},
+    },
+    'title': 'Café \\"quoted\\" — 100%',
+    'yums': 1234,
+    'yumsObject': {'count': 1234, 'liked': False},
+    'empty': {},
+    'flag': True,
+}
+KEYS = ('recipe', 'yums', 'yumsObject', 'title', 'flag')
+
+
+def encode(state) -> bytes:
+    return urllib.parse.quote(json.dumps(state, separators=(',', ':')), safe='').encode('ascii')
+
+
+@pytest.mark.parametrize('chunk_size', [3, 4, 5, 7, 16, 64, 1 << 14])
+def test_percent_decoded_chunks_never_split_an_escape(chunk_size):
+    payload = encode(STATE)
+    chunks = list(iter_percent_decoded(memoryview(payload), chunk_size))
+    assert b''.join(chunks) == urllib.parse.unquote_to_bytes(payload)
+
+
+def test_decode_state_at_every_chunk_boundary():
+    """Every split of the payload decodes to the same values as loading it whole"""
+    payload = encode(STATE)
+    expected = {key: STATE[key] for key in KEYS}
+    for chunk_size in range(3, len(payload) + 1):
+        assert decode_state(memoryview(payload), KEYS, chunk_size) == expected, chunk_size
+
+
+def test_decode_state_leaves_out_missing_keys():
+    payload = encode({'router': {'path': '/'}, 'yums': 0})
+    assert decode_state(memoryview(payload), ('recipe', 'yums'), chunk_size=5) == {'yums': 0}
+
+
+@pytest.mark.parametrize('document', ['[1, 2]', '{"recipe": {"id": 1}', '{"recipe" {}}', '{"a": 1} {"b": 2}'])
+def test_decode_state_rejects_malformed_documents(document):
+    with pytest.raises(ValueError):
+        decode_state(memoryview(urllib.parse.quote(document).encode('ascii')), ('recipe',), chunk_size=4)
@@ -0,0 +1,7 @@
+"""
+Shared building blocks for the Yummly scrapers.
+"""
+import time
+
+# When the package was first imported, the time to the first request is measured from here
+STARTED = time.monotonic()
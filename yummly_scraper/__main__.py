@@ -0,0 +1,3 @@
+from yummly_scraper.cli import main
+
+main()
@@ -0,0 +1,261 @@
+"""
+Raw response archive, and the offline re-extraction of recipes from it.
+
+Pages are appended as WARC response records to rolling archive/responses-NNNNNN.warc.gz files,
+one gzip member per record, so standard WARC tools can read them as well.
+
+    python -m yummly_scraper.archive yummly_recipes/archive reextracted_recipes --workers 8
+
+re-runs extraction and stripping over every archive file in parallel and writes a fresh segment store.
+"""
+import argparse
+import gzip
+import http
+import os
+import re
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
+from yummly_scraper.parse_stage import parse_page
+from yummly_scraper.projection import PROFILES, Projection, load_projection
+from yummly_scraper.store import COMPRESSIONS, SegmentStore
+
+ARCHIVE_DIR = 'archive'
+
+
+class TruncatedArchive(Exception):
+    """An archive file ends in a partially written record, e.g. because the crawl was killed"""
+
+
+class ArchiveRecord(NamedTuple):
+    url: str
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+    date: str
+
+
+def _http_block(status: int, headers: Dict[str, str], body: bytes) -> bytes:
+    try:
+        reason = http.HTTPStatus(status).phrase
+    except ValueError:
+        reason = ''
+    lines = [f'HTTP/1.1 {status} {reason}'.rstrip()]
+    for name, value in headers.items():
+        # The body is stored decoded, so the encoding and length headers of the wire format would lie
+        if name.lower() not in ('content-encoding', 'content-length', 'transfer-encoding'):
+            lines.append(f'{name}: {value}')
+    lines.append(f'Content-Length: {len(body)}')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8', 'replace') + body
+
+
+class ResponseArchive:
+    """
+    Appends responses to rolling archive files of about segment_size bytes.
+    Records are compressed on the calling thread, so several threads can write at once.
+    """
+
+    def __init__(self, output_dir: str, segment_size: int = 1 << 30, compresslevel: int = 6, prefix: str = ''):
+        self.directory = os.path.join(output_dir, ARCHIVE_DIR)
+        os.makedirs(self.directory, exist_ok=True)
+        self.segment_size = segment_size
+        self.compresslevel = compresslevel
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.file = None
+
+    def _next_name(self) -> str:
+        pattern = re.compile(re.escape(f'responses-{self.prefix}') + r'(\d+)\.warc\.gz$')
+        numbers = [int(m.group(1)) for m in map(pattern.match, os.listdir(self.directory)) if m]
+        return f'responses-{self.prefix}{max(numbers, default=-1) + 1:06d}.warc.gz'
+
+    def write(self, url: str, status: int, headers: Dict[str, str], body: bytes, timestamp: Optional[float] = None):
+        block = _http_block(status, headers, body)
+        header = (f'WARC/1.0\r\n'
+                  f'WARC-Type: response\r\n'
+                  f'WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>\r\n'
+                  f'WARC-Date: {time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp))}\r\n'
+                  f'WARC-Target-URI: {url}\r\n'
+                  f'Content-Type: application/http; msgtype=response\r\n'
+                  f'Content-Length: {len(block)}\r\n\r\n').encode('utf-8')
+        record = gzip.compress(header + block + b'\r\n\r\n', compresslevel=self.compresslevel)
+        with self.lock:
+            if self.file is None:
+                self.file = open(os.path.join(self.directory, self._next_name()), 'ab')
+            self.file.write(record)
+            if self.file.tell() >= self.segment_size:
+                self.file.close()
+                self.file = None
+
+    def flush(self, fsync: bool = False):
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+                if fsync:
+                    os.fsync(self.file.fileno())
+
+    def close(self):
+        self.flush(fsync=True)
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def _read_headers(f) -> Optional[Tuple[str, Dict[str, str]]]:
+    """The first line and the headers of a WARC or HTTP header block, None at the end of the file"""
+    first = f.readline()
+    while first in (b'\r\n', b'\n'):
+        first = f.readline()
+    if not first:
+        return None
+    headers = {}
+    for line in iter(f.readline, b''):
+        line = line.rstrip(b'\r\n')
+        if not line:
+            break
+        name, _, value = line.decode('utf-8', 'replace').partition(':')
+        headers[name.strip()] = value.strip()
+    return first.decode('utf-8', 'replace').strip(), headers
+
+
+def _read_record(f) -> Optional[Tuple[Dict[str, str], bytes]]:
+    warc = _read_headers(f)
+    if warc is None:
+        return None
+    _, warc_headers = warc
+    length = int(warc_headers.get('Content-Length', 0))
+    block = f.read(length)
+    if len(block) < length:
+        raise EOFError(f"Record ends after {len(block)} of {length} bytes")
+    return warc_headers, block
+
+
+def iter_archive(path: str) -> Iterator[ArchiveRecord]:
+    """
+    Stream the response records of an archive file, holding one record in memory at a time.
+    Raises TruncatedArchive after the last complete record if the file ends in a partial one.
+    """
+    with gzip.open(path, 'rb') as f:
+        while True:
+            try:
+                record = _read_record(f)
+            except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+                raise TruncatedArchive(f"{path}: {e}") from e
+            if record is None:
+                return
+            warc_headers, block = record
+            if warc_headers.get('WARC-Type') != 'response':
+                continue
+            head, _, body = block.partition(b'\r\n\r\n')
+            status_line, *header_lines = head.decode('utf-8', 'replace').split('\r\n')
+            headers = dict(line.split(': ', 1) for line in header_lines if ': ' in line)
+            status = int(status_line.split()[1])
+            yield ArchiveRecord(warc_headers.get('WARC-Target-URI', ''), status, headers, body,
+                                warc_headers.get('WARC-Date', ''))
+
+
+def _encoding(headers: Dict[str, str]) -> str:
+    for name, value in headers.items():
+        if name.lower() == 'content-type':
+            match = re.search(r'charset=([\w-]+)', value)
+            if match:
+                return match.group(1)
+    return 'utf-8'
+
+
+def reextract_file(path: str, output_dir: str, compression: str = 'gzip',
+                   projection: Optional[Projection] = None) -> Dict[str, int]:
+    """
+    Extract, strip and project the recipes of every page in one archive file into the segment store in output_dir.
+    Runs in a worker process, with its own segment files. Returns the counts of pages, failed pages, recipes,
+    the bytes the projection saved on the recipes it measured and whether the file was truncated,
+    in which case everything up to the last complete record is extracted.
+    """
+    prefix = os.path.basename(path).split('.')[0] + '-'
+    store = SegmentStore(output_dir, compression, prefix=prefix)
+    counts = dict.fromkeys(('pages', 'failed', 'recipes', 'measured', 'saved_bytes', 'truncated'), 0)
+    # Popular recipes are related to many pages, each is written once per archive file
+    written = set()
+    try:
+        for record in iter_archive(path):
+            if record.status != 200:
+                continue
+            counts['pages'] += 1
+            try:
+                recipe_data_list, _, stats = parse_page(record.body, _encoding(record.headers), projection)
+            except Exception as e:
+                print(f"Error extracting {record.url}: {e}")
+                recipe_data_list = None
+            if not recipe_data_list:
+                counts['failed'] += 1
+                continue
+            for recipe_data in recipe_data_list:
+                if recipe_data.get('id') not in written:
+                    written.add(recipe_data.get('id'))
+                    store.put(recipe_data.get('id'), recipe_data)
+                    counts['recipes'] += 1
+            counts['measured'] += len(stats['saved_bytes'])
+            counts['saved_bytes'] += sum(stats['saved_bytes'])
+    except TruncatedArchive as e:
+        print(f"Stopped at the last complete record: {e}")
+        counts['truncated'] = 1
+    finally:
+        store.close()
+    return counts
+
+
+def reextract(archive_dir: str, output_dir: str, workers: Optional[int] = None, compression: str = 'gzip',
+              projection: str = 'full'):
+    """
+    Re-run extraction and stripping over every archive file in archive_dir, one file per process at a time,
+    and write the recipes, cut down to the projection, to a fresh segment store in output_dir
+    """
+    paths = sorted(os.path.join(archive_dir, name) for name in os.listdir(archive_dir) if name.endswith('.warc.gz'))
+    os.makedirs(output_dir, exist_ok=True)
+    # Creating the store once up front sets up its index before the workers open it concurrently
+    SegmentStore(output_dir, compression).close()
+    start = time.time()
+    totals = {}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = [executor.submit(reextract_file, path, output_dir, compression, load_projection(projection))
+                   for path in paths]
+        failed_files = 0
+        for path, future in zip(paths, futures):
+            try:
+                counts = future.result()
+            except Exception as e:
+                # The other files are still worth extracting
+                print(f"{os.path.basename(path)}: failed, {e}")
+                failed_files += 1
+                continue
+            totals = {name: totals.get(name, 0) + value for name, value in counts.items()}
+            truncated = ', truncated' if counts['truncated'] else ''
+            print(f"{os.path.basename(path)}: {counts['pages']} pages, {counts['failed']} failed, "
+                  f"{counts['recipes']} recipes{truncated}")
+    print(f"Re-extracted {totals.get('recipes', 0)} recipes from {totals.get('pages', 0)} pages "
+          f"({totals.get('failed', 0)} failed) in {time.time() - start:.1f} seconds")
+    if failed_files or totals.get('truncated'):
+        print(f"{totals.get('truncated', 0)} archive files were truncated, {failed_files} could not be read")
+    if totals.get('measured'):
+        print(f"The {projection} projection saved {totals['saved_bytes'] / totals['measured']:.0f} bytes per recipe")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('archive_dir', help='directory with the .warc.gz archive files')
+    parser.add_argument('output_dir', help='where the new segment store is written')
+    parser.add_argument('--workers', type=int, help='processes to use (default: one per core)')
+    parser.add_argument('--compression', choices=COMPRESSIONS, default='gzip')
+    parser.add_argument('--projection', default='full',
+                        help=f"parts of the recipes to keep: {', '.join(PROFILES)} or a JSON file of paths")
+    args = parser.parse_args()
+    reextract(args.archive_dir, args.output_dir, args.workers, args.compression, args.projection)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,362 @@
+"""
+Execution backends for the crawl pipeline of yummly_scraper/crawler.py. They all run the same steps and write
+the same output, so a crawl can be resumed with a different one:
+
+    sequential  one page at a time with an adaptive delay between requests, the most polite
+    threads     `concurrency` threads that fetch and parse pages, within an AIMD concurrency limit
+    asyncio     `concurrency` fetch workers on an event loop with an AIMD concurrency limit,
+                pages are parsed in a thread
+    processes   asyncio, with the pages parsed in a pool of processes (one per core by default),
+                so parsing is not limited by the GIL
+
+Compare them on the same workload with python -m benchmarks.end_to_end --backends ...
+"""
+import asyncio
+import time
+import traceback
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Set, Union
+
+from curl_cffi import requests
+
+from yummly_scraper.crawler import Crawler
+from yummly_scraper.retry import FetchFailed
+from yummly_scraper.sessions import ClearanceProvider, SessionPool, ThreadSessions, browser_clearance
+from yummly_scraper.throttle import AdaptiveDelay, AdaptiveLimiter, ThreadLimiter
+
+BACKENDS = ('sequential', 'threads', 'asyncio', 'processes')
+# Default concurrency per backend
+CONCURRENCY = {'sequential': 1, 'threads': 8, 'asyncio': 64, 'processes': 64}
+# Cloudflare challenges in a row before a page is handed to the retry queue
+MAX_CHALLENGES = 3
+
+
+def fetch(crawler: Crawler, url: str, sessions: ThreadSessions, throttle: Union[AdaptiveDelay, ThreadLimiter],
+          retry_count: int = 0) -> requests.Response:
+    """
+    Fetch a page with the session of the calling thread, refreshing the clearance if cloudflare challenges it.
+    The throttle is an adaptive delay for the sequential backend and a concurrency limit for the threads,
+    both back off when the server pushes back. Raises FetchFailed for error responses.
+    In a refresh the request is conditional, an unchanged page comes back as a 304 without a body.
+    """
+    session, generation = sessions.session()
+    with throttle:
+        crawler.requesting()
+        start = time.monotonic()
+        try:
+            response = session.get(url, headers=crawler.request_headers(url))
+        except requests.RequestsError as e:
+            # Timeouts and resets count as slow responses
+            throttle.record(None, time.monotonic() - start)
+            crawler.metrics.inc('responses_total', status='error')
+            raise FetchFailed(url, reason=str(e)) from e
+        latency = time.monotonic() - start
+    if crawler.check_response(url, response, latency, throttle):
+        crawler.metrics.inc('challenges_total', profile=sessions.profile)
+        # Every thread picks up the new clearance with its next request
+        sessions.refresh(url, generation)
+        if retry_count < MAX_CHALLENGES:
+            crawler.metrics.inc('retries_total', cause='challenge')
+            return fetch(crawler, url, sessions, throttle, retry_count + 1)
+        raise FetchFailed(url, response.status_code, reason='cloudflare challenge')
+    return response
+
+
+def process_url(crawler: Crawler, url: str, sessions: ThreadSessions,
+                throttle: Union[AdaptiveDelay, ThreadLimiter]):
+    """Fetch, parse and save one page in the calling thread"""
+    if not crawler.claim(url):
+        return
+    print(f'New URL: {url}')
+    try:
+        with crawler.metrics.timer('fetch'):
+            response = fetch(crawler, url, sessions, throttle)
+        crawler.fetched(url, response)
+        if response.status_code == 304:
+            crawler.not_modified(url)
+            return
+        # Recipes saved before are left out while flattening, so they are never projected and serialized again
+        recipes = crawler.parse_stage.parse_sync(response.content, response.encoding or 'utf-8',
+                                                 crawler.stored_filter(url))
+    except FetchFailed as e:
+        crawler.fetch_failed(url, e)
+        return
+    except Exception as e:
+        print(f"Error extracting initial state from {url}: {e}")
+        print(traceback.format_exc())
+        recipes = None
+    if recipes is None:
+        crawler.page_failed(url)
+    else:
+        # Saved with no recipes at all if they were all stored since the page was claimed
+        crawler.save_recipes(url, recipes)
+
+
+def crawl_sync(crawler: Crawler, threads: int = 1, initial_concurrency: int = 4,
+               clearance: ClearanceProvider = browser_clearance):
+    """
+    The sequential (threads=1, everything on the calling thread) and thread pool backends.
+    The calling thread hands out URLs and checkpoints, at most 2 * threads pages are queued for the pool.
+    Within the threads an AIMD limiter starting at initial_concurrency finds the concurrency the origin tolerates.
+    """
+    # Reuse saved clearance cookies, open the browser only without them (or, with fast_start, once challenged)
+    sessions = ThreadSessions(crawler.cookie_file, clearance=clearance)
+    if not crawler.fast_start:
+        sessions.start()
+    pool = None
+    if threads > 1:
+        pool = ThreadPoolExecutor(threads, thread_name_prefix='fetch')
+        throttle = ThreadLimiter(initial=min(initial_concurrency, threads), maximum=threads)
+        crawler.metrics.gauge('in_flight_requests', lambda: throttle.in_flight)
+        crawler.metrics.gauge('concurrency_limit', lambda: throttle.limit)
+    else:
+        throttle = AdaptiveDelay()
+        crawler.metrics.gauge('request_delay_seconds', lambda: throttle.delay)
+    crawler.start()
+
+    in_flight: Set[Future] = set()
+
+    def finish(return_when: str):
+        nonlocal in_flight
+        done, in_flight = wait(in_flight, return_when=return_when)
+        for future in done:
+            # Errors from the writer stop the crawl
+            future.result()
+
+    try:
+        while True:
+            # Retries that are due come first, once the sitemaps are done wait for those due soon
+            url = crawler.next_url()
+            if url is None:
+                if in_flight:
+                    # Pages in flight can still queue retries
+                    finish(FIRST_COMPLETED)
+                else:
+                    pause = crawler.retry_pause()
+                    if pause is None:
+                        break
+                    # Waking up at least every second to flush the journal's last entries
+                    time.sleep(min(pause, 1.0))
+            elif pool is None:
+                process_url(crawler, url, sessions, throttle)
+            else:
+                in_flight.add(pool.submit(process_url, crawler, url, sessions, throttle))
+                if len(in_flight) >= 2 * threads:
+                    finish(FIRST_COMPLETED)
+            if crawler.checkpoint_due:
+                crawler.checkpoint()
+        finish(ALL_COMPLETED)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    crawler.close()
+    sessions.close()
+    print(crawler.frontier.report())
+
+
+async def fetch_async(crawler: Crawler, url: str, sessions: SessionPool, limiter: AdaptiveLimiter,
+                      retry_count: int = 0) -> requests.Response:
+    """
+    Fetch a page with a session of the pool. Raises FetchFailed for error responses,
+    a challenged session sits out until it has new clearance while the others carry on.
+    """
+    pooled = await sessions.acquire()
+    generation = pooled.generation
+    async with limiter:
+        crawler.requesting()
+        start = time.monotonic()
+        try:
+            response = await pooled.session.get(url, headers=crawler.request_headers(url))
+        except requests.RequestsError as e:
+            # Timeouts and resets count as slow responses
+            limiter.record(None, time.monotonic() - start)
+            crawler.metrics.inc('responses_total', status='error')
+            raise FetchFailed(url, reason=str(e)) from e
+        latency = time.monotonic() - start
+    if crawler.check_response(url, response, latency, limiter):
+        crawler.metrics.inc('challenges_total', profile=pooled.profile)
+        await sessions.challenged(pooled, url, generation)
+        if retry_count < MAX_CHALLENGES:
+            crawler.metrics.inc('retries_total', cause='challenge')
+            return await fetch_async(crawler, url, sessions, limiter, retry_count + 1)
+        raise FetchFailed(url, response.status_code, reason='cloudflare challenge')
+    return response
+
+
+async def process_url_async(crawler: Crawler, url: str, sessions: SessionPool,
+                            limiter: AdaptiveLimiter) -> Optional[List[Dict[str, Any]]]:
+    """
+    Fetch and parse one page, returning its recipes for the writer task. None if there is nothing to save,
+    an empty list still has to be saved to mark the page as scraped.
+    """
+    if not crawler.claim(url):
+        return None
+    try:
+        with crawler.metrics.timer('fetch'):
+            response = await fetch_async(crawler, url, sessions, limiter)
+        if crawler.archive is not None:
+            await asyncio.to_thread(crawler.fetched, url, response)
+        else:
+            crawler.fetched(url, response)
+        if response.status_code == 304:
+            crawler.not_modified(url)
+            return None
+        # Recipes saved before are left out while flattening, except in worker processes
+        recipes = await crawler.parse_stage.parse(response.content, response.encoding or 'utf-8',
+                                                  crawler.stored_filter(url))
+    except FetchFailed as e:
+        crawler.fetch_failed(url, e)
+        return None
+    except Exception as e:
+        print(f"Error extracting initial state from {url}: {e}")
+        print(traceback.format_exc())
+        recipes = None
+    if recipes is None:
+        crawler.page_failed(url)
+    return recipes
+
+
+async def produce_urls(crawler: Crawler, url_queue: asyncio.Queue, workers: int):
+    """
+    Feed retries that are due and then the most promising unseen URLs of the frontier to the workers,
+    blocking while the queue is full. Once the frontier is exhausted it waits for retries due soon.
+    """
+    try:
+        while True:
+            url = crawler.next_url(max_scan=1000)
+            if url is not None:
+                await url_queue.put(url)
+            elif crawler.frontier.done:
+                pause = crawler.retry_pause()
+                if pause is None:
+                    break
+                await asyncio.sleep(min(pause, 1.0))
+            else:
+                # Runs of skipped URLs would otherwise never yield to the workers
+                await asyncio.sleep(0)
+    finally:
+        # One sentinel per worker, so every worker shuts down once the sitemaps are exhausted
+        for _ in range(workers):
+            await url_queue.put(None)
+
+
+async def fetch_worker(crawler: Crawler, sessions: SessionPool, limiter: AdaptiveLimiter,
+                       url_queue: asyncio.Queue, result_queue: asyncio.Queue):
+    """Fetch URLs from the queue until the producer is done, handing the recipes to the writer task"""
+    while True:
+        url = await url_queue.get()
+        if url is None:
+            return
+        try:
+            recipes = await process_url_async(crawler, url, sessions, limiter)
+        except Exception as e:
+            print(f"Error processing {url}: {e}")
+            crawler.page_failed(url)
+            continue
+        if recipes is not None:
+            await result_queue.put((url, recipes))
+
+
+async def write_results(crawler: Crawler, result_queue: asyncio.Queue):
+    """
+    Queue recipes coming from the workers for the writer and periodically checkpoint the progress,
+    also while no pages come in (e.g. waiting for retries) so the journal's last entries get flushed
+    """
+    get = None
+    try:
+        while True:
+            # The same get() is awaited again after a timeout, cancelling it could lose a page
+            get = get or asyncio.ensure_future(result_queue.get())
+            done, _ = await asyncio.wait((get,), timeout=1.0)
+            if done:
+                item, get = get.result(), None
+                if item is None:
+                    return
+                url, recipes = item
+                try:
+                    await crawler.save_recipes_async(url, recipes)
+                except Exception as e:
+                    print(f"Error saving recipes from {url}: {e}")
+                    crawler.page_failed(url)
+            if crawler.checkpoint_due:
+                await asyncio.to_thread(crawler.checkpoint)
+    finally:
+        if get is not None:
+            get.cancel()
+
+
+async def crawl_async(crawler: Crawler, max_concurrent: int = 64, initial_concurrency: int = 4,
+                      pool_size: Optional[int] = None, queue_size: Optional[int] = None,
+                      clearance: ClearanceProvider = browser_clearance):
+    """
+    The asyncio and processes backends (which one depends on crawler.parse_stage).
+    max_concurrent is the number of fetch workers and so the most requests that can be in flight.
+    Within that an AIMD limiter starting at initial_concurrency finds the concurrency the origin tolerates.
+    pool_size is the number of connections the requests share (defaults to max_concurrent).
+    queue_size bounds the URLs and pages waiting between stages (defaults to 4 * max_concurrent).
+    """
+    # Sessions sharing the cloudflare clearance, a browser only opens if there are no saved cookies
+    # (or, with fast_start, once a request is challenged)
+    sessions = SessionPool(crawler.cookie_file, pool_size=pool_size or max_concurrent, clearance=clearance)
+    if not crawler.fast_start:
+        await sessions.start()
+    limiter = AdaptiveLimiter(initial=min(initial_concurrency, max_concurrent), maximum=max_concurrent)
+    crawler.start()
+
+    # Sitemap reader -> fetch workers -> writer, bounded queues keep memory flat across sitemaps
+    url_queue = asyncio.Queue(maxsize=queue_size or max_concurrent * 4)
+    result_queue = asyncio.Queue(maxsize=queue_size or max_concurrent * 4)
+
+    metrics = crawler.metrics
+    metrics.gauge('in_flight_requests', lambda: limiter.in_flight)
+    metrics.gauge('concurrency_limit', lambda: limiter.limit)
+    metrics.gauge('url_queue_depth', url_queue.qsize)
+    metrics.gauge('result_queue_depth', result_queue.qsize)
+    metrics.gauge('healthy_sessions', lambda: sum(pooled.healthy for pooled in sessions.sessions))
+
+    results = asyncio.create_task(write_results(crawler, result_queue))
+    workers = [
+        asyncio.create_task(fetch_worker(crawler, sessions, limiter, url_queue, result_queue))
+        for _ in range(max_concurrent)
+    ]
+    # A failed writer would leave the workers blocked on a full result queue, stop the crawl instead
+    crawl = asyncio.current_task()
+    results.add_done_callback(lambda task: task.cancelled() or task.exception() is None or crawl.cancel())
+    try:
+        await produce_urls(crawler, url_queue, len(workers))
+        await asyncio.gather(*workers)
+        await result_queue.put(None)
+        await results
+    except asyncio.CancelledError:
+        if results.done() and not results.cancelled() and results.exception() is not None:
+            raise results.exception()
+        raise
+
+    # cProfile only stops on the thread it profiles
+    crawler.profiler.stop()
+    await asyncio.to_thread(crawler.close)
+    await sessions.close()
+    print(f"Frontier: {crawler.frontier.report()}")
+
+
+def crawl(output_dir: str = 'yummly_recipes', backend: str = 'asyncio', concurrency: Optional[int] = None,
+          clearance: ClearanceProvider = browser_clearance, initial_concurrency: int = 4,
+          pool_size: Optional[int] = None, queue_size: Optional[int] = None, parse_workers: Optional[int] = None,
+          **options):
+    """
+    Crawl Yummly with one of BACKENDS. concurrency is the number of threads or async fetch workers
+    (CONCURRENCY has the defaults), initial_concurrency where their AIMD limit starts. parse_workers is the
+    number of processes of the 'processes' backend (one per core by default), pool_size and queue_size only
+    apply to the async backends, see crawl_async().
+    The other options are passed to Crawler.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, choose from {', '.join(BACKENDS)}")
+    concurrency = concurrency or CONCURRENCY[backend]
+    if backend in ('sequential', 'threads'):
+        crawler = Crawler(output_dir, **options)
+        crawl_sync(crawler, 1 if backend == 'sequential' else concurrency, initial_concurrency, clearance)
+        return
+    # Parsing stays on a thread for 'asyncio', parse_workers=None is one process per core
+    crawler = Crawler(output_dir, parse_workers=0 if backend == 'asyncio' else parse_workers, **options)
+    asyncio.run(crawl_async(crawler, concurrency, initial_concurrency, pool_size, queue_size, clearance))
@@ -0,0 +1,163 @@
+"""
+Change detection for incremental re-crawls (python -m yummly_scraper --refresh).
+
+<output_dir>/changes.sqlite keeps a fingerprint of every stored recipe, a hash of its content without
+VOLATILE_FIELDS (the yums, which change all the time), along with the last values of those fields,
+and the ETag and Last-Modified validators of every page that was saved.
+A refresh sends conditional requests with the validators, so unchanged pages come back as an empty 304.
+Recipes whose content changed are written again, changes of the volatile fields only are appended to
+<output_dir>/deltas.tsv instead of rewriting the recipe:
+
+    <unix time>\t<recipe id>\t<field>\t<new value as JSON>
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+CHANGES_FILE = 'changes.sqlite'
+DELTAS_FILE = 'deltas.tsv'
+VOLATILE_FIELDS = ('yums',)
+
+# What check() found, also the labels of the recipe_changes_total metric
+NEW = 'new'
+CHANGED = 'content'
+VOLATILE = 'volatile'
+UNCHANGED = 'unchanged'
+
+
+def fingerprint(recipe_data: Dict[str, Any]) -> bytes:
+    """128 bit hash of a recipe without its volatile fields, independent of the order of its keys"""
+    stable = {name: value for name, value in recipe_data.items() if name not in VOLATILE_FIELDS}
+    data = json.dumps(stable, sort_keys=True, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def volatile_values(recipe_data: Dict[str, Any]) -> str:
+    return json.dumps({name: recipe_data.get(name) for name in VOLATILE_FIELDS}, sort_keys=True,
+                      separators=(',', ':'))
+
+
+def iter_deltas(output_dir: str) -> Iterator[Tuple[float, str, str, Any]]:
+    """
+    Stream the (time, recipe id, field, value) entries of deltas.tsv in the order they were recorded,
+    applying them to the stored recipes gives their latest state
+    """
+    path = os.path.join(output_dir, DELTAS_FILE)
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                # Partially written by a crash
+                break
+            timestamp, key, field, value = line.rstrip('\n').split('\t', 3)
+            yield float(timestamp), key, field, json.loads(value)
+
+
+class ChangeTracker:
+    """
+    Fingerprints and validators of a crawl, see the module docstring.
+
+    check() and set_validators() run on the writer thread, the validators are looked up by the fetching
+    threads. Both are buffered and written by flush(), which the crawler calls before every journal flush,
+    so they are never ahead of the recipes on disk. Recipes stored before the tracker existed
+    are fingerprinted from stored(id) the first time they are checked.
+    """
+
+    def __init__(self, output_dir: str, stored: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None):
+        self.output_dir = output_dir
+        self.stored = stored
+        self.db = sqlite3.connect(os.path.join(output_dir, CHANGES_FILE), check_same_thread=False, timeout=60)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS recipes (key TEXT PRIMARY KEY, fingerprint BLOB, volatile TEXT) '
+                        'WITHOUT ROWID')
+        self.db.execute('CREATE TABLE IF NOT EXISTS validators (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT) '
+                        'WITHOUT ROWID')
+        self.lock = threading.Lock()
+        self.pending_recipes: Dict[str, Tuple[bytes, str]] = {}
+        self.pending_validators: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        self.deltas = None
+
+    def request_headers(self, url: str) -> Dict[str, str]:
+        """The conditional request headers for a page, empty if it was not saved before"""
+        with self.lock:
+            row = self.pending_validators.get(url)
+            if row is None:
+                row = self.db.execute('SELECT etag, last_modified FROM validators WHERE url = ?', (url,)).fetchone()
+        headers = {}
+        if row is not None:
+            etag, last_modified = row
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def set_validators(self, url: str, etag: Optional[str], last_modified: Optional[str]):
+        """Remember the validators of a page once its recipes are queued for the writer"""
+        if etag or last_modified:
+            with self.lock:
+                self.pending_validators[url] = (etag, last_modified)
+
+    def check(self, key: str, recipe_data: Dict[str, Any]) -> str:
+        """
+        Compare a recipe to its last stored version and remember it: NEW, CHANGED (its content),
+        VOLATILE (only the volatile fields, the changes are appended to the delta log) or UNCHANGED
+        """
+        new = fingerprint(recipe_data), volatile_values(recipe_data)
+        with self.lock:
+            old = self.pending_recipes.get(key)
+            if old is None:
+                old = self.db.execute('SELECT fingerprint, volatile FROM recipes WHERE key = ?', (key,)).fetchone()
+        known = old is not None
+        if old is None and self.stored is not None:
+            stored = self.stored(key)
+            if stored is not None:
+                old = fingerprint(stored), volatile_values(stored)
+
+        if old is None:
+            change = NEW
+        elif old[0] != new[0]:
+            change = CHANGED
+        elif old[1] != new[1]:
+            change = VOLATILE
+            old_values, new_values = json.loads(old[1]), json.loads(new[1])
+            now = int(time.time())
+            if self.deltas is None:
+                self.deltas = open(os.path.join(self.output_dir, DELTAS_FILE), 'a', encoding='utf-8')
+            for field in VOLATILE_FIELDS:
+                if old_values.get(field) != new_values.get(field):
+                    self.deltas.write(f'{now}\t{key}\t{field}\t'
+                                      f'{json.dumps(new_values.get(field), separators=(",", ":"))}\n')
+        else:
+            change = UNCHANGED
+        if change != UNCHANGED or not known:
+            with self.lock:
+                self.pending_recipes[key] = new
+        return change
+
+    def flush(self, fsync: bool = True):
+        """Write the buffered fingerprints and validators and the delta log"""
+        if self.deltas is not None:
+            self.deltas.flush()
+            if fsync:
+                os.fsync(self.deltas.fileno())
+        with self.lock:
+            recipes, self.pending_recipes = self.pending_recipes, {}
+            validators, self.pending_validators = self.pending_validators, {}
+            with self.db:
+                self.db.executemany('INSERT OR REPLACE INTO recipes VALUES (?, ?, ?)',
+                                    ((key, fp, volatile) for key, (fp, volatile) in recipes.items()))
+                self.db.executemany('INSERT OR REPLACE INTO validators VALUES (?, ?, ?)',
+                                    ((url, etag, last_modified) for url, (etag, last_modified) in validators.items()))
+
+    def close(self):
+        self.flush()
+        if self.deltas is not None:
+            self.deltas.close()
+        self.db.close()
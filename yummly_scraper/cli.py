@@ -0,0 +1,67 @@
+"""
+Crawl Yummly recipes from the sitemaps in <output_dir>/sitemaps.
+
+    python -m yummly_scraper yummly_recipes --backend asyncio --concurrency 64 --storage segments
+
+The crawl can be stopped and resumed at any time, also with another backend.
+"""
+import argparse
+
+from yummly_scraper.backends import BACKENDS, CONCURRENCY, crawl
+from yummly_scraper.projection import PROFILES
+from yummly_scraper.seen_index import INDEXES
+from yummly_scraper.store import COMPRESSIONS, STORES
+from yummly_scraper.writer import FSYNC_POLICIES
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m yummly_scraper', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output_dir', nargs='?', default='yummly_recipes')
+    parser.add_argument('--backend', choices=BACKENDS, default='asyncio',
+                        help='how pages are fetched and parsed, see yummly_scraper/backends.py')
+    parser.add_argument('--concurrency', type=int,
+                        help='threads or async fetch workers (default: '
+                             + ', '.join(f'{backend} {n}' for backend, n in CONCURRENCY.items()) + ')')
+    parser.add_argument('--parse-workers', type=int,
+                        help="processes of the 'processes' backend (default: one per core)")
+    parser.add_argument('--storage', choices=STORES, default='segments')
+    parser.add_argument('--compression', choices=COMPRESSIONS, default='gzip', help='of the segment files')
+    parser.add_argument('--index', choices=INDEXES, default='hash', help='how the handled recipe ids are kept')
+    parser.add_argument('--projection', default='full',
+                        help=f"parts of the recipes to store: {', '.join(PROFILES)} or a JSON file of paths")
+    parser.add_argument('--archive', action='store_true', help='also keep every fetched page in <output_dir>/archive')
+    parser.add_argument('--search-index', action='store_true',
+                        help='keep <output_dir>/search.sqlite up to date, see python -m yummly_scraper.search_index')
+    parser.add_argument('--fast-start', action='store_true',
+                        help='start fetching right away: no browser until a request is challenged, '
+                             'progress is loaded in the background')
+    parser.add_argument('--refresh', action='store_true',
+                        help='fetch every page again with conditional requests, rewriting only recipes that changed')
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES, default='checkpoint', help='when recipes are fsynced')
+    parser.add_argument('--flush-interval', type=float, default=1.0,
+                        help='seconds between fsyncs of the progress journal, bounding the progress lost in a crash')
+    parser.add_argument('--report-interval', type=float, default=60.0,
+                        help='seconds between progress reports, retry queue saves and metrics snapshots')
+    parser.add_argument('--retry-failed', action='store_true',
+                        help='only go through the pending retries and the URLs that failed before')
+    parser.add_argument('--retry-wait', type=float, default=600.0,
+                        help='seconds to wait at the end for retries that are due by then')
+    parser.add_argument('--shards', type=int, help='split the crawl between this many workers sharing output_dir')
+    parser.add_argument('--shard', type=int, help='the shard to claim (default: any free one)')
+    parser.add_argument('--coordination', help='coordination store of a sharded crawl '
+                                               '(default: <output_dir>/coordination.sqlite)')
+    parser.add_argument('--metrics-port', type=int, help='serve metrics on http://127.0.0.1:<port>/metrics')
+    parser.add_argument('--metrics-file', help='append a JSON snapshot of the metrics with every progress report')
+    args = parser.parse_args(argv)
+
+    crawl(args.output_dir, backend=args.backend, concurrency=args.concurrency, parse_workers=args.parse_workers,
+          storage=args.storage, compression=args.compression, index=args.index, projection=args.projection,
+          archive=args.archive, search_index=args.search_index, fast_start=args.fast_start, refresh=args.refresh,
+          fsync=args.fsync, flush_interval=args.flush_interval, report_interval=args.report_interval,
+          retry_failed=args.retry_failed, retry_wait=args.retry_wait, shards=args.shards, shard=args.shard,
+          coordination=args.coordination, metrics_port=args.metrics_port, metrics_file=args.metrics_file)
+
+
+if __name__ == '__main__':
+    main()
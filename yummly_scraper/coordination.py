@@ -0,0 +1,194 @@
+import os
+import socket
+import sqlite3
+import time
+from typing import Iterable, Iterator, Optional, Tuple
+
+from yummly_scraper.journal import SCRAPED
+from yummly_scraper.seen_index import key_hash, recipe_key
+
+COORDINATION_FILE = 'coordination.sqlite'
+
+
+class LeaseLost(Exception):
+    """Another worker took over the shard, because this one failed to renew its lease in time"""
+
+
+def jump_hash(h: int, buckets: int) -> int:
+    """
+    Jump consistent hash (Lamping & Veach): maps a 64 bit hash to one of `buckets` shards,
+    moving only 1/n of the keys when the number of shards grows to n.
+    """
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        h = (h * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((h >> 33) + 1)))
+    return b
+
+
+def shard_of(url: str, shards: int) -> int:
+    """The shard that owns a URL, derived from its recipe key so every worker agrees on it"""
+    return jump_hash(key_hash(recipe_key(url)), shards)
+
+
+def _signed(h: int) -> int:
+    # SQLite integers are signed 64 bit
+    return h - (1 << 64) if h >= 1 << 63 else h
+
+
+class CoordinationStore:
+    """
+    SQLite file shared by the workers of a sharded crawl, e.g. on a network share.
+
+    The URLs are split into a fixed number of shards by consistent hashing of their recipe key.
+    A worker claims a shard with a lease that it renews while it works, so a crashed worker's shard
+    can be taken over once the lease expires, and a finished shard is never handed out again.
+    Passes over the finished crawl (a refresh, retrying failed pages) claim the shards once more:
+    `finished` counts the passes that finished a shard, a pass hands out the shards it has not finished yet.
+    Outcomes are published to a table of recipe key hashes that every worker checks before fetching,
+    so recipes found as related recipes by one worker count as done for all of them.
+    Outcomes are batched until flush(), which also renews the lease.
+    """
+
+    def __init__(self, path: str, shards: int, worker_id: Optional[str] = None, lease_seconds: float = 120.0,
+                 batch_size: int = 10000):
+        self.shards = shards
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+        self.lease_seconds = lease_seconds
+        self.batch_size = batch_size
+        self.shard = None
+        # The pass the claimed shard is worked on for, the crawl is the first
+        self.generation = 1
+        self.pending = {}
+        self.last_renew = 0.0
+
+        # Autocommit, transactions are opened explicitly. The rollback journal is kept (no WAL),
+        # because WAL needs shared memory, which network file systems don't provide.
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS leases ('
+                        'shard INTEGER PRIMARY KEY, owner TEXT, expires REAL, finished INTEGER DEFAULT 0)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS done (h INTEGER PRIMARY KEY, status TEXT) WITHOUT ROWID')
+        self.db.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)')
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            self.db.execute("INSERT OR IGNORE INTO meta VALUES ('shards', ?)", (shards,))
+            saved = self.db.execute("SELECT value FROM meta WHERE name = 'shards'").fetchone()[0]
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+        if saved != shards:
+            raise ValueError(f"The coordination store was created for {saved} shards, not {shards}")
+
+    def claim(self, shard: Optional[int] = None, again: bool = False) -> int:
+        """
+        Take the lease on a shard, or on any unfinished shard that nobody holds if shard is None.
+        With again the claim is for another pass over the crawl: a shard that the pass in progress has not
+        finished, or any shard to start the next pass once every shard was finished as often.
+        Raises LookupError if there is nothing to claim.
+        """
+        now = time.time()
+        candidates = range(self.shards) if shard is None else [shard]
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            leases = {row[0]: row[1:] for row in self.db.execute('SELECT shard, owner, expires, finished FROM leases')}
+            passes = [leases.get(candidate, (None, 0, 0))[2] for candidate in range(self.shards)]
+            generation = 1
+            if again:
+                generation = max(passes) if min(passes) < max(passes) else max(passes) + 1
+            if shard is None:
+                # Shards nobody worked on come first, those left unfinished with pending retries after them
+                candidates = sorted(candidates, key=lambda candidate: candidate in leases)
+            for candidate in candidates:
+                owner, expires, finished = leases.get(candidate, (None, 0, 0))
+                if finished >= generation or (owner is not None and owner != self.worker_id and expires > now):
+                    continue
+                self.db.execute('INSERT OR REPLACE INTO leases VALUES (?, ?, ?, ?)',
+                                (candidate, self.worker_id, now + self.lease_seconds, finished))
+                self.db.execute('COMMIT')
+                self.shard = candidate
+                self.generation = generation
+                self.last_renew = time.monotonic()
+                return candidate
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+        if shard is None:
+            raise LookupError("Every shard is finished or leased by another worker")
+        raise LookupError(f"Shard {shard} is finished or leased by another worker")
+
+    def renew(self):
+        """Extend the lease, raises LeaseLost if another worker has taken over the shard"""
+        cursor = self.db.execute('UPDATE leases SET expires = ? WHERE shard = ? AND owner = ?',
+                                 (time.time() + self.lease_seconds, self.shard, self.worker_id))
+        if cursor.rowcount != 1:
+            raise LeaseLost(f"Lost the lease on shard {self.shard}")
+        self.last_renew = time.monotonic()
+
+    def owns(self, url: str) -> bool:
+        return shard_of(url, self.shards) == self.shard
+
+    def owned(self, urls: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, str]]:
+        """Filter (bucket, url) pairs down to the URLs of the claimed shard"""
+        for i, (bucket, url) in enumerate(urls):
+            # Long runs of foreign or seen URLs publish nothing, renew the lease while reading them
+            if i % 10000 == 0:
+                self._renew_if_due()
+            if self.owns(url):
+                yield bucket, url
+
+    def _renew_if_due(self):
+        if self.shard is not None and time.monotonic() - self.last_renew >= self.lease_seconds / 3:
+            self.renew()
+
+    def __contains__(self, key: str) -> bool:
+        """Whether any worker has published an outcome for the recipe key"""
+        h = key_hash(key)
+        if h in self.pending:
+            return True
+        return self.db.execute('SELECT 1 FROM done WHERE h = ?', (_signed(h),)).fetchone() is not None
+
+    def is_scraped(self, key: str) -> bool:
+        """Whether any worker has stored the recipe"""
+        h = key_hash(key)
+        if self.pending.get(h) == SCRAPED:
+            return True
+        row = self.db.execute('SELECT status FROM done WHERE h = ?', (_signed(h),)).fetchone()
+        return row is not None and row[0] == SCRAPED
+
+    def record(self, key: str, status: str = SCRAPED):
+        """Queue the outcome for a recipe key, it is published on the next flush()"""
+        self.pending[key_hash(key)] = status
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Publish pending outcomes and renew the lease when a third of it has passed"""
+        if self.pending:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                # A recipe scraped anywhere stays scraped, a failure never overwrites it
+                self.db.executemany('INSERT INTO done VALUES (?, ?) ON CONFLICT (h) DO UPDATE '
+                                    'SET status = excluded.status WHERE excluded.status = ?',
+                                    ((_signed(h), status, SCRAPED) for h, status in self.pending.items()))
+                self.db.execute('COMMIT')
+            except Exception:
+                self.db.execute('ROLLBACK')
+                raise
+            self.pending = {}
+        self._renew_if_due()
+
+    def finish(self):
+        """Mark the claimed shard as done for the current pass, so it is not handed out again in it"""
+        self.flush()
+        self.db.execute('UPDATE leases SET finished = ? WHERE shard = ? AND owner = ?',
+                        (self.generation, self.shard, self.worker_id))
+
+    def close(self, release: bool = True):
+        self.flush()
+        if release and self.shard is not None:
+            # Expire the lease right away, so a restarted worker does not have to wait for it
+            self.db.execute('UPDATE leases SET expires = 0 WHERE shard = ? AND owner = ?', (self.shard, self.worker_id))
+        self.db.close()
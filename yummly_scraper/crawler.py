@@ -0,0 +1,547 @@
+"""
+The crawl pipeline, shared by every execution backend:
+
+    retry queue / frontier -> fetch -> archive -> parse, flatten and project -> skip stored recipes -> writer
+
+A refresh is a pass over every page again, with conditional requests. Each page's own recipe is handed to
+the writer even though it is stored, which only writes it again if it changed (see yummly_scraper/changes.py).
+
+A Crawler holds the state of one crawl and implements each step of the pipeline. The backends in
+yummly_scraper/backends.py only decide how the steps are run: one page at a time, on a thread pool,
+on an event loop, or on an event loop that parses in a process pool.
+"""
+import os
+import shutil
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from curl_cffi import requests
+
+from yummly_scraper import STARTED
+from yummly_scraper.archive import ResponseArchive
+from yummly_scraper.changes import ChangeTracker
+from yummly_scraper.coordination import COORDINATION_FILE, CoordinationStore
+from yummly_scraper.initial_state import response_title
+from yummly_scraper.journal import FAILED, SCRAPED, ProgressJournal
+from yummly_scraper.metrics import RECIPE_BUCKETS, Metrics, Profiler
+from yummly_scraper.parse_stage import ParseStage
+from yummly_scraper.projection import load_projection
+from yummly_scraper.retry import FetchFailed, RetryQueue, classify
+from yummly_scraper.scheduler import Frontier, sitemap_buckets
+from yummly_scraper.search_index import SEARCH_INDEX_FILE, SearchIndex
+from yummly_scraper.seen_index import SeenIndex, open_index, recipe_key
+from yummly_scraper.sessions import COOKIE_FILE
+from yummly_scraper.sitemap import is_sitemap_file, iter_sitemap_urls
+from yummly_scraper.store import open_store
+from yummly_scraper.throttle import parse_retry_after
+from yummly_scraper.writer import RecipeWriter
+
+REFRESH_DIR = 'refresh'
+
+
+def fetch_sitemap(sitemap: str) -> Iterator[str]:
+    """
+    Stream the URLs of a Yummly sitemap (plain or gzipped XML)
+    """
+    try:
+        yield from iter_sitemap_urls(sitemap)
+    except Exception as e:
+        print(f"Error reading sitemap {sitemap}: {e}")
+
+
+def iter_sitemaps(sitemap_dir: str) -> Iterator[Tuple[str, str]]:
+    """
+    Stream (bucket, url) pairs from every sitemap in sitemap_dir, for the frontier
+    """
+    for sitemap in sorted(filter(is_sitemap_file, os.listdir(sitemap_dir))):
+        print(f"Processing sitemap: {sitemap}")
+        yield from sitemap_buckets(sitemap, fetch_sitemap(os.path.join(sitemap_dir, sitemap)))
+
+
+class Crawler:
+    """
+    The state of one crawl and the steps every backend runs for a URL:
+
+        url = crawler.next_url()
+        if crawler.claim(url):
+            try:
+                response = <fetch url with crawler.request_headers(url), checked with crawler.check_response()>
+                crawler.fetched(url, response)
+                if response.status_code == 304:
+                    crawler.not_modified(url)
+                else:
+                    recipes = <crawler.parse_stage.parse(...) or parse_sync(..., crawler.stored_filter(url))>
+                    # None without recipes, [] when all of them were stored by other pages since the claim
+                    crawler.page_failed(url) if recipes is None else crawler.save_recipes(url, recipes)
+            except FetchFailed as e:
+                crawler.fetch_failed(url, e)
+        crawler.checkpoint() whenever crawler.checkpoint_due
+
+    Steps that touch the indexes, the frontier or the retry queue hold `lock`, so they can be called
+    from any number of threads. It is reentrant and never held while waiting on the network or the writer,
+    on an event loop it is only ever contended by checkpoint() running in a thread.
+    Recorded keys go into their index on the writer thread, behind the recipes queued before them, until then
+    they are pending. So a compaction on the writer thread only saves keys whose recipes were written.
+    The options are those of python -m yummly_scraper, see yummly_scraper/cli.py.
+    """
+
+    def __init__(self, output_dir: str = 'yummly_recipes', index: str = 'hash', storage: str = 'segments',
+                 compression: str = 'gzip', shards: Optional[int] = None, shard: Optional[int] = None,
+                 coordination: Optional[str] = None, metrics_port: Optional[int] = None,
+                 metrics_file: Optional[str] = None, archive: bool = False, projection: str = 'full',
+                 fsync: str = 'checkpoint', flush_interval: float = 1.0, retry_failed: bool = False,
+                 retry_wait: float = 600.0, parse_workers: Optional[int] = 0, report_interval: float = 60.0,
+                 search_index: bool = False, fast_start: bool = False, refresh: bool = False):
+        if refresh and retry_failed:
+            raise ValueError("A refresh can not be combined with retrying failed pages")
+        os.makedirs(output_dir, exist_ok=True)
+        self.metrics = Metrics()
+        if metrics_port is not None:
+            self.metrics.serve(metrics_port)
+        self.metrics_file = metrics_file
+        self.sitemap_dir = os.path.join(output_dir, 'sitemaps')
+
+        # In a sharded crawl every worker owns part of the URLs and its own progress
+        self.coordinator = None
+        if shards:
+            self.coordinator = CoordinationStore(coordination or os.path.join(output_dir, COORDINATION_FILE), shards)
+            # A refresh or a retry of the failed pages is another pass over the shards of the crawl
+            shard = self.coordinator.claim(shard, again=refresh or retry_failed)
+            print(f"Claimed shard {shard} of {shards}")
+            output_dir = os.path.join(output_dir, f'shard-{shard:03d}')
+            os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.cookie_file = os.path.join(output_dir, COOKIE_FILE)
+        self.store = open_store(storage, output_dir, compression)
+        self.search_index = SearchIndex(os.path.join(output_dir, SEARCH_INDEX_FILE)) if search_index else None
+        # Validators are kept in every crawl, so the first refresh can already send conditional requests
+        self.changes = ChangeTracker(output_dir, self.store.get)
+        self.refresh = refresh
+        self.writer = RecipeWriter(self.store, fsync=fsync, metrics=self.metrics, search_index=self.search_index,
+                                   changes=self.changes if refresh else None)
+        self.archive = ResponseArchive(output_dir) if archive else None
+        self.parse_stage = ParseStage(parse_workers, self.metrics, load_projection(projection))
+
+        # Load progress
+        self.lock = threading.RLock()
+        self.scraped = open_index(index, os.path.join(output_dir, 'scraped'))
+        self.failed = open_index(index, os.path.join(output_dir, 'failed'))
+        # Recorded keys not yet in their index, by the index they go into
+        self.pending: Dict[str, SeenIndex] = {}
+        self.journal = ProgressJournal(output_dir, flush_interval=flush_interval, before_flush=self._before_flush)
+        self.fast_start = fast_start
+        self.loaded = threading.Event()
+        self.load_error: Optional[BaseException] = None
+        if fast_start and not self.journal.legacy:
+            # Start from the snapshots and replay the journal in the background, the crawl can go on meanwhile.
+            # Until it is done a page recorded only in the journal can be fetched again, which is harmless.
+            end = self.journal.recover(self.scraped, self.failed)
+            self.journal.open()
+            threading.Thread(target=self._replay_journal, args=(end,), name='progress-loader', daemon=True).start()
+        else:
+            self.journal.load(self.scraped, self.failed)
+            self.loaded.set()
+        self.retries = RetryQueue(output_dir)
+        self.retries.load()
+        self.retry_failed = retry_failed
+        self.retry_wait = retry_wait
+        # The validators of pages fetched but not yet saved
+        self.validators: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+
+        # A refresh pass has its own progress, so it can be stopped and resumed like the crawl
+        self.refresh_dir = os.path.join(output_dir, REFRESH_DIR)
+        self.refresh_journal: Optional[ProgressJournal] = None
+        if refresh:
+            os.makedirs(self.refresh_dir, exist_ok=True)
+            self.refreshed = open_index(index, os.path.join(self.refresh_dir, 'scraped'))
+            self.refresh_failed = open_index(index, os.path.join(self.refresh_dir, 'failed'))
+            self.refresh_pending: Dict[str, SeenIndex] = {}
+            self.refresh_journal = ProgressJournal(self.refresh_dir, flush_interval=flush_interval,
+                                                   before_flush=self._before_flush)
+            self.refresh_journal.load(self.refreshed, self.refresh_failed)
+            if len(self.refreshed) or len(self.refresh_failed):
+                print(f"Resuming refresh: {len(self.refreshed)} pages refreshed, {len(self.refresh_failed)} failed")
+
+        # Hand out URLs by how many unseen recipes their neighbours produced, skipping covered ones
+        urls = iter_sitemaps(self.sitemap_dir)
+        if self.coordinator is not None:
+            urls = self.coordinator.owned(urls)
+        if refresh:
+            # Every page once more, whether it was scraped, covered as a related recipe or failed before
+            seen = lambda url: self.is_refreshed(recipe_key(url))
+        elif retry_failed:
+            # Everything but the URLs that failed and were not covered since
+            seen = lambda url: recipe_key(url) not in self.failed or self.is_stored(recipe_key(url))
+        else:
+            seen = lambda url: self.is_seen(recipe_key(url))
+        self.frontier = Frontier(urls, seen)
+
+        self.report_interval = report_interval
+        self.start_time = time.time()
+        self.reported_at = self.start_time
+        self.reported: Dict[str, float] = {}
+        self.profiler = Profiler(output_dir)
+        self.first_request: Optional[float] = None
+        self.metrics.gauge('write_queue_depth', lambda: self.writer.pending)
+        self.metrics.gauge('pending_retries', lambda: len(self.retries))
+        self.metrics.gauge('frontier_urls', lambda: self.frontier.size)
+        self.metrics.gauge('frontier_skipped_urls', lambda: self.frontier.skipped)
+        self.metrics.gauge('given_up_retries', lambda: self.retries.given_up)
+
+    def _replay_journal(self, end: int):
+        start = time.monotonic()
+        try:
+            self.journal.replay(self.scraped, self.failed, end, self.lock)
+        except BaseException as e:
+            # The journal keeps its entries, they are replayed by the next run
+            print(f"Error loading the progress journal, it will not be compacted: {e}")
+            self.load_error = e
+        else:
+            self.metrics.set('progress_load_seconds', time.monotonic() - start)
+            print(f"Loaded progress in {time.monotonic() - start:.1f} seconds: "
+                  f"{len(self.scraped)} scraped, {len(self.failed)} failed")
+        finally:
+            self.loaded.set()
+
+    def _before_flush(self):
+        # Recipes have to be on disk before the journal marks them as scraped or other workers learn about them.
+        # The journal is flushed on the writer thread, after the recipes queued before its entries.
+        self.writer.checkpoint()
+        self.changes.flush(fsync=self.writer.fsync != 'never')
+        if self.archive is not None:
+            self.archive.flush(fsync=True)
+        if self.coordinator is not None:
+            self.coordinator.flush()
+
+    def start(self):
+        """Called by the backend on the main thread before the first request"""
+        self.profiler.install()
+
+    def requesting(self):
+        """Called before every request, reports how long the first one took to go out"""
+        if self.first_request is None:
+            with self.lock:
+                if self.first_request is None:
+                    self.first_request = time.monotonic() - STARTED
+                    self.metrics.set('time_to_first_request_seconds', self.first_request)
+                    print(f"First request {self.first_request:.2f} seconds after startup")
+
+    def is_seen(self, key: str) -> bool:
+        """Whether a recipe key was handled already, by this worker or by any worker of a sharded crawl"""
+        with self.lock:
+            if key in self.pending or key in self.scraped or key in self.failed:
+                return True
+            return self.coordinator is not None and key in self.coordinator
+
+    def is_stored(self, key: str) -> bool:
+        """Whether a recipe was saved already, by this worker or by any worker of a sharded crawl"""
+        with self.lock:
+            if self.pending.get(key) is self.scraped or key in self.scraped:
+                return True
+            return self.coordinator is not None and self.coordinator.is_scraped(key)
+
+    def is_refreshed(self, key: str) -> bool:
+        """Whether a recipe key was handled already in this refresh pass"""
+        with self.lock:
+            return key in self.refresh_pending or key in self.refreshed or key in self.refresh_failed
+
+    def stored_filter(self, url: str) -> Callable[[str], bool]:
+        """The is_stored() check that leaves recipes out while parsing a page, in a refresh not its own recipe"""
+        if not self.refresh:
+            return self.is_stored
+        own = recipe_key(url)
+        return lambda key: key != own and self.is_stored(key)
+
+    @staticmethod
+    def _add_pending(pending: Dict[str, SeenIndex], key: str, status: str, scraped: SeenIndex, failed: SeenIndex):
+        # Called holding the lock. A key stored meanwhile stays stored if its page fails.
+        if status == SCRAPED:
+            pending[key] = scraped
+        elif pending.get(key) is not scraped:
+            pending[key] = failed
+
+    def _add(self, pending: Dict[str, SeenIndex], key: str, index: SeenIndex):
+        # On the writer thread, once the recipes queued before are written
+        with self.lock:
+            index.add(key)
+            if pending.get(key) is index:
+                del pending[key]
+
+    def _publish(self, key: str, status: str):
+        self._add(self.pending, key, self.scraped if status == SCRAPED else self.failed)
+        self.journal.record(key, status)
+        if self.coordinator is not None:
+            self.coordinator.record(key, status)
+
+    def _publish_refresh(self, key: str, status: str):
+        self._add(self.refresh_pending, key, self.refreshed if status == SCRAPED else self.refresh_failed)
+        self.refresh_journal.record(key, status)
+
+    def record(self, key: str, status: str):
+        """
+        Mark a key as seen right away. It goes into its index, is journaled and published to the other workers
+        of a sharded crawl once the recipes queued before it are written.
+        """
+        with self.lock:
+            self._add_pending(self.pending, key, status, self.scraped, self.failed)
+        self.writer.defer(self._publish, key, status)
+
+    def record_refresh(self, key: str, status: str):
+        """record() for the progress of a refresh pass"""
+        if self.refresh_journal is None:
+            return
+        with self.lock:
+            self._add_pending(self.refresh_pending, key, status, self.refreshed, self.refresh_failed)
+        self.writer.defer(self._publish_refresh, key, status)
+
+    def next_url(self, max_scan: Optional[int] = None) -> Optional[str]:
+        """
+        A retry that is due, otherwise the most promising URL of the frontier. None if there is neither,
+        or if max_scan skipped URLs were read from the sitemaps without finding one (check frontier.done).
+        """
+        with self.lock:
+            url = self.retries.pop_due(ignore_delay=self.retry_failed)
+            if url is None:
+                url = self.frontier.next(max_scan)
+            return url
+
+    def retry_pause(self) -> Optional[float]:
+        """
+        Once the frontier is exhausted: seconds until the next retry is due, or None when the crawl is over
+        because no retry is due within retry_wait. Later ones are left in the retry queue for the next run.
+        """
+        with self.lock:
+            wait = self.retries.next_due()
+        if wait is None or wait > self.retry_wait:
+            return None
+        return wait
+
+    def claim(self, url: str) -> bool:
+        """
+        Whether a URL handed out still has to be fetched. Related recipes of earlier pages may have covered it
+        since it was queued, when retrying failed pages only the stored ones are done, in a refresh only the
+        pages handled in this pass.
+        """
+        key = recipe_key(url)
+        with self.lock:
+            if self.refresh:
+                done = self.is_refreshed(key)
+            elif self.retry_failed:
+                done = self.is_stored(key)
+            else:
+                done = self.is_seen(key)
+            if done:
+                self.frontier.discard(url)
+                self.retries.remove(url)
+                return False
+        return True
+
+    def check_response(self, url: str, response: requests.Response, latency: float, throttle) -> bool:
+        """
+        Count a response and feed its outcome to the throttle (an AdaptiveDelay or an AIMDLimit).
+        Raises FetchFailed for error responses, they are retried later by the retry queue instead of
+        holding on to a worker. Returns whether cloudflare challenged the request.
+        A 304 Not Modified answers a conditional request of a refresh, see request_headers().
+        """
+        self.metrics.observe('fetch_seconds', latency)
+        self.metrics.inc('responses_total', status=response.status_code)
+        self.metrics.inc('downloaded_bytes_total', len(response.content))
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        if response.status_code not in (200, 304):
+            # Pushback also holds back every other request
+            throttle.record(response.status_code, latency, retry_after)
+            raise FetchFailed(url, response.status_code, retry_after)
+        challenged = response.status_code == 200 and not "yummly" in response_title(response.content).lower()
+        throttle.record(response.status_code, latency, retry_after, challenged=challenged)
+        return challenged
+
+    def request_headers(self, url: str) -> Optional[Dict[str, str]]:
+        """In a refresh, the headers that make the request for a page conditional on its last validators"""
+        if not self.refresh:
+            return None
+        return self.changes.request_headers(url) or None
+
+    def fetched(self, url: str, response: requests.Response):
+        """A page came back, keep it in the archive if there is one and its validators until it is saved"""
+        etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        with self.lock:
+            self.retries.remove(url)
+            if response.status_code == 200 and (etag or last_modified):
+                self.validators[url] = etag, last_modified
+        if self.archive is not None and response.status_code == 200:
+            with self.metrics.timer('archive'):
+                self.archive.write(url, response.status_code, dict(response.headers), response.content)
+
+    def not_modified(self, url: str):
+        """A page of a refresh did not change since it was last fetched, nothing to parse"""
+        with self.lock:
+            self.frontier.observe(url, 0)
+        self.record_refresh(recipe_key(url), SCRAPED)
+        self.metrics.inc('pages_total', outcome='unchanged')
+
+    def fetch_failed(self, url: str, failure: FetchFailed):
+        """Queue a retry for a transient failure, record permanent ones and URLs out of attempts as failed"""
+        with self.lock:
+            if self.retries.schedule(failure):
+                self.frontier.observe(url, 0)
+                self.metrics.inc('pages_total', outcome='retry')
+                self.metrics.inc('retries_total', cause=failure.status or 'error')
+                return
+        print(f"Failed to get {failure}, giving up ({classify(failure.status)})")
+        self.page_failed(url)
+
+    def page_failed(self, url: str):
+        """A page that has no recipes or could not be processed"""
+        with self.lock:
+            self.frontier.observe(url, 0)
+            self.validators.pop(url, None)
+        self.record(recipe_key(url), FAILED)
+        self.record_refresh(recipe_key(url), FAILED)
+        self.metrics.inc('pages_total', outcome='failed')
+
+    def _new_recipes(self, url: str, recipes: List[Dict[str, Any]]
+                     ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        # Popular recipes are related to thousands of pages, they are only written the first time.
+        # New ones are pending before they are queued, so another thread's page can't write them again.
+        # In a refresh the page's own recipe is returned as well if it is stored, the writer checks it for changes.
+        self.metrics.observe('recipes_per_page', len(recipes), buckets=RECIPE_BUCKETS)
+        own = recipe_key(url) if self.refresh else None
+        new, refreshed = [], []
+        with self.lock:
+            for recipe_data in recipes:
+                if self.is_stored(recipe_data.get('id')):
+                    if recipe_data.get('id') == own:
+                        refreshed.append(recipe_data)
+                    continue
+                self.pending[recipe_data.get('id')] = self.scraped
+                new.append(recipe_data)
+        self.metrics.inc('recipes_total', len(recipes) - len(new) - len(refreshed), outcome='duplicate')
+        self.metrics.inc('recipes_total', len(new), outcome='new')
+        if refreshed:
+            self.metrics.inc('recipes_total', len(refreshed), outcome='refreshed')
+        return new, refreshed
+
+    def _page_saved(self, url: str, new_recipes: int):
+        self.record(recipe_key(url), SCRAPED)
+        self.record_refresh(recipe_key(url), SCRAPED)
+        self.metrics.inc('pages_total', outcome='scraped')
+        with self.lock:
+            self.frontier.observe(url, new_recipes)
+            validators = self.validators.pop(url, None)
+        if validators is not None:
+            # Behind the page's recipes, a crash before they are written must not make the next refresh skip it
+            self.writer.defer(self.changes.set_validators, url, *validators)
+
+    def save_recipes(self, url: str, recipes: List[Dict[str, Any]]):
+        """
+        Queue the recipes of a page that are not stored yet for the writer, they are serialized and written
+        behind the crawl. Only waits when the writer falls max_pending recipes behind.
+        """
+        new, refreshed = self._new_recipes(url, recipes)
+        for recipe_data in new:
+            self.writer.put(recipe_data.get('id'), recipe_data)
+            self.writer.defer(self._publish, recipe_data.get('id'), SCRAPED)
+        for recipe_data in refreshed:
+            self.writer.put(recipe_data.get('id'), recipe_data)
+        self._page_saved(url, len(new))
+
+    async def save_recipes_async(self, url: str, recipes: List[Dict[str, Any]]):
+        """save_recipes() for the event loop"""
+        new, refreshed = self._new_recipes(url, recipes)
+        for recipe_data in new:
+            await self.writer.put_async(recipe_data.get('id'), recipe_data)
+            self.writer.defer(self._publish, recipe_data.get('id'), SCRAPED)
+        for recipe_data in refreshed:
+            await self.writer.put_async(recipe_data.get('id'), recipe_data)
+        self._page_saved(url, len(new))
+
+    @property
+    def checkpoint_due(self) -> bool:
+        """Whether a report is due, or a journal has entries that were not flushed for flush_interval seconds"""
+        if time.time() - self.reported_at > self.report_interval or self.journal.flush_due:
+            return True
+        return self.refresh_journal is not None and self.refresh_journal.flush_due
+
+    def checkpoint(self, compact: bool = False):
+        """
+        Save the progress, and every report_interval seconds report what happened since the last report.
+        The journal is flushed on the writer thread, behind the recipes it marks as scraped, and folded into
+        the snapshots once it grew large.
+        """
+        # Compacting before the journal is replayed would lose the entries that are not yet in the indexes
+        if (compact or self.journal.needs_compaction()) and self.loaded.is_set() and self.load_error is None:
+            print("Compacting progress journal...")
+            # Only the writer adds to the indexes, the lock keeps the other threads out while they are saved
+            self.writer.defer(self.journal.compact, self.scraped, self.failed, self.lock).result()
+        else:
+            self.writer.defer(self.journal.flush).result()
+        if self.refresh_journal is not None:
+            if compact or self.refresh_journal.needs_compaction():
+                self.writer.defer(self.refresh_journal.compact, self.refreshed, self.refresh_failed,
+                                  self.lock).result()
+            else:
+                self.writer.defer(self.refresh_journal.flush).result()
+        if compact or time.time() - self.reported_at > self.report_interval:
+            self.reported_at = time.time()
+            with self.lock:
+                self.retries.save()
+            self.report()
+
+    def report(self):
+        """Print what happened since the last report and append a metrics snapshot if configured"""
+        totals = {outcome: self.metrics.total('pages_total', outcome=outcome)
+                  for outcome in ('scraped', 'unchanged', 'failed', 'retry')}
+        totals['recipes'] = self.metrics.total('recipes_total', outcome='new')
+        totals['skipped'] = self.frontier.skipped
+        totals['given_up'] = self.retries.given_up
+        delta = {name: value - self.reported.get(name, 0) for name, value in totals.items()}
+        self.reported = totals
+        if self.metrics_file:
+            self.metrics.write_snapshot(self.metrics_file)
+        unchanged = f"Unchanged {delta['unchanged']:g}, " if self.refresh else ''
+        print(f"Progress: Scraped {delta['recipes']:g} recipes from {delta['scraped']:g} pages, {unchanged}"
+              f"Failed {delta['failed']:g}, Skipped {delta['skipped']:g}, Retrying {delta['retry']:g} "
+              f"({len(self.retries)} pending, gave up on {delta['given_up']:g}), {self.frontier.report()}")
+
+    def close(self):
+        """Save the final progress, write everything queued and close the stores"""
+        self.loaded.wait()
+        self.checkpoint(compact=True)
+        if self.coordinator is not None:
+            if len(self.retries):
+                # Another worker picks the shard up with its retries
+                print(f"Leaving shard {self.coordinator.shard} unfinished with {len(self.retries)} pending retries")
+            else:
+                self.coordinator.finish()
+            self.coordinator.close()
+        self.parse_stage.close()
+        self.writer.close()
+        self.journal.close()
+        if self.refresh_journal is not None:
+            self.refresh_journal.close()
+        self.retries.close()
+        self.changes.close()
+        self.store.close()
+        if self.search_index is not None:
+            self.search_index.close()
+        if self.archive is not None:
+            self.archive.close()
+        self.scraped.close()
+        self.failed.close()
+        if self.refresh_journal is not None:
+            self.refreshed.close()
+            self.refresh_failed.close()
+            if self.frontier.done and not len(self.retries):
+                # The next refresh starts a new pass
+                shutil.rmtree(self.refresh_dir)
+                print(f"Refresh pass complete: {self.metrics.total('pages_total', outcome='unchanged'):g} pages "
+                      f"unchanged, {self.metrics.total('recipe_changes_total', change='content'):g} recipes changed, "
+                      f"{self.metrics.total('recipe_changes_total', change='volatile'):g} yums updates")
+        self.profiler.stop()
+        if self.metrics_file:
+            self.metrics.write_snapshot(self.metrics_file)
+        self.metrics.close()
+        print(f"Final stats: Scraped {len(self.scraped)}, Failed {len(self.failed)}, "
+              f"Skipped {self.frontier.skipped}, Retries pending {len(self.retries)}, "
+              f"given up {self.retries.given_up}. Took {time.time() - self.start_time:.0f} seconds.")
@@ -0,0 +1,204 @@
+import html
+import json
+import re
+import urllib.parse
+from typing import TYPE_CHECKING, Sequence
+
+from yummly_scraper.stream_decode import decode_state
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
+
+STATE_MARKER = b'window.__INITIAL_STATE__'
+# The parts of the state the recipes are extracted from, see yummly_scraper/recipes.py
+STATE_KEYS = ('recipe', 'yums', 'yumsObject')
+
+_TITLE_RE = re.compile(rb'<title\b[^>]*>(.*?)</title\s*>', re.IGNORECASE | re.DOTALL)
+_ASSIGN_RE = re.compile(rb'\s*=\s*"\s*')
+_STATE_RE = re.compile(r'window\.__INITIAL_STATE__\s*=\s*\"\s*(.+)\"')
+
+
+def page_title(content: bytes) -> str | None:
+    """
+    Return the text of the first <title> tag by scanning the raw response bytes.
+    Returns None if the title can not be found without a full parse.
+    """
+    match = _TITLE_RE.search(content)
+    if not match:
+        return None
+    raw = match.group(1)
+    if b'<' in raw:
+        # Markup inside the title, let BeautifulSoup deal with it
+        return None
+    return html.unescape(raw.decode('utf-8', 'replace')).strip()
+
+
+def parse_html(content: bytes, encoding: str = 'utf-8') -> 'BeautifulSoup':
+    """
+    Full parse of a page. bs4 is only imported once a page needs it, which the fast scans mostly avoid.
+    """
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(content.decode(encoding, 'replace'), 'html.parser')
+
+
+def soup_title(soup: 'BeautifulSoup') -> str:
+    """
+    Title of an already parsed page, empty if it has none
+    """
+    if soup.title is None or soup.title.string is None:
+        return ''
+    return soup.title.string
+
+
+def response_title(content: bytes, encoding: str = 'utf-8') -> str:
+    """
+    Title of a response body, only parsing the whole page if the fast scan fails
+    """
+    title = page_title(content)
+    if title is None:
+        title = soup_title(parse_html(content, encoding))
+    return title
+
+
+def find_state_span(content: bytes) -> tuple[int, int] | None:
+    """
+    Locate the percent-encoded window.__INITIAL_STATE__ string in the raw response bytes, as (start, end) offsets.
+    Returns None if the page does not look like a regular recipe page,
+    callers should fall back to find_state_payload_soup in that case.
+    """
+    start = content.find(STATE_MARKER)
+    if start == -1 or content.find(STATE_MARKER, start + 1) != -1:
+        return None
+
+    # The assignment has to be the first statement of its <script> tag
+    script_open = content.rfind(b'<script', 0, start)
+    if script_open == -1:
+        return None
+    tag_end = content.find(b'>', script_open, start)
+    if tag_end == -1 or content[tag_end + 1:start].strip():
+        return None
+
+    assign = _ASSIGN_RE.match(content, start + len(STATE_MARKER))
+    if not assign:
+        return None
+    payload_start = assign.end()
+    payload_end = content.find(b'"', payload_start)
+    if payload_end == -1:
+        return None
+
+    # Percent-encoded JSON never contains these, anything else is an unusual page
+    if payload_start == payload_end:
+        return None
+    for unusual in (b'\\', b'<', b'\n'):
+        if content.find(unusual, payload_start, payload_end) != -1:
+            return None
+    return payload_start, payload_end
+
+
+def find_state_payload_soup(soup: 'BeautifulSoup') -> str | None:
+    """
+    Locate the window.__INITIAL_STATE__ string in a fully parsed page
+    """
+    initial_state = None
+    for script in soup.find_all('script'):
+        strings = list(script.stripped_strings)
+        if len(strings) == 0:
+            continue
+        if "window.__INITIAL_STATE__" in strings[0]:
+            initial_state = strings[0]
+            break
+
+    if not initial_state:
+        print("Could not find window.__INITIAL_STATE__ in the page")
+        return None
+
+    # Use regex to find the __INITIAL_STATE__ script
+    initial_state_match = _STATE_RE.search(initial_state)
+    if not initial_state_match:
+        print("Could not extract __INITIAL_STATE__ from the page")
+        return None
+
+    return initial_state_match.group(1)
+
+
+def decode_state_payload(payload: bytes | str) -> str:
+    """
+    URL decode the initial state
+    """
+    if isinstance(payload, str):
+        return urllib.parse.unquote(payload)
+    return urllib.parse.unquote_to_bytes(payload).decode('utf-8', 'replace')
+
+
+def parse_initial_state(content: bytes, encoding: str = 'utf-8',
+                        keys: Sequence[str] | None = STATE_KEYS) -> dict | None:
+    """
+    Extract the window.__INITIAL_STATE__ content from the body of a Yummly recipe page.
+    Uses a fast scan of the raw bytes, falling back to BeautifulSoup for unusual pages.
+    Only the top level keys are kept, by default those the recipes are extracted from: the payload is then
+    decoded as a stream from a memoryview over content and the other parts of the state are skipped
+    without building them. keys=None decodes and returns the whole state.
+    """
+    if 'error' in response_title(content, encoding).lower():
+        print("Error page detected")
+        return None
+
+    span = find_state_span(content)
+    if span is not None and keys is not None:
+        try:
+            initial_state = decode_state(memoryview(content)[span[0]:span[1]], keys)
+        except ValueError as e:
+            print(f"Error decoding JSON: {e}")
+            print("Problematic JSON string:", decode_state_payload(content[span[0]:span[0] + 3000])[:1000])
+            return None
+    else:
+        if span is not None:
+            payload = content[span[0]:span[1]]
+        else:
+            soup = parse_html(content, encoding)
+            payload = find_state_payload_soup(soup)
+            if payload is None:
+                return None
+
+        decoded_initial_state = decode_state_payload(payload)
+
+        # Parse the JSON
+        try:
+            initial_state = json.loads(decoded_initial_state)
+        except json.JSONDecodeError as e:
+            print(f"Error decoding JSON: {e}")
+            print("Problematic JSON string:", decoded_initial_state[:1000])  # Print first 1000 chars for debugging
+            return None
+        if keys is not None:
+            initial_state = {key: initial_state[key] for key in keys if key in initial_state}
+
+    # Extract the recipe data
+    recipe_data = initial_state.get('recipe')
+    message = recipe_data.get('message') if recipe_data else None
+    if recipe_data and not (message and message.startswith("recipe not found")):
+        return initial_state
+
+    print("No recipe data found in __INITIAL_STATE__")
+    return None
+
+
+def parse_initial_state_soup(content: bytes, encoding: str = 'utf-8') -> dict | None:
+    """
+    Reference implementation that always takes the full BeautifulSoup path.
+    Kept for benchmarking the fast extractor against.
+    """
+    soup = parse_html(content, encoding)
+    if 'error' in soup_title(soup).lower():
+        return None
+    payload = find_state_payload_soup(soup)
+    if payload is None:
+        return None
+    try:
+        initial_state = json.loads(decode_state_payload(payload))
+    except json.JSONDecodeError:
+        return None
+    recipe_data = initial_state.get('recipe')
+    message = recipe_data.get('message') if recipe_data else None
+    if recipe_data and not (message and message.startswith("recipe not found")):
+        return initial_state
+    return None
@@ -0,0 +1,167 @@
+import contextlib
+import os
+import time
+from typing import Callable, ContextManager, Optional
+
+from yummly_scraper.seen_index import SeenIndex, recipe_key
+from yummly_scraper.sitemap import normalize_url
+
+SCRAPED = 'S'
+FAILED = 'F'
+
+SCRAPED_FILE = 'scraped_urls.txt'
+FAILED_FILE = 'failed_urls.txt'
+JOURNAL_FILE = 'progress.journal'
+
+
+class ProgressJournal:
+    """
+    Append-only log of recipe key outcomes on top of the snapshots of the scraped and failed seen indexes.
+
+    Every outcome is appended once, so a checkpoint costs the same no matter how far the crawl is.
+    The journal is fsynced every flush_interval seconds, which bounds the work lost in a crash. Entries are only
+    flushed by the next record() or an explicit flush(), flush_due tells when an idle journal has to be flushed.
+    Once it holds compact_every entries it is folded back into the snapshots.
+    before_flush is called ahead of every flush, so whatever the journal marks as done
+    (e.g. buffered recipes) can be made durable first.
+    """
+
+    def __init__(self, output_dir: str, flush_interval: float = 1.0, compact_every: int = 1_000_000,
+                 before_flush: Optional[Callable[[], None]] = None):
+        self.output_dir = output_dir
+        self.before_flush = before_flush
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+        self.entries = 0
+        self.last_flush = time.monotonic()
+        self.unflushed = False
+        self.file = None
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.output_dir, name)
+
+    @property
+    def legacy(self) -> bool:
+        """Before the journal existed progress was kept as lists of URLs"""
+        return not os.path.exists(self.path(JOURNAL_FILE))
+
+    def load(self, scraped: SeenIndex, failed: SeenIndex):
+        """
+        Load the index snapshots and replay the journal into them, then open the journal for appending
+        """
+        if self.legacy:
+            self._read_legacy(SCRAPED_FILE, scraped)
+            self._read_legacy(FAILED_FILE, failed)
+            self.compact(scraped, failed)
+            return
+        self.replay(scraped, failed, self.recover(scraped, failed))
+        if self.needs_compaction():
+            self.compact(scraped, failed)
+        else:
+            self.open()
+
+    def recover(self, scraped: SeenIndex, failed: SeenIndex) -> int:
+        """
+        Load the index snapshots and cut off a partially written last entry, without replaying the journal.
+        Returns where the entries to replay() end, once the journal is open() new ones are appended after that.
+        """
+        scraped.load()
+        failed.load()
+        path = self.path(JOURNAL_FILE)
+        size = end = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            # A crash can leave a partially written last line behind
+            while end:
+                start = max(end - 4096, 0)
+                f.seek(start)
+                newline = f.read(end - start).rfind(b'\n')
+                if newline != -1:
+                    end = start + newline + 1
+                    break
+                end = start
+        if end != size:
+            os.truncate(path, end)
+        return end
+
+    def replay(self, scraped: SeenIndex, failed: SeenIndex, end: int,
+               lock: ContextManager = contextlib.nullcontext(), batch_size: int = 10000):
+        """
+        Replay the first `end` bytes of the journal into the indexes. Keys are added batch_size at a time
+        holding lock, so the crawl can go on using the indexes while this runs in a background thread.
+        """
+        with open(self.path(JOURNAL_FILE), 'rb') as f:
+            while f.tell() < end:
+                lines = f.readlines(min(end - f.tell(), batch_size * 64))
+                with lock:
+                    for line in lines:
+                        status, _, key = line.decode('utf-8').rstrip('\n').partition('\t')
+                        if key.startswith('http'):
+                            # Journals used to record full URLs
+                            key = recipe_key(key)
+                        if status == SCRAPED:
+                            scraped.add(key)
+                        elif status == FAILED:
+                            failed.add(key)
+                    self.entries += len(lines)
+
+    def _read_legacy(self, name: str, index: SeenIndex):
+        if not os.path.exists(self.path(name)):
+            return
+        with open(self.path(name), 'r', encoding='utf-8') as f:
+            for url in f:
+                if url.strip():
+                    index.add(recipe_key(normalize_url(url)))
+
+    def open(self):
+        self.file = open(self.path(JOURNAL_FILE), 'a', encoding='utf-8')
+
+    def record(self, key: str, status: str = SCRAPED):
+        """Append the outcome for a recipe key, flushing to disk every flush_interval seconds"""
+        self.file.write(f'{status}\t{key}\n')
+        self.entries += 1
+        self.unflushed = True
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Make everything recorded so far durable"""
+        if self.before_flush is not None:
+            self.before_flush()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_flush = time.monotonic()
+        self.unflushed = False
+
+    @property
+    def flush_due(self) -> bool:
+        """Whether entries were recorded and not flushed for flush_interval seconds"""
+        return self.unflushed and time.monotonic() - self.last_flush >= self.flush_interval
+
+    def needs_compaction(self) -> bool:
+        return self.entries >= self.compact_every
+
+    def compact(self, scraped: SeenIndex, failed: SeenIndex, lock: ContextManager = contextlib.nullcontext()):
+        """
+        Fold the journal into fresh index snapshots, saved holding lock.
+        The snapshots are replaced atomically before the journal is emptied,
+        so a crash at any point leaves a state that replays correctly.
+        """
+        if self.file is not None:
+            self.flush()
+        with lock:
+            scraped.save()
+            failed.save()
+        if self.file is not None:
+            self.file.close()
+        # Creating the (empty) journal also marks the legacy URL lists as migrated
+        with open(self.path(JOURNAL_FILE), 'w', encoding='utf-8') as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries = 0
+        self.open()
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
@@ -0,0 +1,289 @@
+import cProfile
+import json
+import os
+import signal
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds, from stripping a small recipe to a request stuck behind a slow origin
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0, 30.0)
+RECIPE_BUCKETS = (0, 1, 2, 5, 10, 20, 30, 50, 100)
+# Bytes of a stored recipe
+SIZE_BUCKETS = (500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# The # HELP lines of the Prometheus export
+HELP = {
+    'challenges_total': 'Anti-bot challenges answered, by impersonated browser profile',
+    'concurrency_limit': 'Requests the adaptive limiter currently allows in flight',
+    'downloaded_bytes_total': 'Bytes of response bodies downloaded',
+    'fetch_seconds': 'Time from sending a request to its complete response',
+    'frontier_skipped_urls': 'URLs skipped as covered by recipes already seen (or done in this pass)',
+    'given_up_retries': 'Pages that failed again after their last retry attempt',
+    'frontier_urls': 'URLs in the frontier that are not handed out yet',
+    'healthy_sessions': 'Pooled sessions that are not cooling down after a challenge',
+    'in_flight_requests': 'Requests sent and not answered yet',
+    'pages_total': 'Pages handled, by outcome',
+    'pending_retries': 'Failed pages waiting to be retried',
+    'progress_load_seconds': 'Time it took to load the progress of an earlier run',
+    'projection_saved_bytes': 'Bytes the projection removed from a sampled recipe',
+    'recipe_changes_total': 'Recipes compared to their stored version in a refresh, by change',
+    'recipes_per_page': 'Recipes found on a page, including its related recipes',
+    'recipes_total': 'Recipes found, by outcome',
+    'request_delay_seconds': 'Delay between requests the throttle currently adds',
+    'responses_total': 'Responses received, by HTTP status, or error when the request failed',
+    'result_queue_depth': 'Fetched pages waiting to be processed',
+    'retries_total': 'Retries scheduled, by cause',
+    'stage_seconds': 'Time spent per page or batch, by pipeline stage',
+    'time_to_first_request_seconds': 'Time from start until the first request was sent',
+    'url_queue_depth': 'URLs waiting for a fetching thread',
+    'write_batches_total': 'Batches the recipe writer handed to the store',
+    'write_queue_depth': 'Recipes queued for the writer and not written yet',
+}
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: str = '') -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Histogram:
+    """Counts of observations per bucket (upper bounds), with their sum, as Prometheus histograms keep them"""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate of a quantile, interpolated within its bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.bounds[-1]
+
+
+class Metrics:
+    """
+    Counters, gauges and histograms of a scraper run, keyed by name and labels.
+
+    Gauges can be callbacks that are read when the metrics are exported, e.g. queue sizes.
+    Everything is cumulative since start, export with render() (Prometheus text format),
+    snapshot() / write_snapshot() (JSON) or serve() (an HTTP endpoint for both).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Dict[Labels, float]] = {}
+        self.gauge_callbacks: Dict[str, Callable[[], float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.server = None
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _labels(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self.lock:
+            self.gauges.setdefault(name, {})[_labels(labels)] = value
+
+    def gauge(self, name: str, callback: Callable[[], float]):
+        """Register a gauge that is read from callback on export"""
+        self.gauge_callbacks[name] = callback
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS, **labels):
+        key = _labels(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        """Time a block as one observation of stage_seconds{stage=...}"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - start, stage=stage)
+
+    def total(self, name: str, **labels) -> float:
+        """Sum of a counter over every series matching the given labels"""
+        wanted = set(_labels(labels))
+        with self.lock:
+            return sum(v for key, v in self.counters.get(name, {}).items() if wanted <= set(key))
+
+    def _gauge_values(self) -> Dict[str, Dict[Labels, float]]:
+        with self.lock:
+            gauges = {name: dict(series) for name, series in self.gauges.items()}
+        for name, callback in self.gauge_callbacks.items():
+            try:
+                gauges[name] = {(): float(callback())}
+            except Exception:
+                # A gauge of a stage that is gone (e.g. a closed queue) is left out
+                pass
+        return gauges
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format"""
+        lines: List[str] = []
+
+        def header(name: str, kind: str):
+            if name in HELP:
+                lines.append(f'# HELP {name} {HELP[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        with self.lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            histograms = {name: {k: (h.bounds, list(h.counts), h.sum, h.count) for k, h in series.items()}
+                          for name, series in self.histograms.items()}
+        for name, series in sorted(counters.items()):
+            header(name, 'counter')
+            for labels, value in sorted(series.items()):
+                lines.append(f'{name}{_format_labels(labels)} {value:g}')
+        for name, series in sorted(self._gauge_values().items()):
+            header(name, 'gauge')
+            for labels, value in sorted(series.items()):
+                lines.append(f'{name}{_format_labels(labels)} {value:g}')
+        for name, series in sorted(histograms.items()):
+            header(name, 'histogram')
+            for labels, (bounds, counts, total, count) in sorted(series.items()):
+                cumulative = 0
+                for bound, n in zip(list(bounds) + ['+Inf'], counts):
+                    cumulative += n
+                    le = 'le="' + (bound if bound == '+Inf' else f'{bound:g}') + '"'
+                    lines.append(f'{name}_bucket{_format_labels(labels, le)} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {total:g}')
+                lines.append(f'{name}_count{_format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict[str, object]:
+        """The metrics as plain data, histograms summarized by count, mean and estimated quantiles"""
+        def name_of(name: str, labels: Labels) -> str:
+            return name + _format_labels(labels)
+
+        snapshot: Dict[str, object] = {'time': time.time(), 'uptime': time.time() - self.started}
+        with self.lock:
+            for name, series in self.counters.items():
+                for labels, value in series.items():
+                    snapshot[name_of(name, labels)] = value
+            for name, series in self.histograms.items():
+                for labels, h in series.items():
+                    snapshot[name_of(name, labels)] = {
+                        'count': h.count,
+                        'mean': h.sum / h.count if h.count else 0.0,
+                        'p50': h.quantile(0.5),
+                        'p90': h.quantile(0.9),
+                        'p99': h.quantile(0.99),
+                    }
+        for name, series in self._gauge_values().items():
+            for labels, value in series.items():
+                snapshot[name_of(name, labels)] = value
+        return snapshot
+
+    def write_snapshot(self, path: str):
+        """Append a JSON snapshot as one line to path"""
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.snapshot()) + '\n')
+
+    def serve(self, port: int, host: str = '127.0.0.1'):
+        """
+        Serve /metrics (Prometheus text) and /metrics.json from a background thread
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, content_type = metrics.render().encode('utf-8'), 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body, content_type = json.dumps(metrics.snapshot()).encode('utf-8'), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        print(f"Serving metrics on http://{host}:{self.server.server_port}/metrics")
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class Profiler:
+    """
+    cProfile that can be switched on and off during a run, by sending the process SIGUSR1
+    (kill -USR1 <pid>) or by calling toggle(). Stopping it writes output_dir/profile-<time>.prof,
+    which can be read with pstats or snakeviz. It profiles the thread that runs the event loop (or the crawl).
+    """
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.profile: Optional[cProfile.Profile] = None
+
+    def install(self) -> bool:
+        """Toggle on SIGUSR1, where the platform has it. Has to be called from the main thread."""
+        if not hasattr(signal, 'SIGUSR1'):
+            return False
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self.toggle())
+        return True
+
+    def toggle(self):
+        if self.profile is None:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+            print("Profiling started")
+        else:
+            self.stop()
+
+    def stop(self):
+        if self.profile is None:
+            return
+        self.profile.disable()
+        path = os.path.join(self.output_dir, f'profile-{time.strftime("%Y%m%d-%H%M%S")}.prof')
+        self.profile.dump_stats(path)
+        self.profile = None
+        print(f"Profiling stopped, stats written to {path}")
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from yummly_scraper.initial_state import parse_initial_state
+from yummly_scraper.metrics import SIZE_BUCKETS, Metrics
+from yummly_scraper.projection import Projection
+from yummly_scraper.recipes import flatten_recipes
+
+
+def parse_page(content: bytes, encoding: str = 'utf-8', projection: Optional[Projection] = None,
+               stored: Optional[Callable[[str], bool]] = None
+               ) -> Tuple[Optional[List[Dict[str, Any]]], Dict[str, float], Dict[str, Any]]:
+    """
+    Turn the raw body of a recipe page into the list of stripped recipes it contains,
+    along with the seconds spent per stage ('decode' for finding and loading the payload, 'strip')
+    and stats: 'duplicates' left out because they appear twice on the page (or are stored already
+    according to stored(id), when parsing in the crawling process) and 'saved_bytes',
+    the bytes the projection saved on the recipes it sampled.
+    The recipes are None for a page without any, an empty list if every recipe on it was left out.
+    A top level function of bytes in and plain data out, so it can run in another process.
+    """
+    start = time.perf_counter()
+    initial_state = parse_initial_state(content, encoding)
+    decoded = time.perf_counter()
+    if not initial_state:
+        return None, {'decode': decoded - start}, {'duplicates': 0, 'saved_bytes': []}
+    recipes, duplicates = flatten_recipes(initial_state, stored)
+    if not recipes and not duplicates:
+        return None, {'decode': decoded - start}, {'duplicates': 0, 'saved_bytes': []}
+    saved = []
+    if projection is not None:
+        recipes, saved = projection.project(recipes)
+    return (recipes, {'decode': decoded - start, 'strip': time.perf_counter() - decoded},
+            {'duplicates': duplicates, 'saved_bytes': saved})
+
+
+class ParseStage:
+    """
+    Runs parse_page off the event loop.
+    With workers=0 it uses the loop's default thread pool, which shares the GIL with the event loop.
+    With workers > 0 (or None for one per core) pages are parsed in a process pool and
+    parsing scales across all cores while network I/O stays on the event loop.
+    Stage timings go to metrics, 'parse' being the whole round trip including the wait for a worker.
+    Recipes are cut down to the parts the projection keeps before they leave the worker.
+    """
+
+    def __init__(self, workers: Optional[int] = 0, metrics: Optional[Metrics] = None,
+                 projection: Optional[Projection] = None):
+        self.metrics = metrics
+        self.projection = projection
+        if workers == 0:
+            self.executor: Optional[Executor] = None
+        else:
+            self.executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+
+    async def parse(self, content: bytes, encoding: str = 'utf-8',
+                    stored: Optional[Callable[[str], bool]] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Parse a page off the event loop. Recipes stored already according to stored(id) are left out before they
+        are projected when parsing in a thread; worker processes can't call back into the crawl, their recipes
+        are checked when they are saved.
+        """
+        start = time.perf_counter()
+        if self.executor is not None:
+            stored = None
+        recipes, timings, stats = await asyncio.get_running_loop().run_in_executor(
+            self.executor, parse_page, content, encoding, self.projection, stored)
+        self._record(start, timings, stats)
+        return recipes
+
+    def parse_sync(self, content: bytes, encoding: str = 'utf-8',
+                   stored: Optional[Callable[[str], bool]] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        parse() in the calling thread, for the sequential and thread pool backends.
+        Recipes stored already according to stored(id) are left out before they are projected.
+        """
+        start = time.perf_counter()
+        recipes, timings, stats = parse_page(content, encoding, self.projection, stored)
+        self._record(start, timings, stats)
+        return recipes
+
+    def _record(self, start: float, timings: Dict[str, float], stats: Dict[str, Any]):
+        if self.metrics is not None:
+            self.metrics.observe('stage_seconds', time.perf_counter() - start, stage='parse')
+            for stage, seconds in timings.items():
+                self.metrics.observe('stage_seconds', seconds, stage=stage)
+            if stats['duplicates']:
+                self.metrics.inc('recipes_total', stats['duplicates'], outcome='duplicate')
+            for saved_bytes in stats['saved_bytes']:
+                self.metrics.observe('projection_saved_bytes', saved_bytes, buckets=SIZE_BUCKETS)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
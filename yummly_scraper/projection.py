@@ -0,0 +1,143 @@
+import json
+import os
+import random
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Marks the end of a path in a compiled path tree, the whole value there is matched
+_LEAF = True
+_ANY = '*'
+
+PathTree = Dict[str, Any]
+
+
+def compile_paths(paths: Iterable[str]) -> PathTree:
+    """
+    Turn dotted JSON paths into a tree of keys. Lists are transparent, so 'content.ingredientLines.wholeLine'
+    reaches into every ingredient line, and '*' matches any key.
+    """
+    tree: PathTree = {}
+    for path in paths:
+        node = tree
+        keys = path.split('.')
+        for key in keys[:-1]:
+            child = node.get(key)
+            if child is _LEAF:
+                # A shorter path already covers everything below it
+                break
+            node = node.setdefault(key, {})
+        else:
+            node[keys[-1]] = _LEAF
+    return tree
+
+
+def _subtree(tree: PathTree, key: str):
+    sub = tree.get(key)
+    return sub if sub is not None else tree.get(_ANY)
+
+
+def keep_paths(value: Any, tree: PathTree) -> Any:
+    """A copy of value with only the parts under the paths of tree"""
+    if isinstance(value, list):
+        return [keep_paths(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return value
+    kept = {}
+    for key, item in value.items():
+        sub = _subtree(tree, key)
+        if sub is _LEAF:
+            kept[key] = item
+        elif sub is not None:
+            kept[key] = keep_paths(item, sub)
+    return kept
+
+
+def drop_paths(value: Any, tree: PathTree) -> Any:
+    """Remove the parts under the paths of tree from value, in place"""
+    if isinstance(value, list):
+        for item in value:
+            drop_paths(item, tree)
+    elif isinstance(value, dict):
+        for key in list(value):
+            sub = _subtree(tree, key)
+            if sub is _LEAF:
+                del value[key]
+            elif sub is not None:
+                drop_paths(value[key], sub)
+    return value
+
+
+def record_size(recipe_data: Dict[str, Any]) -> int:
+    """Bytes of a recipe as the segment store writes it"""
+    return len(json.dumps(recipe_data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+class Projection:
+    """
+    Which parts of a recipe are stored, as keep or drop lists of dotted JSON paths.
+    The recipe id is always kept, the stores are keyed by it.
+
+    The bytes a projection saves are measured on one in sample_every recipes, since it takes an extra
+    serialization of the full recipe. They are picked at random rather than counted, a counter would start over
+    in every copy of the projection the parse workers unpickle with a page.
+    """
+
+    def __init__(self, keep: Optional[Iterable[str]] = None, drop: Optional[Iterable[str]] = None,
+                 name: str = 'custom', sample_every: int = 10):
+        if keep is not None and drop is not None:
+            raise ValueError("A projection has either a keep list or a drop list")
+        self.name = name
+        self.keep = compile_paths(list(keep) + ['id']) if keep is not None else None
+        self.drop = compile_paths(drop) if drop else None
+        self.sample_every = sample_every
+
+    @property
+    def is_full(self) -> bool:
+        return self.keep is None and self.drop is None
+
+    def apply(self, recipe_data: Dict[str, Any]) -> Dict[str, Any]:
+        if self.keep is not None:
+            return keep_paths(recipe_data, self.keep)
+        if self.drop is not None:
+            recipe_id = recipe_data.get('id')
+            drop_paths(recipe_data, self.drop)
+            recipe_data['id'] = recipe_id
+        return recipe_data
+
+    def project(self, recipes: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[int]]:
+        """The projected recipes, and the bytes saved on those that were sampled"""
+        if self.is_full:
+            return recipes, []
+        projected, saved = [], []
+        for recipe_data in recipes:
+            if random.random() * self.sample_every < 1:
+                before = record_size(recipe_data)
+                recipe_data = self.apply(recipe_data)
+                saved.append(before - record_size(recipe_data))
+            else:
+                recipe_data = self.apply(recipe_data)
+            projected.append(recipe_data)
+        return projected, saved
+
+
+PROFILES = {
+    'full': {},
+    # What is needed to cook and rank a recipe
+    'core': {'keep': ['id', 'display.displayName', 'content.details', 'content.ingredientLines',
+                      'content.preparationSteps', 'content.nutrition', 'yums', 'share.url']},
+    # Enough to list and look up recipes, the rest can be fetched again from the share url
+    'index': {'keep': ['id', 'display.displayName', 'display.source.sourceDisplayName', 'share.url', 'yums',
+                       'content.details.rating', 'content.details.totalTime', 'content.details.numberOfServings']},
+}
+
+
+def load_projection(spec: str = 'full') -> Projection:
+    """
+    A built-in profile by name ('full', 'core', 'index'), or a JSON file with a "keep" or a "drop" list of paths
+    """
+    if spec in PROFILES:
+        return Projection(name=spec, **PROFILES[spec])
+    if not os.path.exists(spec):
+        raise ValueError(f"Unknown projection {spec!r}, use one of {', '.join(PROFILES)} or a JSON file")
+    with open(spec, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    return Projection(config.get('keep'), config.get('drop'), name=os.path.basename(spec))
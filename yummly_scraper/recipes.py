@@ -0,0 +1,61 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Lists of related recipes on a recipe, each with *Loaded and *Loading flags next to it
+RELATED_LISTS = ('moreFromSource', 'relatedRecipes')
+CAROUSELS = 'spotlightCarousels'
+
+
+def _related_infos(recipe_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Remove the related recipe lists from a recipe and return the recipeInfo of every related recipe, in page order
+    """
+    infos = []
+    for name in RELATED_LISTS:
+        for related_recipe in recipe_data.pop(name, None) or ():
+            infos.append(related_recipe.get('recipeInfo'))
+        recipe_data.pop(f'{name}Loaded', None)
+        recipe_data.pop(f'{name}Loading', None)
+    for carousel in recipe_data.pop(CAROUSELS, None) or ():
+        for related_recipe in (carousel.get('cards') or {}).get('newList') or ():
+            infos.append(related_recipe.get('recipeInfo'))
+    recipe_data.pop(f'{CAROUSELS}Loaded', None)
+    recipe_data.pop(f'{CAROUSELS}Loading', None)
+    return infos
+
+
+def flatten_recipes(all_data: Dict[str, Any],
+                    stored: Optional[Callable[[str], bool]] = None) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Extract relevant data from recipe JSON, discard unnecessary data.
+    Also extracts related recipes, so they don't have to be scraped.
+
+    Returns the recipes with the related ones first and the main recipe last, and the number of duplicates
+    left out: recipes that appear twice on the page, and those stored already according to stored(id).
+    Related recipes nested in a duplicate are still walked, they can be new.
+    """
+    recipes = []
+    duplicates = 0
+    ids = set()
+    # (recipeInfo, None) is still to be walked, (None, recipe) is ready to be emitted after its related recipes
+    stack: List[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]] = [(all_data, None)]
+    while stack:
+        info, ready = stack.pop()
+        if ready is not None:
+            recipes.append(ready)
+            continue
+        recipe_data = info.get('recipe') if isinstance(info, dict) else None
+        if not isinstance(recipe_data, dict):
+            continue
+        recipe_data['yums'] = info.get('yums') or info.get('yumsObject')
+        related_infos = _related_infos(recipe_data)
+
+        recipe_id = recipe_data.get('id')
+        if recipe_id is not None and (recipe_id in ids or (stored is not None and stored(recipe_id))):
+            duplicates += 1
+        else:
+            if recipe_id is not None:
+                ids.add(recipe_id)
+            stack.append((None, recipe_data))
+        # Reversed, so the related recipes come off the stack in page order
+        stack.extend((related_info, None) for related_info in reversed(related_infos))
+    return recipes, duplicates
@@ -0,0 +1,167 @@
+import heapq
+import json
+import os
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+RETRY_FILE = 'retries.jsonl'
+
+PERMANENT = 'permanent'
+TRANSIENT = 'transient'
+
+
+class FetchFailed(Exception):
+    """
+    A page could not be fetched. status is None for timeouts and connection errors,
+    retry_after the delay the server asked for, if any.
+    """
+
+    def __init__(self, url: str, status: Optional[int] = None, retry_after: Optional[float] = None,
+                 reason: str = ''):
+        super().__init__(f"{url}: {reason or status or 'connection error'}")
+        self.url = url
+        self.status = status
+        self.retry_after = retry_after
+
+
+def classify(status: Optional[int]) -> str:
+    """Whether a failure is worth retrying: timeouts, 408, 429 and 5xx are, 404 and other client errors are not"""
+    if status is None or status in (408, 429) or status >= 500:
+        return TRANSIENT
+    if 400 <= status < 500:
+        return PERMANENT
+    # A 200 that was still challenged, or a redirect that was not followed
+    return TRANSIENT
+
+
+class RetryEntry:
+    __slots__ = ('url', 'attempts', 'due', 'status')
+
+    def __init__(self, url: str, attempts: int, due: float, status: Optional[int]):
+        self.url = url
+        self.attempts = attempts
+        self.due = due
+        self.status = status
+
+
+class RetryQueue:
+    """
+    Transient failures waiting for another try, ordered by when they are due in a heap.
+
+    Every failure pushes the URL back by a jittered exponential backoff (base_delay * 2^(attempts - 1),
+    capped at max_delay, at least what Retry-After asked for), so nothing waits in a worker.
+    After max_attempts the URL is given up on. The queue is saved to output_dir/retries.jsonl
+    with wall clock due times, so pending retries survive a restart.
+    """
+
+    def __init__(self, output_dir: str, base_delay: float = 30.0, max_delay: float = 6 * 3600.0,
+                 max_attempts: int = 8):
+        self.path = os.path.join(output_dir, RETRY_FILE)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.entries: Dict[str, RetryEntry] = {}
+        # (due, url), entries that were rescheduled or removed since are skipped when they come up
+        self.heap: List[Tuple[float, str]] = []
+        # The entries loaded from the file, latest due first, that pop_due(ignore_delay=True) hands out
+        self.backlog: List[RetryEntry] = []
+        self.given_up = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, url: str) -> bool:
+        return url in self.entries
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        # Jitter spreads out the retries of URLs that failed together, e.g. during an outage
+        return random.uniform(delay / 2, delay)
+
+    def schedule(self, failure: FetchFailed) -> bool:
+        """
+        Queue a retry for a failed URL. Returns False if the failure is permanent or the URL ran out of attempts,
+        it should be recorded as failed then.
+        """
+        if classify(failure.status) == PERMANENT:
+            self.entries.pop(failure.url, None)
+            return False
+        entry = self.entries.get(failure.url)
+        attempts = entry.attempts + 1 if entry is not None else 1
+        if attempts > self.max_attempts:
+            self.entries.pop(failure.url, None)
+            self.given_up += 1
+            return False
+        due = time.time() + max(self.backoff(attempts), failure.retry_after or 0.0)
+        self.entries[failure.url] = RetryEntry(failure.url, attempts, due, failure.status)
+        heapq.heappush(self.heap, (due, failure.url))
+        return True
+
+    def remove(self, url: str):
+        """Forget a URL that was fetched, or that does not need fetching any more"""
+        self.entries.pop(url, None)
+
+    def _peek(self) -> Optional[Tuple[float, str]]:
+        while self.heap:
+            due, url = self.heap[0]
+            entry = self.entries.get(url)
+            if entry is not None and entry.due == due:
+                return due, url
+            heapq.heappop(self.heap)
+        return None
+
+    def pop_due(self, ignore_delay: bool = False) -> Optional[str]:
+        """
+        The URL whose retry is due the longest, or None if none is due yet.
+        The entry stays in the queue with its attempts until remove() or the next schedule().
+        With ignore_delay the retries loaded at startup are handed out before they are due,
+        those scheduled since still wait for their backoff.
+        """
+        while ignore_delay and self.backlog:
+            entry = self.backlog.pop()
+            # Skip entries that were fetched, handed out or rescheduled since
+            if self.entries.get(entry.url) is entry and entry.due >= 0:
+                entry.due = -1.0
+                return entry.url
+        head = self._peek()
+        if head is None or head[0] > time.time():
+            return None
+        heapq.heappop(self.heap)
+        # Marks it as handed out, a later schedule() pushes it again
+        self.entries[head[1]].due = -1.0
+        return head[1]
+
+    def next_due(self) -> Optional[float]:
+        """Seconds until the next retry is due, None if there is nothing to retry"""
+        head = self._peek()
+        return None if head is None else max(head[0] - time.time(), 0.0)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                entry = RetryEntry(record['url'], record['attempts'], record['due'], record.get('status'))
+                self.entries[entry.url] = entry
+                heapq.heappush(self.heap, (entry.due, entry.url))
+                self.backlog.append(entry)
+        self.backlog.sort(key=lambda entry: entry.due, reverse=True)
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for entry in self.entries.values():
+                # Retries that were handed out but not answered yet are due right away after a restart
+                due = entry.due if entry.due >= 0 else time.time()
+                f.write(json.dumps({'url': entry.url, 'attempts': entry.attempts, 'due': due,
+                                    'status': entry.status}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def close(self):
+        self.save()
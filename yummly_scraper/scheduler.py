@@ -0,0 +1,126 @@
+import math
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Iterator, Optional, Tuple
+
+
+class BucketStats:
+    """Running yield of the pages fetched from one bucket"""
+
+    __slots__ = ('fetches', 'new_recipes')
+
+    def __init__(self):
+        self.fetches = 0
+        self.new_recipes = 0
+
+    def mean(self, prior: float) -> float:
+        # One virtual fetch at the prior keeps a single unlucky page from sinking a bucket
+        return (self.new_recipes + prior) / (self.fetches + 1)
+
+
+class Frontier:
+    """
+    Bounded window of known but not yet harvested URLs, handed out by expected yield of unseen recipes.
+
+    URLs arrive as (bucket, url) pairs, where a bucket groups URLs that are likely to share related recipes,
+    e.g. neighbouring entries of a sitemap. Every fetch reports how many new recipes it produced, and the
+    next URL comes from the bucket with the best upper confidence bound on that yield (UCB1), so buckets
+    whose recipes were mostly collected already as related recipes fall behind, while unexplored ones still
+    get tried. A URL is checked against `seen` again right before it is handed out, which skips entries that
+    were covered as related recipes while they waited in the window.
+    """
+
+    def __init__(self, urls: Iterator[Tuple[str, str]], seen: Callable[[str], bool], window: int = 10000,
+                 prior: float = 10.0, exploration: float = 2.0):
+        self.urls = urls
+        self.seen = seen
+        self.window = window
+        self.prior = prior
+        self.exploration = exploration
+        self.queued: Dict[str, Deque[str]] = OrderedDict()
+        self.size = 0
+        self.stats: Dict[str, BucketStats] = {}
+        self.in_flight: Dict[str, str] = {}
+        self.exhausted = False
+        self.fetches = 0
+        self.new_recipes = 0
+        self.skipped = 0
+
+    @property
+    def done(self) -> bool:
+        return self.exhausted and not self.queued
+
+    def _fill(self, max_scan: Optional[int]):
+        scanned = 0
+        while self.size < self.window and not self.exhausted:
+            if max_scan is not None and scanned >= max_scan:
+                return
+            scanned += 1
+            try:
+                bucket, url = next(self.urls)
+            except StopIteration:
+                self.exhausted = True
+                return
+            if self.seen(url):
+                self.skipped += 1
+                continue
+            self.queued.setdefault(bucket, deque()).append(url)
+            self.size += 1
+
+    def _score(self, bucket: str) -> float:
+        stats = self.stats.get(bucket)
+        if stats is None or stats.fetches == 0:
+            return math.inf
+        bonus = self.prior * math.sqrt(self.exploration * math.log(self.fetches + 1) / stats.fetches)
+        return stats.mean(self.prior) + bonus
+
+    def next(self, max_scan: Optional[int] = None) -> Optional[str]:
+        """
+        The most promising URL that is still unseen, or None once every URL has been handed out.
+        max_scan limits how many new URLs are read per call, so a caller on an event loop can yield
+        while long runs of seen URLs are skipped. It gets None early then, check `done`.
+        """
+        while True:
+            self._fill(max_scan)
+            if not self.queued:
+                return None
+            bucket = max(self.queued, key=self._score)
+            urls = self.queued[bucket]
+            url = urls.popleft()
+            self.size -= 1
+            if not urls:
+                del self.queued[bucket]
+            if self.seen(url):
+                self.skipped += 1
+                continue
+            self.in_flight[url] = bucket
+            return url
+
+    def observe(self, url: str, new_recipes: int):
+        """Report how many previously unseen recipes fetching url produced"""
+        bucket = self.in_flight.pop(url, None)
+        if bucket is None:
+            return
+        stats = self.stats.setdefault(bucket, BucketStats())
+        stats.fetches += 1
+        stats.new_recipes += new_recipes
+        self.fetches += 1
+        self.new_recipes += new_recipes
+
+    def discard(self, url: str):
+        """Forget a handed out URL that turned out not to need fetching, it counts as skipped"""
+        self.in_flight.pop(url, None)
+        self.skipped += 1
+
+    @property
+    def new_per_fetch(self) -> float:
+        return self.new_recipes / self.fetches if self.fetches else 0.0
+
+    def report(self) -> str:
+        return (f"{self.new_per_fetch:.1f} new recipes per fetch ({self.new_recipes} from {self.fetches} fetches), "
+                f"{self.skipped} URLs skipped as already covered")
+
+
+def sitemap_buckets(sitemap: str, urls: Iterator[str], bucket_size: int = 1000) -> Iterator[Tuple[str, str]]:
+    """Group neighbouring sitemap entries into buckets of bucket_size URLs"""
+    for i, url in enumerate(urls):
+        yield f'{sitemap}:{i // bucket_size}', url
@@ -0,0 +1,438 @@
+"""
+Inverted index over the scraped recipes, for finding them by words of the name, ingredient, tag or yums
+without scanning the whole store.
+
+    python -m yummly_scraper.search_index build yummly_recipes --workers 8
+    python -m yummly_scraper.search_index query yummly_recipes chicken ingredient:garlic cuisine:indian \\
+        --min-yums 100 --max-time 45 --sort yums
+
+The crawl keeps output_dir/search.sqlite up to date while it saves recipes (search_index=True), build indexes
+the recipes of an existing store in parallel and only adds those that are not indexed yet.
+
+Terms are the words of the name, source and keywords ('chicken'), ingredient words ('ingredient:garlic')
+and tags ('cuisine:indian', 'course:main-dishes'). Every term has posting lists of document numbers,
+sorted and stored delta-encoded in blocks of up to BLOCK_SIZE documents, so adding recipes only rewrites
+the last block of each of their terms. Numeric columns (yums, total time, rating, servings)
+are kept per document for filtering and sorting.
+"""
+import argparse
+import itertools
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from yummly_scraper.store import EXTENSIONS, FileStore, SegmentStore
+
+SEARCH_INDEX_FILE = 'search.sqlite'
+BLOCK_SIZE = 1024
+# Blocks of the segment store a build worker reads at a time
+BLOCKS_PER_TASK = 8
+# Column and direction of every sort, 'added' is the order the recipes were indexed in
+SORTS = {'yums': ('yums', 'DESC'), 'rating': ('rating', 'DESC'), 'time': ('total_time', 'ASC'), 'added': ('doc', 'ASC')}
+# Up to this many matches are looked up by document number, more are filtered while walking the sort order
+LOOKUP_LIMIT = 5000
+# Numeric columns, in the order of the docs table
+COLUMNS = ('yums', 'total_time', 'rating', 'servings')
+
+_TYPECODES = {1: 'B', 2: 'H', 4: 'I'}
+_WORD_RE = re.compile(r'\w+')
+_TIME_RE = re.compile(r'(\d+)\s*(h|hr|hrs|hour|hours|m|min|mins|minute|minutes)\b', re.IGNORECASE)
+STOPWORDS = frozenset(('a', 'an', 'and', 'the', 'of', 'with', 'in', 'on', 'to', 'for', 'or', 'my', 'best'))
+
+Document = Tuple[str, str, Tuple[Optional[float], ...], Set[str]]
+
+
+def encode_postings(docs: Sequence[int]) -> bytes:
+    """
+    A block of sorted document numbers as the gaps from the first one, all packed with the width (1, 2 or 4 bytes)
+    of the largest gap behind a byte holding that width
+    """
+    gaps = [doc - previous for previous, doc in zip(docs[:1] + docs[:-1], docs)]
+    width = next(width for width, limit in ((1, 1 << 8), (2, 1 << 16), (4, 1 << 32)) if max(gaps) < limit)
+    packed = array(_TYPECODES[width], gaps)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return bytes((width,)) + packed.tobytes()
+
+
+def decode_postings(data: bytes, first: int) -> List[int]:
+    """The document numbers of a block that starts with first"""
+    gaps = array(_TYPECODES[data[0]])
+    gaps.frombytes(data[1:])
+    if sys.byteorder == 'big':
+        gaps.byteswap()
+    docs = list(itertools.accumulate(gaps, initial=first))
+    del docs[0]
+    return docs
+
+
+def words(text: Any) -> Iterator[str]:
+    if isinstance(text, str):
+        for word in _WORD_RE.findall(text.casefold()):
+            if len(word) > 1 and word not in STOPWORDS:
+                yield word
+
+
+def slug(text: str) -> str:
+    return '-'.join(_WORD_RE.findall(text.casefold()))
+
+
+def total_minutes(details: Dict[str, Any]) -> Optional[float]:
+    """Total time from totalTimeInSeconds or a text like '1 hr 20 min'"""
+    seconds = details.get('totalTimeInSeconds')
+    if isinstance(seconds, (int, float)):
+        return seconds / 60
+    text = details.get('totalTime')
+    if not isinstance(text, str):
+        return None
+    minutes = sum(int(n) * (60 if unit.lower().startswith('h') else 1) for n, unit in _TIME_RE.findall(text))
+    return minutes or None
+
+
+def _number(value: Any) -> Optional[float]:
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def extract_document(recipe_data: Dict[str, Any], key: Optional[str] = None) -> Optional[Document]:
+    """The key (the recipe id by default), name, numeric columns and terms of a recipe, None without a key"""
+    key = key or recipe_data.get('id')
+    if not key:
+        return None
+    display = recipe_data.get('display') or {}
+    content = recipe_data.get('content') or {}
+    details = content.get('details') or {}
+    name = display.get('displayName') or ''
+
+    terms = set(words(name))
+    terms.update(words((display.get('source') or {}).get('sourceDisplayName')))
+    for keyword in details.get('keywords') or ():
+        terms.update(words(keyword))
+    for line in content.get('ingredientLines') or ():
+        if isinstance(line, dict):
+            terms.update('ingredient:' + word for word in words(line.get('ingredient') or line.get('wholeLine'))
+                         if not word.isdigit())
+    for category, tags in (content.get('tags') or {}).items():
+        for tag in tags if isinstance(tags, list) else ():
+            if isinstance(tag, dict) and tag.get('display-name'):
+                terms.add(f"{slug(category)}:{slug(tag['display-name'])}")
+
+    yums = recipe_data.get('yums')
+    if isinstance(yums, dict):
+        yums = yums.get('count')
+    columns = (_number(yums), total_minutes(details), _number(details.get('rating')),
+               _number(details.get('numberOfServings')))
+    return key, name, columns, terms
+
+
+def parse_query(query: Sequence[str]) -> List[str]:
+    """Terms of a query, 'ingredient:garlic' and 'cuisine:Indian' select a field, other words the name"""
+    terms = []
+    for part in query:
+        field, sep, value = part.partition(':')
+        if sep:
+            terms.append(f"{slug(field)}:{slug(value)}")
+        else:
+            terms.extend(words(part))
+    return terms
+
+
+class SearchIndex:
+    """
+    The inverted index in a SQLite database. Documents are numbered in the order they are added, so the
+    posting lists grow at the end. add() buffers, flush() writes the buffered documents in one transaction,
+    extending the last block of every term. Adding a recipe that is indexed already replaces its document;
+    the old number stays in the posting lists until optimize(), but does not match any more.
+    update_columns() only rewrites the numeric columns of a document, for changes like new yums counts.
+    Writes have to come from a single thread, queries can run in other processes while it is written.
+    """
+
+    def __init__(self, path: str, batch_size: int = 10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=60)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS docs (doc INTEGER PRIMARY KEY, key TEXT UNIQUE, name TEXT, '
+                        'yums REAL, total_time REAL, rating REAL, servings REAL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS postings (term TEXT, first INTEGER, last INTEGER, '
+                        'count INTEGER, docs BLOB, PRIMARY KEY (term, first)) WITHOUT ROWID')
+        for column in COLUMNS:
+            self.db.execute(f'CREATE INDEX IF NOT EXISTS docs_{column} ON docs ({column})')
+        self.next_doc = (self.db.execute('SELECT MAX(doc) FROM docs').fetchone()[0] or 0) + 1
+        self.pending_docs: List[Tuple[Any, ...]] = []
+        self.pending_postings: Dict[str, List[int]] = {}
+        self.pending_updates: List[Tuple[Any, ...]] = []
+
+    def __len__(self) -> int:
+        self.flush()
+        return self.db.execute('SELECT COUNT(*) FROM docs').fetchone()[0]
+
+    def __contains__(self, key: str) -> bool:
+        return self.db.execute('SELECT 1 FROM docs WHERE key = ?', (key,)).fetchone() is not None
+
+    def add(self, key: str, recipe_data: Dict[str, Any]):
+        document = extract_document(recipe_data, key)
+        if document is not None:
+            self.add_document(document)
+
+    def add_document(self, document: Document):
+        key, name, columns, terms = document
+        doc = self.next_doc
+        self.next_doc += 1
+        self.pending_docs.append((doc, key, name, *columns))
+        for term in terms:
+            self.pending_postings.setdefault(term, []).append(doc)
+        if len(self.pending_docs) >= self.batch_size:
+            self.flush()
+
+    def update_columns(self, key: str, recipe_data: Dict[str, Any]):
+        """Update the columns of an indexed recipe in place, when its terms are known to be the same"""
+        document = extract_document(recipe_data, key)
+        if document is not None:
+            self.pending_updates.append((*document[2], key))
+            if len(self.pending_updates) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        if not self.pending_docs and not self.pending_updates:
+            return
+        with self.db:
+            # Replacing by key drops the previous document of a recipe that was indexed before
+            self.db.executemany('INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?, ?, ?, ?)', self.pending_docs)
+            for term, docs in self.pending_postings.items():
+                self._append(term, docs)
+            self.db.executemany(f"UPDATE docs SET {', '.join(f'{column} = ?' for column in COLUMNS)} WHERE key = ?",
+                                self.pending_updates)
+        self.pending_docs = []
+        self.pending_postings = {}
+        self.pending_updates = []
+
+    def _append(self, term: str, docs: List[int]):
+        last_block = self.db.execute('SELECT first, last, count, docs FROM postings WHERE term = ? '
+                                     'ORDER BY first DESC LIMIT 1', (term,)).fetchone()
+        if last_block is not None and last_block[2] < BLOCK_SIZE:
+            first, last, count, data = last_block
+            room = BLOCK_SIZE - count
+            block = decode_postings(data, first) + docs[:room]
+            docs = docs[room:]
+            self.db.execute('UPDATE postings SET last = ?, count = ?, docs = ? WHERE term = ? AND first = ?',
+                            (block[-1], len(block), encode_postings(block), term, first))
+        for start in range(0, len(docs), BLOCK_SIZE):
+            block = docs[start:start + BLOCK_SIZE]
+            self.db.execute('INSERT INTO postings VALUES (?, ?, ?, ?, ?)',
+                            (term, block[0], block[-1], len(block), encode_postings(block)))
+
+    def postings(self, term: str, within: Optional[Tuple[int, int]] = None) -> List[int]:
+        """The document numbers of a term, only from the blocks that overlap the range within"""
+        sql, args = 'SELECT first, docs FROM postings WHERE term = ?', [term]
+        if within is not None:
+            sql += ' AND last >= ? AND first <= ?'
+            args += list(within)
+        docs = []
+        for first, data in self.db.execute(sql + ' ORDER BY first', args):
+            docs.extend(decode_postings(data, first))
+        return docs
+
+    def document_frequency(self, term: str) -> int:
+        return self.db.execute('SELECT COALESCE(SUM(count), 0) FROM postings WHERE term = ?', (term,)).fetchone()[0]
+
+    def match(self, terms: Sequence[str]) -> Optional[List[int]]:
+        """
+        Documents with all the terms, None for no terms. Starts from the rarest term and only decodes
+        the blocks of the others that overlap the candidates.
+        """
+        if not terms:
+            return None
+        ordered = sorted(set(terms), key=self.document_frequency)
+        candidates = set(self.postings(ordered[0]))
+        for term in ordered[1:]:
+            if not candidates:
+                break
+            candidates = candidates.intersection(self.postings(term, (min(candidates), max(candidates))))
+        return sorted(candidates)
+
+    def search(self, query: Sequence[str], min_yums: Optional[float] = None, max_time: Optional[float] = None,
+               min_rating: Optional[float] = None, sort: str = 'yums', limit: int = 20) -> List[Dict[str, Any]]:
+        """Recipes matching every term of the query and the numeric filters, best first by sort"""
+        if sort not in SORTS:
+            raise ValueError(f"Unknown sort {sort!r}, choose from {', '.join(SORTS)}")
+        self.flush()
+        matched = self.match(parse_query(query))
+        conditions, args = [], []
+        for column, op, value in (('yums', '>=', min_yums), ('total_time', '<=', max_time),
+                                  ('rating', '>=', min_rating)):
+            if value is not None:
+                conditions.append(f'{column} {op} ?')
+                args.append(value)
+        column, direction = SORTS[sort]
+        select = f'SELECT doc, key, name, {", ".join(COLUMNS)} FROM docs'
+        if matched is not None and len(matched) <= LOOKUP_LIMIT:
+            # Few matches, look them up
+            if not matched:
+                return []
+            conditions.append(f"doc IN ({','.join(map(str, matched))})")
+            matched = None
+        # Walks the column index in order, then the documents without a value, which sort last either way
+        rows = itertools.chain.from_iterable(
+            self.db.execute(f"{select} WHERE {' AND '.join(conditions + [f'{column} {missing}'])} "
+                            f"ORDER BY {column} {direction}", args)
+            for missing in ('IS NOT NULL', 'IS NULL')
+        )
+        if matched is not None:
+            # Many matches, keep the matching documents as they come in sort order
+            matched = set(matched)
+            rows = (row for row in rows if row[0] in matched)
+        return [dict(zip(('id', 'name', *COLUMNS), row[1:])) for row in itertools.islice(rows, limit)]
+
+    def optimize(self):
+        """Rewrite the posting lists without the documents that were replaced, and vacuum"""
+        self.flush()
+        live = {doc for (doc,) in self.db.execute('SELECT doc FROM docs')}
+        terms = [term for (term,) in self.db.execute('SELECT DISTINCT term FROM postings')]
+        with self.db:
+            for term in terms:
+                docs = [doc for doc in self.postings(term) if doc in live]
+                self.db.execute('DELETE FROM postings WHERE term = ?', (term,))
+                if docs:
+                    self._append(term, docs)
+        self.db.execute('VACUUM')
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+def _extract_blocks(output_dir: str, blocks: List[Tuple[str, int, int]]) -> List[Document]:
+    """Documents of the recipes in some blocks of a segment store that are their newest copy, in a worker process"""
+    stores: Dict[str, SegmentStore] = {}
+    documents = []
+    try:
+        for segment, offset, length in blocks:
+            compression = next(name for name, extension in EXTENSIONS.items() if segment.endswith(extension))
+            if compression not in stores:
+                stores[compression] = SegmentStore(output_dir, compression)
+            store = stores[compression]
+            for line, data in enumerate(store._read_block(segment, offset, length)):
+                recipe_data = json.loads(data)
+                newest = store.index.execute('SELECT segment, offset, line FROM records WHERE key = ?',
+                                             (recipe_data.get('id'),)).fetchone()
+                if newest == (segment, offset, line):
+                    documents.append(extract_document(recipe_data))
+        return documents
+    finally:
+        for store in stores.values():
+            store.close()
+
+
+def _extract_files(paths: List[str]) -> List[Document]:
+    documents = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            document = extract_document(json.load(f))
+        if document is not None:
+            documents.append(document)
+    return documents
+
+
+def build(output_dir: str, workers: Optional[int] = None, storage: str = 'segments') -> int:
+    """
+    Index the recipes stored in output_dir that are not indexed yet, reading and extracting them in
+    `workers` processes (one per core by default), which get BLOCKS_PER_TASK blocks of the segments
+    or 1000 recipe files at a time. Returns the number of recipes added.
+    """
+    index = SearchIndex(os.path.join(output_dir, SEARCH_INDEX_FILE))
+    indexed = {key for (key,) in index.db.execute('SELECT key FROM docs')}
+    added = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if storage == 'segments':
+            store = SegmentStore(output_dir)
+            blocks = store.index.execute('SELECT segment, offset, length FROM records '
+                                         'GROUP BY segment, offset ORDER BY segment, offset').fetchall()
+            store.close()
+            tasks = [blocks[i:i + BLOCKS_PER_TASK] for i in range(0, len(blocks), BLOCKS_PER_TASK)]
+            batches = pool.map(_extract_blocks, [output_dir] * len(tasks), tasks)
+        else:
+            directory = FileStore(output_dir).directory
+            paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.json')]
+            batches = pool.map(_extract_files, [paths[i:i + 1000] for i in range(0, len(paths), 1000)])
+        for documents in batches:
+            for document in documents:
+                if document[0] not in indexed:
+                    indexed.add(document[0])
+                    index.add_document(document)
+                    added += 1
+            print(f"Indexed {added} recipes")
+    index.close()
+    return added
+
+
+def search_paths(output_dir: str) -> List[str]:
+    """The index of output_dir, or those of its shards for a sharded crawl"""
+    path = os.path.join(output_dir, SEARCH_INDEX_FILE)
+    if os.path.exists(path):
+        return [path]
+    return sorted(os.path.join(output_dir, name, SEARCH_INDEX_FILE) for name in os.listdir(output_dir)
+                  if name.startswith('shard-') and os.path.exists(os.path.join(output_dir, name, SEARCH_INDEX_FILE)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help='index the recipes of a store that are not indexed yet')
+    build_parser.add_argument('output_dir')
+    build_parser.add_argument('--workers', type=int, help='processes to use (default: one per core)')
+    build_parser.add_argument('--storage', choices=('segments', 'files'), default='segments')
+    build_parser.add_argument('--optimize', action='store_true', help='drop replaced documents and vacuum')
+    query_parser = commands.add_parser('query', help='find recipes')
+    query_parser.add_argument('output_dir')
+    query_parser.add_argument('terms', nargs='*', help="words of the name, 'ingredient:<word>', '<tag>:<value>'")
+    query_parser.add_argument('--min-yums', type=float)
+    query_parser.add_argument('--max-time', type=float, help='total time in minutes')
+    query_parser.add_argument('--min-rating', type=float)
+    query_parser.add_argument('--sort', choices=SORTS, default='yums',
+                              help="'added' lists recipes in the order they were indexed")
+    query_parser.add_argument('--limit', type=int, default=20)
+    query_parser.add_argument('--json', action='store_true', help='print the results as JSON lines')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        added = build(args.output_dir, args.workers, args.storage)
+        if args.optimize:
+            index = SearchIndex(os.path.join(args.output_dir, SEARCH_INDEX_FILE))
+            index.optimize()
+            index.close()
+        print(f"Added {added} recipes to the index in {time.perf_counter() - start:.1f} seconds")
+        return
+
+    start = time.perf_counter()
+    results = []
+    for path in search_paths(args.output_dir):
+        index = SearchIndex(path)
+        results.extend(index.search(args.terms, args.min_yums, args.max_time, args.min_rating, args.sort,
+                                    args.limit))
+        index.close()
+    column, direction = SORTS[args.sort]
+    if column != 'doc':
+        # Merge the results of the shards
+        sign = -1 if direction == 'DESC' else 1
+        results.sort(key=lambda result: (result[column] is None, sign * (result[column] or 0)))
+    results = results[:args.limit]
+    elapsed = time.perf_counter() - start
+    for result in results:
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False))
+        else:
+            print(f"{result['yums'] or 0:8.0f} yums  {result['total_time'] or 0:5.0f} min  "
+                  f"{result['rating'] or 0:3.1f}  {result['name']}  ({result['id']})")
+    print(f"{len(results)} results in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
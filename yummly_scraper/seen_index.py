@@ -0,0 +1,389 @@
+import hashlib
+import mmap
+import os
+import sqlite3
+import urllib.parse
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+HASH_BYTES = 8
+
+
+def recipe_key(url: str) -> str:
+    """
+    Recipe pages are named after the recipe id (https://www.yummly.com/recipe/<id>),
+    so the id doubles as the dedup key of a URL. Other URLs are keyed by themselves.
+    """
+    head, _, tail = urllib.parse.urlsplit(url).path.rstrip('/').rpartition('/')
+    if head.endswith('/recipe') and tail:
+        return urllib.parse.unquote(tail)
+    return url
+
+
+def key_hash(key: str) -> int:
+    """
+    Stable 64 bit hash of a key. Python's hash() is salted per process, so it can not be persisted.
+    """
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=HASH_BYTES).digest(), 'little')
+
+
+def _replace_file(path: str, write):
+    """Write a file next to its destination and move it in place atomically"""
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class SeenIndex:
+    """
+    Set of recipe keys that have been handled already.
+    Implementations persist themselves to files starting with `path` on save().
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def add(self, key: str):
+        raise NotImplementedError
+
+    def update(self, keys: Iterable[str]):
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def load(self):
+        """Load the last snapshot written by save(), if there is one"""
+        raise NotImplementedError
+
+    def save(self):
+        """Atomically write a snapshot of the index"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SetIndex(SeenIndex):
+    """
+    Plain set of keys, fastest but every key costs a full Python string
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.keys = set()
+
+    def add(self, key: str):
+        self.keys.add(key)
+
+    def update(self, keys: Iterable[str]):
+        self.keys.update(keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys)
+
+    def load(self):
+        if os.path.exists(self.path + '.txt'):
+            with open(self.path + '.txt', 'r', encoding='utf-8') as f:
+                self.keys = set(f.read().splitlines())
+
+    def save(self):
+        keys = '\n'.join(self.keys).encode('utf-8')
+        _replace_file(self.path + '.txt', lambda f: f.write(keys))
+
+
+class BloomFilter:
+    """
+    Bloom filter over 64 bit key hashes, the probe positions are derived from the hash by double hashing
+    """
+
+    def __init__(self, capacity: int, bits_per_key: int = 10, probes: int = 7):
+        self.capacity = capacity
+        self.bits_per_key = bits_per_key
+        self.probes = probes
+        self.size = max(capacity * bits_per_key, 64)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def add(self, h: int):
+        bits, size = self.bits, self.size
+        pos, step = h & 0xFFFFFFFF, (h >> 32) | 1
+        for _ in range(self.probes):
+            pos %= size
+            bits[pos >> 3] |= 1 << (pos & 7)
+            pos += step
+
+    def __contains__(self, h: int) -> bool:
+        bits, size = self.bits, self.size
+        pos, step = h & 0xFFFFFFFF, (h >> 32) | 1
+        for _ in range(self.probes):
+            pos %= size
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+            pos += step
+        return True
+
+    def save(self, path: str):
+        def write(f):
+            array('Q', [self.capacity, self.bits_per_key, self.probes]).tofile(f)
+            f.write(self.bits)
+        _replace_file(path, write)
+
+    @classmethod
+    def from_file(cls, path: str) -> 'BloomFilter':
+        with open(path, 'rb') as f:
+            header = array('Q')
+            header.frombytes(f.read(3 * 8))
+            bloom = cls(*header)
+            f.readinto(bloom.bits)
+        return bloom
+
+
+class HashIndex(SeenIndex):
+    """
+    Memory-compact index: 8 byte key hashes in sorted arrays, with a Bloom filter in front.
+
+    New hashes collect in a small set and are sorted into a new run once it fills up.
+    Runs of similar size are merged, so there are only ever O(log n) of them to binary search.
+    The snapshot is the merged sorted array, which load() maps into memory instead of reading it,
+    so a resume can look up keys right away and only touches the pages its lookups need.
+    """
+
+    def __init__(self, path: str, capacity: int = 1 << 20, pending_size: int = 1 << 16):
+        super().__init__(path)
+        self.pending_size = pending_size
+        self.pending = set()
+        self.runs: List[Sequence[int]] = []
+        self.count = 0
+        self.bloom = BloomFilter(capacity)
+        # The mapped snapshot and the run that views it, until it is merged or saved over
+        self.mapping: Optional[mmap.mmap] = None
+        self.mapped_run: Optional[memoryview] = None
+
+    def add(self, key: str):
+        h = key_hash(key)
+        if self._contains_hash(h):
+            return
+        self.pending.add(h)
+        self.bloom.add(h)
+        self.count += 1
+        if len(self.pending) >= self.pending_size:
+            self._flush_pending()
+        if self.count > self.bloom.capacity:
+            self._grow_bloom()
+
+    def __contains__(self, key: str) -> bool:
+        return self._contains_hash(key_hash(key))
+
+    def _contains_hash(self, h: int) -> bool:
+        if h not in self.bloom:
+            return False
+        if h in self.pending:
+            return True
+        for run in self.runs:
+            i = bisect_left(run, h)
+            if i < len(run) and run[i] == h:
+                return True
+        return False
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _flush_pending(self):
+        if not self.pending:
+            return
+        self.runs.append(array('Q', sorted(self.pending)))
+        self.pending = set()
+        # Keep run sizes geometrically decreasing, like a binary counter
+        while len(self.runs) > 1 and len(self.runs[-2]) <= 2 * len(self.runs[-1]):
+            b = self.runs.pop()
+            a = self.runs.pop()
+            self.runs.append(_merge_sorted(a, b))
+        self._unmap()
+
+    def _merge_all(self) -> array:
+        self._flush_pending()
+        while len(self.runs) > 1:
+            b = self.runs.pop()
+            a = self.runs.pop()
+            self.runs.append(_merge_sorted(a, b))
+        if self.runs and self.runs[0] is self.mapped_run:
+            # Copy the snapshot out of the mapping, it is about to be replaced
+            run = array('Q')
+            run.frombytes(self.mapping)
+            self.runs = [run]
+        self._unmap()
+        return self.runs[0] if self.runs else array('Q')
+
+    def _unmap(self):
+        if self.mapping is not None and not any(run is self.mapped_run for run in self.runs):
+            self.mapped_run.release()
+            self.mapping.close()
+            self.mapping = self.mapped_run = None
+
+    def _grow_bloom(self):
+        bloom = BloomFilter(self.bloom.capacity * 2, self.bloom.bits_per_key, self.bloom.probes)
+        for h in self.pending:
+            bloom.add(h)
+        for run in self.runs:
+            for h in run:
+                bloom.add(h)
+        self.bloom = bloom
+
+    def load(self):
+        if not os.path.exists(self.path + '.idx'):
+            return
+        run: Sequence[int] = array('Q')
+        if os.path.getsize(self.path + '.idx') >= HASH_BYTES:
+            with open(self.path + '.idx', 'rb') as f:
+                self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            run = self.mapped_run = memoryview(self.mapping).cast('Q')
+        self.runs = [run] if run else []
+        self.pending = set()
+        self.count = len(run)
+        if os.path.exists(self.path + '.bloom'):
+            self.bloom = BloomFilter.from_file(self.path + '.bloom')
+        else:
+            self.bloom = BloomFilter(max(self.count * 2, 1 << 20))
+            for h in run:
+                self.bloom.add(h)
+
+    def save(self):
+        run = self._merge_all()
+        # Filter first: a crash in between leaves it with extra keys, which only costs a lookup
+        self.bloom.save(self.path + '.bloom')
+        _replace_file(self.path + '.idx', lambda f: run.tofile(f))
+
+    def close(self):
+        self.runs = []
+        self._unmap()
+
+
+def _merge_sorted(a: array, b: array) -> array:
+    """Merge two sorted arrays of distinct hashes without materializing Python lists"""
+    out = array('Q')
+    i = j = 0
+    len_a, len_b = len(a), len(b)
+    append = out.append
+    while i < len_a and j < len_b:
+        if a[i] < b[j]:
+            append(a[i])
+            i += 1
+        else:
+            append(b[j])
+            j += 1
+    out.extend(a[i:])
+    out.extend(b[j:])
+    return out
+
+
+class SqliteIndex(SeenIndex):
+    """
+    On-disk index for crawls larger than RAM: key hashes in a SQLite table, with a Bloom filter in front
+    so that most lookups of new keys never touch the disk.
+
+    New hashes are written to the table in batches, but only committed by save(), like the snapshots of the
+    other indexes. The crawler adds keys before their recipes are written, a crash must not leave
+    keys behind that the journal never recorded.
+    """
+
+    def __init__(self, path: str, capacity: int = 1 << 22, batch_size: int = 10000):
+        super().__init__(path)
+        self.batch_size = batch_size
+        self.db = sqlite3.connect(path + '.sqlite', check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS seen (h INTEGER PRIMARY KEY) WITHOUT ROWID')
+        self.db.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)')
+        self.pending = set()
+        self.count = self.db.execute('SELECT COUNT(*) FROM seen').fetchone()[0]
+        self.bloom = BloomFilter(max(capacity, self.count * 2))
+
+    @staticmethod
+    def _signed(h: int) -> int:
+        # SQLite integers are signed 64 bit
+        return h - (1 << 64) if h >= 1 << 63 else h
+
+    def add(self, key: str):
+        h = key_hash(key)
+        if self._contains_hash(h):
+            return
+        self.pending.add(h)
+        self.bloom.add(h)
+        self.count += 1
+        if len(self.pending) >= self.batch_size:
+            self._flush_pending()
+        if self.count > self.bloom.capacity:
+            self._rebuild_bloom(self.bloom.capacity * 2)
+
+    def __contains__(self, key: str) -> bool:
+        return self._contains_hash(key_hash(key))
+
+    def _contains_hash(self, h: int) -> bool:
+        if h not in self.bloom:
+            return False
+        if h in self.pending:
+            return True
+        return self.db.execute('SELECT 1 FROM seen WHERE h = ?', (self._signed(h),)).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _flush_pending(self):
+        # Within the transaction that save() commits, lookups on this connection see the rows already
+        self.db.executemany('INSERT OR IGNORE INTO seen VALUES (?)', ((self._signed(h),) for h in self.pending))
+        self.pending = set()
+
+    def _rebuild_bloom(self, capacity: int):
+        self._flush_pending()
+        self.bloom = BloomFilter(capacity)
+        for (h,) in self.db.execute('SELECT h FROM seen'):
+            self.bloom.add(h % (1 << 64))
+
+    def load(self):
+        # The saved filter is only trusted if nothing was added to the table after it was written
+        saved = self.db.execute("SELECT value FROM meta WHERE name = 'bloom_count'").fetchone()
+        if os.path.exists(self.path + '.bloom') and saved and saved[0] == self.count:
+            self.bloom = BloomFilter.from_file(self.path + '.bloom')
+        else:
+            self._rebuild_bloom(max(self.bloom.capacity, self.count * 2))
+
+    def save(self):
+        self._flush_pending()
+        # Filter first: a crash before the commit leaves it with a count that does not match, it is rebuilt then
+        self.bloom.save(self.path + '.bloom')
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('bloom_count', ?)", (self.count,))
+
+    def close(self):
+        # Keys added since the last save() are rolled back, the journal has them
+        self.db.close()
+
+
+INDEXES = {
+    'set': SetIndex,
+    'hash': HashIndex,
+    'sqlite': SqliteIndex,
+}
+
+
+def open_index(kind: str, path: str) -> SeenIndex:
+    """
+    Create a seen index of the given kind ('set', 'hash' or 'sqlite') persisting to files starting with path
+    """
+    if kind not in INDEXES:
+        raise ValueError(f"Unknown index {kind!r}, choose from {', '.join(INDEXES)}")
+    return INDEXES[kind](path)
@@ -0,0 +1,275 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from curl_cffi import requests, CurlHttpVersion, CurlOpt
+
+COOKIE_FILE = 'cookies.json'
+START_URL = 'https://www.yummly.com/'
+
+# Cloudflare ties clearance to the UA and TLS fingerprint of the browser that solved the challenge,
+# so every session impersonates the Chrome that browser_clearance() opens
+BROWSER_PROFILE = 'chrome131'
+
+Cookie = Dict[str, Any]
+ClearanceProvider = Callable[[str], List[Cookie]]
+
+
+def browser_clearance(url: str) -> List[Cookie]:
+    """
+    Open a browser so the user can get past cloudflare, return the resulting cookies.
+    The browser packages are only imported here, a run with saved clearance never loads them.
+    """
+    import undetected_chromedriver as uc
+
+    opts = uc.ChromeOptions()
+    opts.headless = False
+    driver = uc.Chrome(options=opts)
+    try:
+        driver.get(url)
+        input("Press enter once you are past cloudflare...")
+        return driver.get_cookies()
+    finally:
+        driver.quit()
+
+
+def set_cookies(session: requests.Session | requests.AsyncSession, cookies: Sequence[Cookie]):
+    for cookie in cookies:
+        session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain') or '',
+                            path=cookie.get('path') or '/')
+
+
+def get_cookies(session: requests.Session | requests.AsyncSession) -> List[Cookie]:
+    """The cookies of a session, in the format selenium returns them"""
+    cookies = []
+    for cookie in session.cookies.jar:
+        cookies.append({'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path})
+        if cookie.expires is not None:
+            cookies[-1]['expiry'] = cookie.expires
+    return cookies
+
+
+def load_cookies(path: str) -> Dict[str, List[Cookie]]:
+    """Saved cookie jars by impersonation profile, without the cookies that have expired since"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        jars = json.load(f)
+    now = time.time()
+    return {profile: [c for c in cookies if c.get('expiry') is None or c['expiry'] > now]
+            for profile, cookies in jars.items()}
+
+
+def save_cookies(path: str, jars: Dict[str, List[Cookie]]):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(jars, f, indent=2)
+    os.replace(tmp, path)
+
+
+def make_session(profile: str = BROWSER_PROFILE, cookies: Sequence[Cookie] = (),
+                 pool_size: int = 10) -> requests.AsyncSession:
+    """
+    Create an async session that multiplexes requests over a pool of keep-alive connections
+    """
+    session = requests.AsyncSession(
+        impersonate=profile,
+        max_clients=pool_size,  # Size of the connection pool shared by all in-flight requests
+        http_version=CurlHttpVersion.V2TLS,  # HTTP/2 multiplexing over TLS
+        curl_options={CurlOpt.TCP_KEEPALIVE: 1},
+    )
+    set_cookies(session, cookies)
+    return session
+
+
+class PooledSession:
+    """A session of the pool, with the generation of the clearance cookies it carries"""
+
+    __slots__ = ('profile', 'session', 'healthy', 'generation')
+
+    def __init__(self, profile: str, session: requests.AsyncSession, generation: int = 0):
+        self.profile = profile
+        self.session = session
+        self.healthy = True
+        self.generation = generation
+
+
+class SessionPool:
+    """
+    Sessions with their own connections and cookie jar, handed out round robin. They all impersonate the
+    browser that gets the clearance, cookies solved with one fingerprint are challenged again with another.
+
+    A session that runs into a challenge is taken out of rotation while the healthy ones keep crawling.
+    Clearance is refreshed through a single path: the first challenged session calls the clearance provider
+    (a browser by default, anything returning cookies in tests), the others wait for that and pick up its
+    cookies. The cookie jar is saved to cookie_file under the profile, so a restart can skip the browser
+    while clearance lasts.
+    """
+
+    def __init__(self, cookie_file: str, profile: str = BROWSER_PROFILE, sessions: int = 3, pool_size: int = 10,
+                 clearance: ClearanceProvider = browser_clearance):
+        self.cookie_file = cookie_file
+        self.profile = profile
+        self.clearance = clearance
+        self.jars = load_cookies(cookie_file)
+        self.clearance_cookies: List[Cookie] = []
+        self.generation = 0
+        per_session = max(1, pool_size // sessions)
+        self.sessions = [PooledSession(profile, make_session(profile, self.jars.get(profile, ()), per_session))
+                         for _ in range(sessions)]
+        self.next_index = 0
+        self.refresh_lock = asyncio.Lock()
+        self.recovered = asyncio.Event()
+        self.recovered.set()
+        self.refreshes = 0
+
+    @property
+    def has_clearance(self) -> bool:
+        return bool(self.jars.get(self.profile))
+
+    async def start(self, url: str = START_URL):
+        """Get clearance up front, unless saved cookies are available"""
+        if not self.has_clearance:
+            await self.refresh(url)
+
+    async def acquire(self) -> PooledSession:
+        """The next healthy session, waits while every session is waiting for clearance"""
+        while True:
+            for _ in range(len(self.sessions)):
+                pooled = self.sessions[self.next_index]
+                self.next_index = (self.next_index + 1) % len(self.sessions)
+                if pooled.healthy:
+                    return pooled
+            self.recovered.clear()
+            await self.recovered.wait()
+
+    async def challenged(self, pooled: PooledSession, url: str, generation: int):
+        """
+        Take a session out of rotation until it has fresh clearance.
+        generation is pooled.generation from when the challenged request was sent.
+        """
+        pooled.healthy = False
+        if generation < self.generation:
+            # Its request was sent before the last refresh, the cookies are newer already
+            self._restore(pooled)
+            return
+        await self.refresh(url)
+
+    async def refresh(self, url: str = START_URL):
+        """Get new clearance once for every session that has been challenged, then put them back in rotation"""
+        generation = self.generation
+        async with self.refresh_lock:
+            if self.generation != generation:
+                # Refreshed while this caller was waiting for the lock
+                return
+            try:
+                # The browser blocks on input(), keep it off the event loop
+                self.clearance_cookies = await asyncio.to_thread(self.clearance, url)
+                self.generation += 1
+                self.refreshes += 1
+            finally:
+                # On failure the sessions go back with their old cookies and the next challenge tries again
+                for pooled in self.sessions:
+                    if not pooled.healthy or pooled.generation < self.generation:
+                        self._restore(pooled)
+                self.recovered.set()
+            self.save()
+
+    def _restore(self, pooled: PooledSession):
+        set_cookies(pooled.session, self.clearance_cookies)
+        pooled.generation = self.generation
+        pooled.healthy = True
+        self.recovered.set()
+
+    def save(self):
+        # Including the cookies the site set since the clearance
+        self.jars[self.profile] = get_cookies(self.sessions[0].session)
+        save_cookies(self.cookie_file, self.jars)
+
+    async def close(self):
+        self.save()
+        for pooled in self.sessions:
+            await pooled.session.close()
+
+
+class ThreadSessions:
+    """
+    Sequential sessions for the sequential and thread pool backends. curl_cffi sessions are not thread safe,
+    so every thread gets its own, all with the same clearance cookies.
+
+    The counterpart of SessionPool.refresh: the first thread that runs into a challenge gets new clearance,
+    threads challenged by a request sent before that just pick up the new cookies. The others keep fetching
+    with their cookies while the browser is open.
+    """
+
+    def __init__(self, cookie_file: str, profile: str = BROWSER_PROFILE,
+                 clearance: ClearanceProvider = browser_clearance):
+        self.cookie_file = cookie_file
+        self.profile = profile
+        self.clearance = clearance
+        self.cookies: List[Cookie] = load_cookies(cookie_file).get(profile) or []
+        self.generation = 0
+        self.lock = threading.Lock()
+        # Challenged threads wait on it while one of them gets new clearance
+        self.refreshed = threading.Condition(self.lock)
+        self.refreshing = False
+        self.local = threading.local()
+        self.sessions: List[requests.Session] = []
+
+    def start(self, url: str = START_URL):
+        """Get clearance up front, unless saved cookies are available"""
+        if not self.cookies:
+            self.refresh(url, self.generation)
+
+    def session(self) -> Tuple[requests.Session, int]:
+        """The session of the calling thread with the latest clearance, and the generation of its cookies"""
+        local = self.local
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session(impersonate=self.profile)
+            local.generation = -1
+            with self.lock:
+                self.sessions.append(session)
+        if local.generation < self.generation:
+            local.generation = self.generation
+            set_cookies(session, self.cookies)
+        return session, local.generation
+
+    def refresh(self, url: str, generation: int):
+        """Get new clearance, unless another thread did since the challenged request with `generation` was sent"""
+        with self.refreshed:
+            while self.refreshing:
+                self.refreshed.wait()
+            if generation != self.generation:
+                return
+            self.refreshing = True
+        try:
+            # Without the lock, the browser can take minutes
+            cookies = self.clearance(url)
+        except BaseException:
+            with self.refreshed:
+                self.refreshing = False
+                self.refreshed.notify_all()
+            raise
+        with self.refreshed:
+            self.cookies = cookies
+            self.generation += 1
+            self.refreshing = False
+            self.refreshed.notify_all()
+            jars = load_cookies(self.cookie_file)
+            jars[self.profile] = self.cookies
+            save_cookies(self.cookie_file, jars)
+
+    def close(self):
+        with self.lock:
+            if self.sessions:
+                # Including the cookies the site set since the clearance
+                jars = load_cookies(self.cookie_file)
+                jars[self.profile] = get_cookies(self.sessions[0])
+                save_cookies(self.cookie_file, jars)
+            for session in self.sessions:
+                session.close()
+            self.sessions = []
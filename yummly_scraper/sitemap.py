@@ -0,0 +1,58 @@
+import gzip
+import urllib.parse
+import xml.etree.ElementTree as ET
+from typing import IO, Iterator
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def is_sitemap_file(name: str) -> bool:
+    """
+    Sitemaps can be stored as plain XML or gzipped
+    """
+    return name.endswith('.xml') or name.endswith('.xml.gz')
+
+
+def open_sitemap(path: str) -> IO[bytes]:
+    """
+    Open a sitemap for binary reading, transparently decompressing gzipped files
+    """
+    f = open(path, 'rb')
+    if f.read(2) == GZIP_MAGIC:
+        f.close()
+        return gzip.open(path, 'rb')
+    f.seek(0)
+    return f
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalize a recipe URL so sitemap entries and share urls compare equal:
+    lower case scheme and host (https for yummly.com), no trailing slash and no fragment
+    """
+    parts = urllib.parse.urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = parts.netloc.lower()
+    if scheme == 'http' and (host == 'yummly.com' or host.endswith('.yummly.com')):
+        scheme = 'https'
+    path = parts.path.rstrip('/') or '/'
+    return urllib.parse.urlunsplit((scheme, host, path, parts.query, ''))
+
+
+def iter_sitemap_urls(path: str, normalize: bool = True) -> Iterator[str]:
+    """
+    Stream the <loc> of every <url> in a sitemap, one at a time and in constant memory
+    """
+    with open_sitemap(path) as f:
+        context = ET.iterparse(f, events=('start', 'end'))
+        _, root = next(context)
+        for event, elem in context:
+            # Tags are namespaced, e.g. {http://www.sitemaps.org/schemas/sitemap/0.9}url
+            if event != 'end' or elem.tag.rpartition('}')[2] != 'url':
+                continue
+            for child in elem:
+                if child.tag.rpartition('}')[2] == 'loc' and child.text:
+                    yield normalize_url(child.text) if normalize else child.text.strip()
+                    break
+            # Drop everything parsed so far
+            root.clear()
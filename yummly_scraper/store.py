@@ -0,0 +1,241 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIONS = ('none', 'gzip', 'zstd')
+EXTENSIONS = {'none': '.jsonl', 'gzip': '.jsonl.gz', 'zstd': '.jsonl.zst'}
+
+
+def stable_name(key: str) -> str:
+    """
+    File name for a recipe key that is the same in every run, unlike the salted hash()
+    """
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class RecipeStore:
+    """
+    Where scraped recipes end up, keyed by recipe id. Saving a key again replaces the previous record.
+    """
+
+    def put(self, key: str, recipe_data: Dict[str, Any]):
+        raise NotImplementedError
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def flush(self, fsync: bool = False):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class FileStore(RecipeStore):
+    """
+    One pretty-printed JSON file per recipe in recipes/, named by a stable digest of the recipe id
+    """
+
+    def __init__(self, output_dir: str):
+        self.directory = os.path.join(output_dir, 'recipes')
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{stable_name(key)}.json")
+
+    def put(self, key: str, recipe_data: Dict[str, Any]):
+        with open(self.path(key), 'w', encoding='utf-8') as f:
+            json.dump(recipe_data, f, ensure_ascii=False, indent=2)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.path(key)):
+            return None
+        with open(self.path(key), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+                    yield json.load(f)
+
+
+class SegmentStore(RecipeStore):
+    """
+    Recipes as compact JSON lines appended to rolling segment files in segments/.
+
+    Lines are grouped into blocks of about block_size bytes, each block is compressed on its own
+    (a gzip member or a zstd frame), so a single recipe can be read back by decompressing one block.
+    index.sqlite maps every recipe id to (segment, block offset, block length, line in block).
+    Re-crawled recipes are appended again and the index points at the newest copy.
+
+    Written blocks are only indexed by flush(), after the segment files are fsynced if it is asked to,
+    so the index never points at a block that did not make it to disk. Until then get() finds them in memory.
+    """
+
+    def __init__(self, output_dir: str, compression: str = 'gzip', block_size: int = 1 << 20,
+                 segment_size: int = 1 << 30, prefix: str = ''):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression!r}, choose from {', '.join(COMPRESSIONS)}")
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError("zstd compression needs the zstandard package (pip install zstandard)")
+        self.directory = os.path.join(output_dir, 'segments')
+        os.makedirs(self.directory, exist_ok=True)
+        self.compression = compression
+        self.block_size = block_size
+        self.segment_size = segment_size
+        self.prefix = prefix
+
+        self.index = sqlite3.connect(os.path.join(self.directory, 'index.sqlite'), check_same_thread=False,
+                                     timeout=60)
+        self.index.execute('PRAGMA journal_mode=WAL')
+        self.index.execute('PRAGMA synchronous=NORMAL')
+        self.index.execute('CREATE TABLE IF NOT EXISTS records ('
+                           'key TEXT PRIMARY KEY, segment TEXT, offset INTEGER, length INTEGER, line INTEGER)')
+
+        self.block: List[bytes] = []
+        self.block_bytes = 0
+        # Line in the block of every key in it
+        self.block_keys: Dict[str, int] = {}
+        # Index rows of the blocks written since the last flush(), by key
+        self.unindexed: Dict[str, Tuple[str, int, int, int]] = {}
+        self.segment_name = None
+        self.file = None
+        # Full segments, kept open until the next flush() can fsync them
+        self.full_files: List[Any] = []
+
+    def _next_segment_name(self) -> str:
+        pattern = re.compile(re.escape(f'segment-{self.prefix}') + r'(\d+)\.')
+        numbers = [int(m.group(1)) for m in map(pattern.match, os.listdir(self.directory)) if m]
+        return f'segment-{self.prefix}{max(numbers, default=-1) + 1:06d}{EXTENSIONS[self.compression]}'
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == 'gzip':
+            return gzip.compress(data, compresslevel=6)
+        if self.compression == 'zstd':
+            return zstandard.ZstdCompressor(level=3).compress(data)
+        return data
+
+    def _decompress(self, data: bytes) -> bytes:
+        if self.compression == 'gzip':
+            return gzip.decompress(data)
+        if self.compression == 'zstd':
+            return zstandard.ZstdDecompressor().decompress(data)
+        return data
+
+    def put(self, key: str, recipe_data: Dict[str, Any]):
+        line = json.dumps(recipe_data, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+        self.put_line(key, line)
+
+    def put_line(self, key: str, line: bytes):
+        """Append an already serialized record, line has to end with a newline"""
+        self.block_keys[key] = len(self.block)
+        self.block.append(line)
+        self.block_bytes += len(line)
+        if self.block_bytes >= self.block_size:
+            self._write_block()
+
+    def _write_block(self):
+        if not self.block:
+            return
+        if self.file is None:
+            self.segment_name = self._next_segment_name()
+            self.file = open(os.path.join(self.directory, self.segment_name), 'ab')
+        data = self._compress(b''.join(self.block))
+        offset = self.file.tell()
+        self.file.write(data)
+        for key, line in self.block_keys.items():
+            self.unindexed[key] = (self.segment_name, offset, len(data), line)
+        self.block, self.block_keys, self.block_bytes = [], {}, 0
+        if self.file.tell() >= self.segment_size:
+            self.full_files.append(self.file)
+            self.file = None
+
+    def _read_block(self, segment: str, offset: int, length: int) -> List[bytes]:
+        if self.unindexed:
+            # Blocks that are not indexed yet can still be in a file's buffer
+            for file in self._open_files():
+                file.flush()
+        with open(os.path.join(self.directory, segment), 'rb') as f:
+            f.seek(offset)
+            return self._decompress(f.read(length)).splitlines()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        # Newest copy first: the current block, the blocks that are not indexed yet, the index
+        line = self.block_keys.get(key)
+        if line is not None:
+            return json.loads(self.block[line])
+        row = self.unindexed.get(key)
+        if row is None:
+            row = self.index.execute('SELECT segment, offset, length, line FROM records WHERE key = ?',
+                                     (key,)).fetchone()
+        if row is None:
+            return None
+        segment, offset, length, line = row
+        return json.loads(self._read_block(segment, offset, length)[line])
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Every stored recipe once (its newest copy), reading each block a single time"""
+        self.flush()
+        rows = self.index.execute('SELECT segment, offset, length, line FROM records ORDER BY segment, offset, line')
+        current, lines = None, []
+        for segment, offset, length, line in rows:
+            if (segment, offset) != current:
+                current, lines = (segment, offset), self._read_block(segment, offset, length)
+            yield json.loads(lines[line])
+
+    def __len__(self) -> int:
+        return (self.index.execute('SELECT COUNT(*) FROM records').fetchone()[0] + len(self.unindexed)
+                + len(self.block_keys))
+
+    def _open_files(self) -> List[Any]:
+        return self.full_files + ([self.file] if self.file is not None else [])
+
+    def flush(self, fsync: bool = False):
+        """Write the current block and index everything written, after an fsync of the segments if asked to"""
+        self._write_block()
+        for file in self._open_files():
+            file.flush()
+            if fsync:
+                os.fsync(file.fileno())
+        for file in self.full_files:
+            file.close()
+        self.full_files = []
+        if self.unindexed:
+            with self.index:
+                self.index.executemany('INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)',
+                                       ((key, *row) for key, row in self.unindexed.items()))
+            self.unindexed = {}
+
+    def close(self):
+        self.flush(fsync=True)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.index.close()
+
+
+STORES = ('segments', 'files')
+
+
+def open_store(storage: str, output_dir: str, compression: str = 'gzip') -> RecipeStore:
+    """
+    Create the recipe store: 'segments' (packed, optionally compressed) or 'files' (one JSON file per recipe)
+    """
+    if storage == 'segments':
+        return SegmentStore(output_dir, compression)
+    if storage == 'files':
+        return FileStore(output_dir)
+    raise ValueError(f"Unknown storage {storage!r}, choose from {', '.join(STORES)}")
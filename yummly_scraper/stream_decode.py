@@ -0,0 +1,222 @@
+"""
+Streaming decode of the percent-encoded window.__INITIAL_STATE__ payload.
+
+The payload is read in chunks from a memoryview over the response body, percent-decoded one chunk at a time and
+fed to a scanner of the top level JSON object that only materializes the values of the keys it is asked for.
+The other values are skipped without being decoded into Python objects, so neither the whole decoded payload
+nor the whole state tree is ever held in memory.
+"""
+import json
+import re
+import urllib.parse
+from itertools import accumulate
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+CHUNK_SIZE = 1 << 14
+
+# A complete JSON string, the rest of one from inside it, and the tokens of the top level object.
+# A lone quote is a string that continues in the next chunk.
+_STRING_RE = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"')
+_STRING_REST_RE = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*"')
+_TOKEN_RE = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|"|[{}\[\],:]')
+_NOT_BRACKETS = bytes(b for b in range(256) if b not in b'{}[]')
+_STEP = [0] * 256
+for _b in b'{[':
+    _STEP[_b] = 1
+for _b in b'}]':
+    _STEP[_b] = -1
+
+_QUOTE, _COMMA, _COLON = ord('"'), ord(','), ord(':')
+_OPEN, _CLOSE = b'{[', b'}]'
+
+
+def iter_percent_decoded(view: memoryview, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Percent-decode a memoryview chunk by chunk, never splitting an escape between two chunks
+    """
+    # Room for a whole escape
+    chunk_size = max(chunk_size, 3)
+    position = 0
+    while position < len(view):
+        end = min(position + chunk_size, len(view))
+        if end < len(view):
+            # Move the end in front of an escape the chunk would cut in two
+            if view[end - 1] == ord('%'):
+                end -= 1
+            elif view[end - 2] == ord('%'):
+                end -= 2
+        yield urllib.parse.unquote_to_bytes(view[position:end].tobytes())
+        position = end
+
+
+class TopLevelScanner:
+    """
+    Incremental parser of a JSON object that keeps only the values of `keys`.
+
+    Chunks of the document go into feed(), result() returns the kept values once the object is complete.
+    Keys and scalar values are tokenized one by one, but nested values are mostly skipped in bulk:
+    as long as a chunk can't close the value, its strings are cut out and its brackets counted by the regex
+    and bytes machinery, only the chunk where a top level value ends is tokenized. Kept values are collected
+    as bytes and loaded with json.loads once they are complete. Raises ValueError for malformed documents.
+    """
+
+    def __init__(self, keys: Iterable[str]):
+        self.keys = set(keys)
+        self.values: Dict[str, Any] = {}
+        # 'object' before the opening brace, then 'key', 'colon', 'value' (a value starts at value_start),
+        # 'string' (a string value was read, it ends at the next comma), 'next' (comma or closing brace), 'done'
+        self.expect = 'object'
+        self.key: Optional[str] = None
+        self.value_start = 0
+        # Nesting depth, the top level object is 1
+        self.depth = 0
+        self.in_string = False
+        self.capture: Optional[List[bytes]] = None
+        self.held = b''
+
+    def feed(self, chunk: bytes):
+        data = self.held + chunk
+        # An escape can't be told apart from an escaped backslash before the next byte, keep backslashes back
+        cut = len(data.rstrip(b'\\'))
+        self.held = data[cut:]
+        data = data[:cut]
+        position = 0
+        while position is not None and position < len(data):
+            if self.depth > 1:
+                position = self._skip_nested(data, position)
+            else:
+                position = self._scan_top(data, position)
+
+    def result(self) -> Dict[str, Any]:
+        if self.expect != 'done' or self.held.strip():
+            raise ValueError(f"Truncated JSON, expecting {self.expect}")
+        return self.values
+
+    def _collect(self, data: bytes, start: int, end: int):
+        if self.capture is not None:
+            self.capture.append(data[start:end])
+
+    def _keep(self, raw: bytes):
+        if self.key in self.keys:
+            self.values[self.key] = json.loads(raw.decode('utf-8', 'replace'))
+
+    def _skip_nested(self, data: bytes, position: int) -> Optional[int]:
+        """Consume a nested value from position, returns where it ended or None if it continues after data"""
+        start = position
+        if self.in_string:
+            match = _STRING_REST_RE.match(data, position)
+            if match is None:
+                self._collect(data, start, len(data))
+                return None
+            position = match.end()
+            self.in_string = False
+
+        # Strings can hold brackets, cut them out before counting
+        outside = _STRING_RE.sub(b'', data[position:])
+        quote = outside.find(b'"')
+        if quote != -1:
+            outside = outside[:quote]
+        brackets = outside.translate(None, _NOT_BRACKETS)
+        depths = list(accumulate(map(_STEP.__getitem__, brackets), initial=self.depth))
+        if min(depths) > 1:
+            # The value goes on in the next chunk
+            self.depth = depths[-1]
+            self.in_string = quote != -1
+            self._collect(data, start, len(data))
+            return None
+
+        for match in _TOKEN_RE.finditer(data, position):
+            first = data[match.start()]
+            if first in _OPEN:
+                self.depth += 1
+            elif first in _CLOSE:
+                self.depth -= 1
+                if self.depth == 1:
+                    self._collect(data, start, match.end())
+                    if self.capture is not None:
+                        self._keep(b''.join(self.capture))
+                        self.capture = None
+                    self.expect = 'next'
+                    return match.end()
+        raise ValueError("Unbalanced brackets")
+
+    def _scan_top(self, data: bytes, position: int) -> Optional[int]:
+        """Tokenize the top level object from position, until a nested value starts or data runs out"""
+        for match in _TOKEN_RE.finditer(data, position):
+            first = data[match.start()]
+            if first == _QUOTE and match.end() - match.start() == 1:
+                # A string that is cut off, read it again with the next chunk
+                break
+            if self.expect == 'object':
+                if first != ord('{'):
+                    raise ValueError("The state is not a JSON object")
+                self.depth = 1
+                self.expect = 'key'
+            elif self.expect == 'key':
+                if first == _QUOTE:
+                    self.key = json.loads(match.group().decode('utf-8', 'replace'))
+                    self.expect = 'colon'
+                elif first == ord('}'):
+                    self._close()
+                else:
+                    raise ValueError(f"Expected a key at {match.start()}")
+            elif self.expect == 'colon':
+                if first != _COLON:
+                    raise ValueError(f"Expected a colon at {match.start()}")
+                self.value_start = match.end()
+                self.expect = 'value'
+            elif self.expect == 'value':
+                if first in _OPEN:
+                    self.depth = 2
+                    self.capture = [] if self.key in self.keys else None
+                    self._collect(data, match.start(), match.end())
+                    return match.end()
+                if first == _QUOTE:
+                    self.expect = 'string'
+                elif first in (_COMMA, ord('}')):
+                    # A number, true, false or null
+                    self._keep(data[self.value_start:match.start()])
+                    self._next(first)
+                else:
+                    raise ValueError(f"Unexpected {match.group()!r} at {match.start()}")
+            elif self.expect == 'string':
+                if first not in (_COMMA, ord('}')):
+                    raise ValueError(f"Expected a comma at {match.start()}")
+                self._keep(data[self.value_start:match.start()])
+                self._next(first)
+            elif self.expect == 'next':
+                if first not in (_COMMA, ord('}')):
+                    raise ValueError(f"Expected a comma at {match.start()}")
+                self._next(first)
+            else:
+                raise ValueError(f"Data after the end of the object at {match.start()}")
+        else:
+            match = None
+        # Whatever is left of the current element is read again with the next chunk
+        if self.expect in ('value', 'string'):
+            self.held = data[self.value_start:] + self.held
+            self.value_start = 0
+            self.expect = 'value'
+        elif match is not None:
+            self.held = data[match.start():] + self.held
+        return None
+
+    def _next(self, token: int):
+        if token == _COMMA:
+            self.expect = 'key'
+        else:
+            self._close()
+
+    def _close(self):
+        self.depth = 0
+        self.expect = 'done'
+
+
+def decode_state(payload: memoryview, keys: Iterable[str], chunk_size: int = CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    The values of `keys` in the percent-encoded JSON object in payload, the keys that are missing are left out
+    """
+    scanner = TopLevelScanner(keys)
+    for chunk in iter_percent_decoded(payload, chunk_size):
+        scanner.feed(chunk)
+    return scanner.result()
@@ -0,0 +1,226 @@
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from typing import Optional
+
+# Status codes with which the origin (or cloudflare in front of it) tells us to slow down
+PUSHBACK_STATUSES = {429, 503}
+
+
+def is_pushback(status: Optional[int], challenged: bool = False) -> bool:
+    return challenged or status in PUSHBACK_STATUSES
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds to wait according to a Retry-After header, which is either a number of seconds or an HTTP date
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(when.timestamp() - time.time(), 0.0)
+
+
+class LatencyTracker:
+    """
+    Smoothed response latency, compared against a baseline of the best smoothed latency seen recently.
+    Latency well above that baseline means requests are queueing up at the origin.
+    The baseline follows lower latency at once and drifts up by `drift` of the difference per sample,
+    so a burst of unusually fast responses (e.g. the 304s of a refresh) is forgotten after a few dozen requests
+    instead of making normal latency look like congestion for the rest of the run.
+    """
+
+    def __init__(self, alpha: float = 0.2, tolerance: float = 3.0, drift: float = 0.01):
+        self.alpha = alpha
+        self.tolerance = tolerance
+        self.drift = drift
+        self.smoothed = None
+        self.baseline = None
+
+    def observe(self, latency: float) -> bool:
+        """Add a sample, returns True if the origin looks congested"""
+        if self.smoothed is None:
+            self.smoothed = latency
+        else:
+            self.smoothed += self.alpha * (latency - self.smoothed)
+        if self.baseline is None or self.smoothed < self.baseline:
+            self.baseline = self.smoothed
+        else:
+            self.baseline += self.drift * (self.smoothed - self.baseline)
+        return self.smoothed > self.baseline * self.tolerance
+
+
+class AIMDLimit:
+    """
+    Additive-increase/multiplicative-decrease limit on the requests in flight.
+
+    Every healthy response raises the limit by increase / limit, i.e. by `increase` per round of requests.
+    A 429, a 503, a cloudflare challenge or congested latency cuts it by `decrease`, at most once per
+    `cooldown` seconds so one burst of errors counts as a single signal. Retry-After pauses all requests.
+    AdaptiveLimiter enforces it on an event loop, ThreadLimiter between threads.
+    """
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 64, increase: float = 1.0,
+                 decrease: float = 0.5, cooldown: float = 5.0, pushback_pause: float = 5.0):
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.pushback_pause = pushback_pause
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.latency = LatencyTracker()
+
+    def record(self, status: Optional[int], latency: float, retry_after: Optional[float] = None,
+               challenged: bool = False):
+        """Feed the outcome of a request back into the limit"""
+        now = time.monotonic()
+        congested = self.latency.observe(latency)
+        if is_pushback(status, challenged):
+            self.paused_until = max(self.paused_until, now + (retry_after or self.pushback_pause))
+        elif retry_after:
+            self.paused_until = max(self.paused_until, now + retry_after)
+
+        if is_pushback(status, challenged) or congested:
+            if now - self.last_decrease >= self.cooldown:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+                self.last_decrease = now
+        elif status is not None and status < 500:
+            self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+
+
+class AdaptiveLimiter(AIMDLimit):
+    """
+    The AIMD limit for the event loop.
+
+        async with limiter:
+            response = await session.get(url)
+        limiter.record(response.status_code, latency, retry_after)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.condition:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause > 0:
+                    try:
+                        await asyncio.wait_for(self.condition.wait(), pause)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                await self.condition.wait()
+
+    async def release(self):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+
+class ThreadLimiter(AIMDLimit):
+    """
+    The AIMD limit for the thread pool backend, with at least as many threads as the maximum.
+
+        with limiter:
+            response = session.get(url)
+        limiter.record(response.status_code, latency, retry_after)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause > 0:
+                    self.condition.wait(pause)
+                    continue
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                self.condition.wait()
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+    def record(self, status: Optional[int], latency: float, retry_after: Optional[float] = None,
+               challenged: bool = False):
+        with self.condition:
+            super().record(status, latency, retry_after, challenged)
+            # A higher limit lets waiting threads in
+            self.condition.notify_all()
+
+
+class AdaptiveDelay:
+    """
+    The same control loop for the sequential scraper, which adjusts the pause between requests instead:
+    healthy responses shorten it by `step` seconds, pushback doubles it and Retry-After is honored.
+    """
+
+    def __init__(self, initial: float = 0.35, minimum: float = 0.05, maximum: float = 60.0, step: float = 0.02,
+                 increase: float = 2.0, jitter: float = 0.3):
+        self.delay = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.step = step
+        self.increase = increase
+        self.jitter = jitter
+        self.not_before = 0.0
+        self.latency = LatencyTracker()
+
+    def wait(self):
+        """Sleep until the next request may be sent"""
+        pause = max(self.not_before - time.monotonic(), 0.0)
+        time.sleep(pause + self.delay * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def __enter__(self):
+        self.wait()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+    def record(self, status: Optional[int], latency: float, retry_after: Optional[float] = None,
+               challenged: bool = False):
+        congested = self.latency.observe(latency)
+        if retry_after:
+            self.not_before = max(self.not_before, time.monotonic() + retry_after)
+        if is_pushback(status, challenged) or congested:
+            self.delay = min(self.maximum, self.delay * self.increase)
+        elif status is not None and status < 500:
+            self.delay = max(self.minimum, self.delay - self.step)
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+from yummly_scraper.changes import CHANGED, NEW, VOLATILE, ChangeTracker
+from yummly_scraper.metrics import Metrics
+from yummly_scraper.search_index import SearchIndex
+from yummly_scraper.store import RecipeStore
+
+FSYNC_POLICIES = ('batch', 'checkpoint', 'never')
+
+
+class RecipeWriter:
+    """
+    Write-behind stage between the crawl and the recipe store.
+
+    Recipes are queued and written by a single thread, which serializes them compactly and hands them
+    to the store in batches of up to batch_size, so the crawl never waits on json.dumps, compression or disk.
+    At most max_pending recipes can be queued, put() waits for room beyond that.
+
+    Other work that has to happen after the recipes queued before it (journaling their keys, checkpoints)
+    is passed to defer() and runs on the same thread in queue order.
+
+    fsync is the policy for making the store durable: 'batch' after every batch, 'checkpoint' whenever
+    checkpoint() is called (the journal calls it before every flush), 'never' leaves it to the OS.
+    A failed write or deferred call stops the writer, the error is raised from the next put(), defer() or close().
+
+    With a search index, every written recipe is added to it as well and the index is flushed at checkpoints,
+    before the journal marks the recipes as scraped, so a resumed crawl finds it complete.
+
+    With a change tracker (in a refresh) a recipe is only written again if its content changed.
+    Changes of its yums only go to the delta log, and to the columns of the search index.
+    """
+
+    def __init__(self, store: RecipeStore, batch_size: int = 256, max_pending: int = 4096,
+                 fsync: str = 'checkpoint', metrics: Optional[Metrics] = None,
+                 search_index: Optional[SearchIndex] = None, changes: Optional[ChangeTracker] = None):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync!r}, choose from {', '.join(FSYNC_POLICIES)}")
+        self.store = store
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.metrics = metrics
+        self.search_index = search_index
+        self.changes = changes
+        # Only recipes count against max_pending, deferred calls are small and must never block the crawl
+        self.room = threading.Semaphore(max_pending)
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        # Recipes are queued from any number of threads, only the writer thread counts them written
+        self.count_lock = threading.Lock()
+        self.queued = 0
+        self.written = 0
+        self.error: Optional[BaseException] = None
+        self.thread = threading.Thread(target=self._run, name='recipe-writer', daemon=True)
+        self.thread.start()
+
+    def _check(self):
+        if self.error is not None:
+            raise RuntimeError("The recipe writer stopped") from self.error
+
+    def put(self, key: str, recipe_data: Dict[str, Any]):
+        """Queue a recipe, waiting while max_pending recipes are queued already"""
+        self._check()
+        self.room.acquire()
+        with self.count_lock:
+            self.queued += 1
+        self.queue.put((key, recipe_data))
+
+    async def put_async(self, key: str, recipe_data: Dict[str, Any]):
+        """
+        put() for the event loop, only waits in a thread when the queue is full.
+        Recipes from one task keep their order, as long as it awaits each put.
+        """
+        self._check()
+        if not self.room.acquire(blocking=False):
+            await asyncio.to_thread(self.room.acquire)
+        with self.count_lock:
+            self.queued += 1
+        self.queue.put((key, recipe_data))
+
+    def defer(self, fn: Callable, *args) -> Future:
+        """Run fn(*args) on the writer thread once everything queued before it is written"""
+        self._check()
+        future: Future = Future()
+        self.queue.put((fn, args, future))
+        return future
+
+    @property
+    def pending(self) -> int:
+        return self.queued - self.written
+
+    def checkpoint(self):
+        """Flush the store, with an fsync unless the policy is 'never'. Called on the writer thread."""
+        self.store.flush(fsync=self.fsync != 'never')
+        if self.search_index is not None:
+            self.search_index.flush()
+
+    def _write(self, key: str, recipe_data: Dict[str, Any]):
+        if self.changes is not None:
+            change = self.changes.check(key, recipe_data)
+            if self.metrics is not None:
+                self.metrics.inc('recipe_changes_total', change=change)
+            if change not in (NEW, CHANGED):
+                if change == VOLATILE and self.search_index is not None:
+                    self.search_index.update_columns(key, recipe_data)
+                return
+        put_line = getattr(self.store, 'put_line', None)
+        if put_line is None:
+            self.store.put(key, recipe_data)
+        else:
+            put_line(key, json.dumps(recipe_data, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n')
+        if self.search_index is not None:
+            self.search_index.add(key, recipe_data)
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            start = time.perf_counter()
+            batch_recipes = 0
+            for item in batch:
+                if item is None:
+                    return
+                if len(item) == 3:
+                    fn, args, future = item
+                    if self.error is not None:
+                        future.set_exception(self.error)
+                        continue
+                    try:
+                        future.set_result(fn(*args))
+                    except BaseException as e:
+                        # Nobody may be waiting on the future of a fire and forget call,
+                        # stopping the writer raises it from the next put() or defer() in any case
+                        print(f"Error in the recipe writer: {e}")
+                        self.error = e
+                        future.set_exception(e)
+                    continue
+                try:
+                    if self.error is None:
+                        self._write(*item)
+                        batch_recipes += 1
+                except BaseException as e:
+                    print(f"Error writing recipe {item[0]}: {e}")
+                    self.error = e
+                finally:
+                    self.written += 1
+                    self.room.release()
+            if batch_recipes and self.error is None:
+                try:
+                    if self.fsync == 'batch':
+                        self.store.flush(fsync=True)
+                except BaseException as e:
+                    print(f"Error flushing recipes: {e}")
+                    self.error = e
+                if self.metrics is not None:
+                    self.metrics.observe('stage_seconds', time.perf_counter() - start, stage='write')
+                    self.metrics.inc('write_batches_total')
+
+    def close(self):
+        """Write everything queued and stop the thread"""
+        self.queue.put(None)
+        self.thread.join()
+        self._check()